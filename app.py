@@ -3,157 +3,292 @@ import streamlit as st
 import pandas as pd
 from crochet import setup, run_in_reactor
 from scrapy.crawler import CrawlerRunner
-from procore_spider import ProcoreSpider
+from scheduler import StateCrawlScheduler, install_project_reactor, project_settings
+from exports import ARTIFACT_FORMATS, COLUMNS, export_artifact, frame_digest
+from instrumentation import LATENCY_LABELS
+from checkpoint import resumable_states
+from database import ResultDatabase
+from phones import normalize_phone_column
+from collections import deque
 import threading
+import tempfile
 import time
-import io  # For handling Excel file in memory
 import os
 
-# Set the reactor before importing twisted
-os.environ['SCRAPY_SETTINGS_MODULE'] = 'settings'
+# The crawl core is shared with the headless CLI (crawl.py); the app only
+# adds crochet, which runs the reactor in a thread next to Streamlit's
+settings = project_settings()
+install_project_reactor(settings)
 setup()
+runner = CrawlerRunner(settings)
 
-# Initialize the crawler runner with proper settings
-runner = CrawlerRunner({
-    'TWISTED_REACTOR': 'twisted.internet.selectreactor.SelectReactor',
-    'CONCURRENT_REQUESTS': 20,
-    'DOWNLOAD_DELAY': 0,
-    'LOG_LEVEL': 'INFO',
-})
+# Rows shown in the live table while a crawl runs
+PREVIEW_ROWS = 200
+PREVIEW_COLUMNS = ["State", *COLUMNS]
 
-# Function to run the spider
+# Each state's crawl is journaled here so an interrupted crawl can be resumed
+CHECKPOINT_DIR = 'data/checkpoints'
+
+# Every crawl upserts its rows here; the query panel filters them in SQL
+DATABASE_PATH = 'data/procore.sqlite3'
+QUERY_PAGE_ROWS = 500
+
+# Download files are built once per result set and served from here
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'procore-exports')
+DOWNLOAD_FORMATS = {
+    "CSV": "csv",
+    "CSV (gzip)": "csv.gz",
+    "Excel": "xlsx",
+    "Parquet": "parquet",
+}
+
+# Function to run the spiders
 @run_in_reactor
-def crawl(state_code):
-    ProcoreSpider.state_code = state_code.lower()
-    return runner.crawl(ProcoreSpider)
+def crawl(scheduler, state_codes):
+    return scheduler.crawl(state_codes)
+
+def store_results(scheduler):
+    # Categorical DataFrame over the shared result store, already tagged
+    # with each row's state. Phone numbers are normalized in one pass over
+    # the column. The digest names its cached download files.
+    df = scheduler.results.to_pandas()
+    normalize_phone_column(df)
+    st.session_state.data = df
+    st.session_state.data_digest = frame_digest(df)
+
+@st.fragment(run_every=1.0)
+def live_progress():
+    # Reruns on its own every second and only redraws this block. Each run
+    # takes just the rows published since the last one, and the table never
+    # shows more than PREVIEW_ROWS of them.
+    render_started = time.perf_counter()
+    scheduler = st.session_state.scheduler
+    preview = st.session_state.preview
+    preview.extend(scheduler.feed.drain())
+    progress = scheduler.progress()
+    if st.session_state.stop_requested:
+        st.info("Stopping: finishing the requests already in flight...")
+
+    items, rate, pending, concurrency, latency = st.columns(5)
+    items.metric("Items scraped", progress['items'])
+    rate.metric("Items/s", f"{progress['items_per_sec']:.1f}")
+    pending.metric("Pending requests", progress['in_flight'] + progress['queued'])
+    concurrency.metric(
+        "In flight / target",
+        f"{progress['in_flight']} / {progress['concurrency_target']:.0f}",
+        help=f"Adaptive concurrency target; {progress['throttled']} throttled responses so far",
+    )
+    latency.metric("Page latency", f"{progress['latency']:.2f}s" if progress['latency'] is not None else "-")
+    if preview:
+        table = pd.DataFrame.from_records(list(preview), columns=PREVIEW_COLUMNS)
+        normalize_phone_column(table)
+        st.dataframe(table, hide_index=True)
+        st.caption(f"Latest {len(preview)} of {scheduler.feed.published} rows")
+    instrumentation_panel(scheduler)
+    st.caption(f"UI refresh took {(time.perf_counter() - render_started) * 1000:.0f} ms")
+
+    # Check if every state's spider has finished
+    if scheduler.finished:
+        st.session_state.scraping = False
+        if st.session_state.stop_requested:
+            st.session_state.notice = "Scraper stopped by user."
+        # After scraping ends, save data to session state
+        store_results(scheduler)
+        st.rerun()
+
+def instrumentation_panel(scheduler):
+    figures = scheduler.instrumentation()
+    with st.expander("Crawl instrumentation"):
+        callbacks = figures['callbacks']
+        if callbacks:
+            st.caption("Parse time per response")
+            st.dataframe(pd.DataFrame([
+                {
+                    "Callback": name,
+                    "Responses": int(f.get('count', 0)),
+                    "Mean ms": f['total'] / f['count'] * 1000 if f.get('count') else None,
+                    "p50 ms": f['p50'] * 1000 if 'p50' in f else None,
+                    "p99 ms": f['p99'] * 1000 if 'p99' in f else None,
+                }
+                for name, f in callbacks.items()
+            ]), hide_index=True)
+
+        stages = figures['phone_stages']
+        if stages:
+            pages = sum(stages.values())
+            dom_pages = pages - stages.get('script', 0)
+            phone_time = figures['phone_time']
+            st.caption("Phone extraction: stage that found the number, and mean time per page")
+            st.dataframe(pd.DataFrame([
+                {"Stage": stage, "Detail pages": int(stages.get(stage, 0))} for stage in ('script', 'css', 'xpath', 'none')
+            ]), hide_index=True)
+            st.text(
+                f"Script scan: {phone_time.get('script', 0) / pages * 1000:.2f} ms over {pages} pages; "
+                f"CSS/XPath walk: {phone_time.get('dom', 0) / dom_pages * 1000 if dom_pages else 0:.2f} ms over {dom_pages} pages"
+            )
+
+        latency = figures['latency']
+        if latency:
+            st.caption("Download latency histogram per request type")
+            st.dataframe(pd.DataFrame.from_dict(
+                {kind: {label: int(buckets.get(label, 0)) for label in LATENCY_LABELS} for kind, buckets in latency.items()},
+                orient='index',
+            ))
+
+        depth = figures['depth']
+        if any(depth.values()):
+            st.caption("Scheduler queue depth and downloads in flight over time (seconds)")
+            frames = [
+                pd.DataFrame(samples, columns=['Seconds', f'{code.upper()} queued', f'{code.upper()} in flight']).set_index('Seconds')
+                for code, samples in depth.items() if samples
+            ]
+            st.line_chart(pd.concat(frames, axis=1).sort_index())
+
+        if figures['profile']:
+            st.caption("Profile of the reactor thread")
+            st.code(figures['profile'])
+
+@st.cache_data(ttl=60)
+def filter_options(states):
+    # Tag and city lists only change when a crawl writes, so they are read
+    # once a minute rather than on every rerun
+    database = ResultDatabase(DATABASE_PATH)
+    try:
+        return database.states(), database.cities(states), database.tags('company_type'), database.tags('trade')
+    finally:
+        database.close()
+
+def query_panel():
+    # Filters run in SQLite against the indexed tables; only the count and
+    # one page of rows come back, however many businesses are stored
+    if not os.path.exists(DATABASE_PATH):
+        return
+    with st.expander("Query stored businesses"):
+        states, _, company_types, trades = filter_options(())
+        chosen_states = st.multiselect("States", states)
+        _, cities, _, _ = filter_options(tuple(chosen_states))
+        filters = {
+            'states': chosen_states,
+            'cities': st.multiselect("Cities", cities),
+            'company_types': st.multiselect("Company types", company_types),
+            'trades': st.multiselect("Trades and services", trades),
+            'name': st.text_input("Business name contains"),
+        }
+        page = st.number_input("Page", min_value=1, value=1)
+        query_started = time.perf_counter()
+        database = ResultDatabase(DATABASE_PATH)
+        try:
+            matches = database.count(**filters)
+            columns, rows = database.query(limit=QUERY_PAGE_ROWS, offset=(int(page) - 1) * QUERY_PAGE_ROWS, **filters)
+        finally:
+            database.close()
+        st.dataframe(pd.DataFrame.from_records(rows, columns=columns), hide_index=True)
+        st.caption(
+            f"{matches} matching businesses, page {int(page)} of {max(1, -(-matches // QUERY_PAGE_ROWS))}; "
+            f"query took {(time.perf_counter() - query_started) * 1000:.0f} ms"
+        )
 
 def main():
     st.title("Procore Business Data Scraper")
     st.write("Scrape business data from Procore's network.")
 
-    # Input for state code
-    state_code = st.text_input("Enter state code (e.g., ca, mi, ny):", "ca")
+    # Input for state codes
+    state_codes = st.text_input("Enter state codes separated by commas (e.g., ca, mi, ny):", "ca")
+    page_window = st.number_input("Listing pages to fetch in parallel:", min_value=1, max_value=32, value=8)
+    max_states = st.number_input("States to crawl at the same time:", min_value=1, max_value=50, value=4)
+    max_requests = st.number_input("Total concurrent requests:", min_value=1, max_value=256, value=64)
+    incremental = st.checkbox("Reuse businesses scraped by earlier runs", value=True)
+    index_ttl_days = st.number_input("Fetch detail pages again after (days):", min_value=0.0, value=7.0, disabled=not incremental)
+    profile = st.checkbox("Profile the crawl (cProfile)", value=False)
 
     if 'scraping' not in st.session_state:
         st.session_state.scraping = False
     if 'stop_requested' not in st.session_state:
         st.session_state.stop_requested = False
     if 'data' not in st.session_state:
-        st.session_state.data = []
+        st.session_state.data = None
+        st.session_state.data_digest = None
     if 'crawl_thread' not in st.session_state:
         st.session_state.crawl_thread = None
+    if 'scheduler' not in st.session_state:
+        st.session_state.scheduler = None
+    if 'preview' not in st.session_state:
+        st.session_state.preview = deque(maxlen=PREVIEW_ROWS)
+    if 'notice' not in st.session_state:
+        st.session_state.notice = None
 
     start_button = st.button("Start Scraping")
+    unfinished = resumable_states(CHECKPOINT_DIR)
+    resume_button = st.button(
+        "Resume Scraping",
+        disabled=not unfinished,
+        help=f"Unfinished: {', '.join(code.upper() for code in unfinished)}" if unfinished else "No unfinished crawl",
+    )
     stop_button = st.button("Stop Scraping")
 
-    if start_button and not st.session_state.scraping:
+    if (start_button or resume_button) and not st.session_state.scraping:
         st.session_state.scraping = True
         st.session_state.stop_requested = False
-        ProcoreSpider.stop_requested = False
-        ProcoreSpider.scraped_data = []
-        ProcoreSpider.state_code = state_code.lower()
-        ProcoreSpider.consecutive_empty_count = 0  # Reset the counter
+        st.session_state.data = None
+        st.session_state.preview.clear()
+        st.session_state.notice = None
+        st.session_state.scheduler = StateCrawlScheduler(
+            runner,
+            max_states=int(max_states),
+            max_requests=int(max_requests),
+            spider_kwargs={'page_window': int(page_window)},
+            settings={
+                'PROCORE_INDEX_PATH': 'data/business_index.sqlite3' if incremental else None,
+                'PROCORE_INDEX_TTL': index_ttl_days * 24 * 3600,
+                'PROCORE_EXPORT_DIR': 'data/exports',
+                'PROCORE_PROFILE': 'cprofile' if profile else None,
+                'PROCORE_CHECKPOINT_DIR': CHECKPOINT_DIR,
+                'PROCORE_DATABASE_PATH': DATABASE_PATH,
+                'PROCORE_RESUME': bool(resume_button),
+            },
+        )
 
-        # Run the spider
-        crawl(state_code)
+        # Run the spiders; a resume picks up every state left unfinished
+        crawl(st.session_state.scheduler, unfinished if resume_button else state_codes.split(','))
         st.session_state.crawl_thread = threading.current_thread()
 
-    if stop_button and st.session_state.scraping:
+    if stop_button and st.session_state.scraping and not st.session_state.stop_requested:
+        # Requests already in flight drain and keep their rows, so the
+        # results are stored by live_progress once every spider has closed
         st.session_state.stop_requested = True
-        ProcoreSpider.stop_requested = True
-        st.session_state.scraping = False
+        st.session_state.scheduler.stop()
         # Do not stop the reactor
 
     if st.session_state.scraping:
-        data_placeholder = st.empty()
-        progress_text = st.empty()
-        scraped_count = 0
-
-        while st.session_state.scraping:
-            # Make a copy of the data to prevent concurrent modification issues
-            data = ProcoreSpider.scraped_data.copy()
-            new_count = len(data)
-
-            if new_count > scraped_count:
-                scraped_count = new_count
-
-                # Ensure all items are dictionaries and have the same keys
-                all_keys = set()
-                valid_data = []
-                for item in data:
-                    if isinstance(item, dict):
-                        all_keys.update(item.keys())
-                        valid_data.append(item)
-
-                # Standardize dictionaries
-                for item in valid_data:
-                    for key in all_keys:
-                        item.setdefault(key, None)
-
-                if valid_data:
-                    df = pd.DataFrame.from_records(valid_data)
-                    data_placeholder.dataframe(df)
-                    progress_text.text(f"Scraped {scraped_count} items...")
-
-            time.sleep(1)  # Sleep for a short time before updating
-
-            # Check if the spider has stopped itself
-            if ProcoreSpider.stop_requested:
-                st.session_state.scraping = False
-                if st.session_state.stop_requested:
-                    st.warning("Scraper stopped by user.")
-                else:
-                    st.warning("Scraper stopped after encountering more than 8 consecutive empty rows.")
-                break
-
-        # After scraping ends, save data to session state
-        st.session_state.data = ProcoreSpider.scraped_data.copy()
+        live_progress()
+    elif st.session_state.notice:
+        st.warning(st.session_state.notice)
 
     # Display data and download button when scraping has stopped
-    if not st.session_state.scraping and st.session_state.data:
-        data = st.session_state.data
-        # Ensure all items have the same keys
-        all_keys = set()
-        valid_data = []
-        for item in data:
-            if isinstance(item, dict):
-                all_keys.update(item.keys())
-                valid_data.append(item)
-
-        # Standardize dictionaries
-        for item in valid_data:
-            for key in all_keys:
-                item.setdefault(key, None)
-
-        if valid_data:
-            df = pd.DataFrame.from_records(valid_data)
-            st.dataframe(df)
-            st.success(f"Scraping completed! Total items scraped: {len(df)}")
-
-            # Provide download buttons for CSV and Excel
-            csv = df.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="Download data as CSV",
-                data=csv,
-                file_name='procore_business_data.csv',
-                mime='text/csv',
-            )
-
-            # Generate Excel file in memory
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Sheet1')
-                writer.save()
-                processed_data = output.getvalue()
+    df = st.session_state.data
+    if not st.session_state.scraping and df is not None and len(df):
+        st.dataframe(df)
+        st.success(f"Scraping completed! Total items scraped: {len(df)}")
+        instrumentation_panel(st.session_state.scheduler)
 
+        # Only the chosen format is exported, and only the first time it is
+        # asked for with these results; reruns reopen the cached file
+        label = st.selectbox("Download format:", list(DOWNLOAD_FORMATS))
+        export_format = DOWNLOAD_FORMATS[label]
+        extension, mime = ARTIFACT_FORMATS[export_format]
+        with st.spinner(f"Preparing {label} file..."):
+            path = export_artifact(df, export_format, EXPORT_CACHE_DIR, st.session_state.data_digest)
+        with open(path, 'rb') as f:
             st.download_button(
-                label="Download data as Excel",
-                data=processed_data,
-                file_name='procore_business_data.xlsx',
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                label=f"Download data as {label}",
+                data=f,
+                file_name=f'procore_business_data.{extension}',
+                mime=mime,
             )
-    elif not st.session_state.scraping and not st.session_state.data:
+    elif not st.session_state.scraping:
         st.info('Click "Start Scraping" to begin.')
 
+    query_panel()
+
 if __name__ == '__main__':
     main()
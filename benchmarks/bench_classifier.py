@@ -0,0 +1,89 @@
+"""Compare classifier.BusinessClassifier with the old inline keyword loops.
+
+Extracts the text fragments of every business on the recorded listing
+pages the way ProcoreSpider.parse does, tags them with both
+implementations, fails on any difference, and reports the time per
+business.
+
+    python -m benchmarks.bench_classifier [--repeat N]
+"""
+import argparse
+import time
+
+from benchmarks.fixtures import load_responses
+from classifier import classifier_for_state
+
+
+def legacy_classify(clean_text):
+    # Verbatim copy of the loop that used to live in ProcoreSpider.parse
+    location = None
+    company_type = None
+    market_services = None
+    trades_services = None
+
+    # Look for patterns in the text to extract business information
+    for text in clean_text:
+        # Look for location patterns (state names, cities)
+        if any(loc in text for loc in ['California', 'CA', 'Los Angeles', 'San Francisco', 'San Diego', 'Sacramento', 'Oakland', 'Fresno', 'Long Beach', 'Bakersfield', 'Anaheim', 'Santa Ana', 'Riverside', 'Stockton', 'Irvine', 'Chula Vista', 'Fremont', 'San Bernardino', 'Modesto', 'Fontana', 'Oxnard', 'Moreno Valley', 'Huntington Beach', 'Glendale', 'Santa Clarita', 'Garden Grove', 'Oceanside', 'Rancho Cucamonga', 'Santa Rosa', 'Ontario', 'Lancaster', 'Elk Grove', 'Palmdale', 'Corona', 'Salinas', 'Pomona', 'Hayward', 'Escondido', 'Torrance', 'Sunnyvale', 'Orange', 'Fullerton', 'Pasadena', 'Thousand Oaks', 'Visalia', 'Simi Valley', 'Concord', 'Roseville', 'Santa Clara', 'Vallejo', 'Victorville', 'El Monte', 'Berkeley', 'Downey', 'Costa Mesa', 'Inglewood', 'Ventura', 'West Covina', 'Norwalk', 'Carlsbad', 'Fairfield', 'Richmond', 'Murrieta', 'Burbank', 'Antioch', 'Daly City', 'Santa Monica', 'Temecula', 'Clovis', 'Compton', 'Jurupa Valley', 'Vista', 'South Gate', 'Mission Viejo', 'Vacaville', 'Carson', 'Hesperia', 'Santa Barbara', 'Redding', 'Santa Cruz', 'Chico', 'Newport Beach', 'San Leandro', 'Hawthorne', 'Citrus Heights', 'Tracy', 'Alhambra', 'Livermore', 'Buena Park', 'Lakewood', 'Merced', 'Hemet', 'Chino', 'Menifee', 'Lake Forest', 'Napa', 'Redwood City', 'Bellflower', 'Indio', 'Baldwin Park', 'Chino Hills', 'Mountain View', 'Alameda', 'Upland', 'Folsom', 'San Ramon', 'Pleasanton', 'Union City', 'Lynwood', 'Apple Valley', 'Redlands', 'Turlock', 'Perris', 'Manteca', 'Milpitas', 'Lodi', 'Madera', 'Glendora', 'Pittsburg', 'Camarillo', 'Hanford', 'San Luis Obispo', 'Huntington Park', 'La Mesa', 'Arcadia', 'Fountain Valley', 'Diamond Bar', 'Santee', 'Porterville', 'Colton', 'Covina', 'Rohnert Park', 'Yorba Linda', 'Pacifica', 'Rancho Cordova', 'Montebello', 'Lompoc', 'Hollister', 'San Gabriel', 'Brea', 'La Habra', 'San Bruno', 'Beverly Hills', 'Coachella', 'Morgan Hill', 'Seaside', 'Calexico', 'San Dimas', 'Culver City', 'Los Banos', 'Martinez', 'San Mateo', 'Cypress', 'La Puente', 'Palm Desert', 'Novato', 'San Jacinto', 'La Verne', 'Goleta', 'Tulare', 'Petaluma']):
+            location = text
+        # Look for company type patterns
+        elif text in ['General Contractor', 'Specialty Contractor', 'Consultant', 'Supplier', 'Architect', 'Engineer', 'Owner Real Estate Developer']:
+            company_type = text
+        # Look for market services patterns
+        elif text in ['Commercial', 'Healthcare', 'Industrial and Energy', 'Infrastructure', 'Institutional', 'Residential']:
+            market_services = text
+        # Look for trades and services patterns
+        elif any(trade in text for trade in ['Concrete', 'Demolition', 'Design and Engineering', 'Project Management', 'HVAC', 'Structural Steel', 'Communications', 'Electrical', 'Plumbing', 'Roofing', 'Masonry', 'Landscaping', 'Earthwork', 'Fire Suppression', 'Electronic Security', 'Signage', 'Brick Tiling', 'Rough Carpentry', 'Heating Ventilating and Air Conditioning HVAC']):
+            trades_services = text
+    return location, company_type, market_services, trades_services
+
+
+def business_fragments(response):
+    fragments = []
+    for business in response.css("div.sc-eCstZk.MuiBox-root"):
+        for link in business.css('a[href*="/p/"]'):
+            all_text = link.xpath('..').css('::text').getall()
+            fragments.append([text.strip() for text in all_text if text.strip() and len(text.strip()) > 1])
+            break
+    return fragments
+
+
+def run(classify, businesses, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = [classify(fragments) for fragments in businesses]
+    return results, (time.perf_counter() - started) / (repeat * len(businesses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--state', default='ca')
+    args = parser.parse_args()
+
+    businesses = []
+    for response in load_responses('listing'):
+        businesses.extend(business_fragments(response))
+
+    started = time.perf_counter()
+    classifier = classifier_for_state(args.state)
+    build_time = time.perf_counter() - started
+
+    legacy, legacy_time = run(legacy_classify, businesses, args.repeat)
+    tagged, classifier_time = run(classifier.classify, businesses, args.repeat)
+
+    mismatches = [(f, a, b) for f, a, b in zip(businesses, legacy, tagged) if a != b]
+    for fragments, expected, got in mismatches[:10]:
+        print(f"MISMATCH {fragments!r}: inline={expected!r} classifier={got!r}")
+
+    print(f"businesses:      {len(businesses)} ({sum(map(len, businesses))} fragments)")
+    print(f"build:           {build_time * 1000:.2f} ms")
+    print(f"inline loops:    {legacy_time * 1e6:.1f} us/business")
+    print(f"classifier:      {classifier_time * 1e6:.1f} us/business")
+    print(f"speedup:         {legacy_time / classifier_time:.2f}x")
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} businesses tagged differently")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""Run ProcoreSpider against the local mock server and report throughput.
+
+Starts ``benchmarks.mock_server`` in a subprocess, crawls it through
+``StateCrawlScheduler`` the way the app does (HTTP cache, business index
+and exports off), and reports:
+- listing and detail pages/s and items/s;
+- p50/p99 parse time per callback;
+- retries, errors and throttled (429) responses;
+- the adaptive concurrency target it ended on and the highest it reached;
+- requests wasted finding the end of the results: listing pages downloaded
+  past the last page, and those cancelled before they were downloaded;
+- peak RSS of this process.
+
+Each run is saved as JSON, tagged with the git commit, so runs from
+different commits can be compared with ``--compare``.
+
+    python -m benchmarks.bench_crawl [--pages 60] [--latency 0.05] [--error-rate 0.01] [--capacity 16]
+        [--count N] [--past-end repeat]
+        [--states ca] [--max-requests 32] [--set CONCURRENT_REQUESTS_PER_DOMAIN=16]
+        [--output data/benchmarks/run.json] [--compare data/benchmarks/base.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.fixtures import ROOT_DIR
+
+RESULTS_DIR = os.path.join(ROOT_DIR, 'data', 'benchmarks')
+
+# Figures shown by --compare, and whether a larger value is better
+COMPARED = {
+    'pages_per_sec': True,
+    'items_per_sec': True,
+    'wall_time': False,
+    'parse_p50_ms': False,
+    'parse_p99_ms': False,
+    'parse_business_detail_p50_ms': False,
+    'parse_business_detail_p99_ms': False,
+    'peak_rss_mib': False,
+    'wasted_requests': False,
+}
+
+
+def start_server(args):
+    command = [
+        sys.executable, '-m', 'benchmarks.mock_server', '--port', '0',
+        '--pages', str(args.pages), '--latency', str(args.latency),
+        '--jitter', str(args.jitter), '--error-rate', str(args.error_rate), '--seed', str(args.seed),
+        '--retry-after', str(args.retry_after),
+    ]
+    if args.capacity:
+        command += ['--capacity', str(args.capacity)]
+    if args.count is not None:
+        command += ['--count', str(args.count)]
+    command += ['--past-end', args.past_end]
+    server = subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith('listening on '):
+        server.kill()
+        raise SystemExit(f"mock server failed to start: {line!r}")
+    return server, line.split()[-1]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True).strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD', '--'], cwd=ROOT_DIR) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        try:
+            overrides[name] = json.loads(value)
+        except ValueError:
+            overrides[name] = value
+    return overrides
+
+
+def crawl(base_url, args):
+    from scheduler import StateCrawlScheduler, install_project_reactor, project_settings
+
+    settings = project_settings()
+    install_project_reactor(settings)
+    from crochet import run_in_reactor, setup
+    from scrapy.crawler import CrawlerRunner
+
+    setup()
+    settings.setdict({
+        'LOG_LEVEL': 'ERROR',
+        'HTTPCACHE_ENABLED': False,
+        'TELNETCONSOLE_ENABLED': False,
+    }, priority='cmdline')
+    scheduler = StateCrawlScheduler(
+        CrawlerRunner(settings),
+        max_states=args.max_states,
+        max_requests=args.max_requests,
+        spider_kwargs={'page_window': args.page_window},
+        settings={
+            'PROCORE_BASE_URL': base_url,
+            'PROCORE_INDEX_PATH': None,
+            'PROCORE_EXPORT_DIR': None,
+            **parse_overrides(args.set),
+        },
+    )
+
+    run = run_in_reactor(scheduler.crawl)
+    started = time.perf_counter()
+    run(args.states.split(',')).wait(args.timeout)
+    return scheduler, time.perf_counter() - started
+
+
+def summarize(scheduler, wall_time):
+    totals = {}
+    callbacks = {}
+    for crawler in scheduler.crawlers.values():
+        for name, value in crawler.stats.get_stats().items():
+            if name.startswith('callback/'):
+                _, callback, figure = name.split('/')
+                callback = callback.removesuffix('_in_pool')  # PROCORE_PARSE_WORKERS
+                callbacks.setdefault(callback, {}).setdefault(figure, []).append(value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                totals[name] = totals.get(name, 0) + value
+
+    pages = {}
+    for callback, figures in callbacks.items():
+        # Per-state percentiles cannot be merged exactly; report the worst state
+        pages[callback] = sum(figures['count'])
+        totals[f'{callback}_p50_ms'] = round(max(figures['p50']) * 1000, 3)
+        totals[f'{callback}_p99_ms'] = round(max(figures['p99']) * 1000, 3)
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak_rss *= 1024  # Linux reports KiB
+    items = totals.get('item_scraped_count', 0)
+    page_count = sum(pages.values())
+    return {
+        'wall_time': round(wall_time, 3),
+        'listing_pages': pages.get('parse', 0),
+        'detail_pages': pages.get('parse_business_detail', 0),
+        'items': items,
+        'pages_per_sec': round(page_count / wall_time, 2),
+        'items_per_sec': round(items / wall_time, 2),
+        'parse_p50_ms': totals.get('parse_p50_ms'),
+        'parse_p99_ms': totals.get('parse_p99_ms'),
+        'parse_business_detail_p50_ms': totals.get('parse_business_detail_p50_ms'),
+        'parse_business_detail_p99_ms': totals.get('parse_business_detail_p99_ms'),
+        'requests': totals.get('downloader/request_count', 0),
+        'retries': totals.get('retry/count', 0),
+        'retries_exhausted': totals.get('retry/max_reached', 0),
+        'throttled': totals.get('downloader/response_status_count/429', 0),
+        'concurrency_target': totals.get('concurrency/target'),
+        'concurrency_target_max': totals.get('concurrency/target_max'),
+        'cancelled_listing_pages': totals.get('pagination/cancelled', 0),
+        'wasted_requests': totals.get('termination/wasted_requests', 0),
+        'peak_rss_mib': round(peak_rss / 2 ** 20, 1),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} ({baseline.get('commit')}):")
+    for name, higher_is_better in COMPARED.items():
+        old, new = baseline['results'].get(name), results.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {name:30} {old:>10} -> {new:>10}  {change:+6.1f}% {'better' if better else 'worse' if change else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=60, help='non-empty listing pages per state')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--capacity', type=int, help='server answers 429 beyond this many requests at once')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--count', type=int, help='result count the listing pages report, default the true one')
+    parser.add_argument('--past-end', choices=['empty', 'repeat'], default='empty')
+    parser.add_argument('--states', default='ca', help='comma-separated; every state gets the same pages')
+    parser.add_argument('--max-states', type=int, default=4)
+    parser.add_argument('--max-requests', type=int, default=32)
+    parser.add_argument('--page-window', type=int, default=8)
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', help='extra Scrapy setting')
+    parser.add_argument('--timeout', type=float, default=3600)
+    parser.add_argument('--output', help=f'JSON results file, default {RESULTS_DIR}/crawl_<commit>_<time>.json')
+    parser.add_argument('--compare', metavar='JSON', help='earlier results to compare with')
+    args = parser.parse_args()
+
+    server, base_url = start_server(args)
+    try:
+        scheduler, wall_time = crawl(base_url, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+    results = summarize(scheduler, wall_time)
+    commit = git_commit()
+    run = {
+        'benchmark': 'crawl',
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'config': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"crawl_{commit or 'unknown'}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(run, f, indent=2)
+
+    for name, value in results.items():
+        print(f"{name + ':':32} {value}")
+    print(f"saved to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
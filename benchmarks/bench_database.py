@@ -0,0 +1,171 @@
+"""Measure bulk upserts into the result database and its filtered queries.
+
+Builds ``--rows`` rows from the businesses on the recorded listing pages,
+spread over 50 states with every copy keyed as a different business, and
+upserts them in batches of ``--batch-size`` into a fresh SQLite file. Then
+it upserts a tenth of them again, as a re-crawl would.
+
+Each filter of the app's query panel is then run two ways:
+- as the panel runs it, a ``count`` plus the first page of 500 rows from
+  the database;
+- as the app would without the database, filtering a DataFrame of every
+  row and taking the first page.
+
+Reports the median time of each. Fails if the two disagree on the number
+of matching rows.
+
+    python -m benchmarks.bench_database [--rows 500000] [--batch-size 1000]
+"""
+import argparse
+import os
+import re
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.fixtures import load_responses
+from database import ResultDatabase
+from dedupe import business_key
+from exports import BUSINESS_KEY
+from parsing import listing_page
+
+STATES = [
+    'al', 'ak', 'az', 'ar', 'ca', 'co', 'ct', 'de', 'fl', 'ga', 'hi', 'id', 'il', 'in', 'ia', 'ks', 'ky',
+    'la', 'me', 'md', 'ma', 'mi', 'mn', 'ms', 'mo', 'mt', 'ne', 'nv', 'nh', 'nj', 'nm', 'ny', 'nc', 'nd',
+    'oh', 'ok', 'or', 'pa', 'ri', 'sc', 'sd', 'tn', 'tx', 'ut', 'vt', 'va', 'wa', 'wv', 'wi', 'wy',
+]
+
+
+def recorded_rows():
+    rows = {}
+    for response in load_responses('listing'):
+        _, links, _, _ = listing_page(response, 'ca')
+        for link in links:
+            if link is None:
+                continue
+            business_name, url, (location, company_type, market_services, trades_services), phone = link
+            rows[url] = {
+                "Business Name": business_name,
+                "Phone Number": phone,
+                "Location": location,
+                "Company Type": company_type,
+                "Market and Services": market_services,
+                "Trades and Services": trades_services,
+            }
+    return rows
+
+
+def synthetic_rows(count):
+    """``(state, row)`` pairs; copy ``n`` of a business gets its own ID."""
+    templates = list(recorded_rows().items())
+    for i in range(count):
+        repeat, index = divmod(i, len(templates))
+        url, row = templates[index]
+        yield STATES[i % len(STATES)], {**row, BUSINESS_KEY: business_key(f"{url}--r{repeat}")}
+
+
+def load(database, rows, batch_size):
+    batches = {}
+    for state, row in rows:
+        batch = batches.setdefault(state, [])
+        batch.append(row)
+        if len(batch) >= batch_size:
+            database.upsert(state, batch)
+            batches[state] = []
+    for state, batch in batches.items():
+        if batch:
+            database.upsert(state, batch)
+
+
+def tag_pattern(values):
+    # A whole value in a comma-joined list
+    return '(?:^|, )(?:' + '|'.join(re.escape(value) for value in values) + ')(?:,|$)'
+
+
+def frame_filter(df, states=(), cities=(), company_types=(), trades=(), name=None):
+    mask = pd.Series(True, index=df.index)
+    if states:
+        mask &= df["State"].isin([code.upper() for code in states])
+    if cities:
+        mask &= df["Location"].isin(cities)
+    if company_types:
+        mask &= df["Company Type"].str.contains(tag_pattern(company_types), na=False)
+    if trades:
+        mask &= df["Trades and Services"].str.contains(tag_pattern(trades), na=False)
+    if name:
+        mask &= df["Business Name"].str.contains(name, case=False, regex=False, na=False)
+    return df[mask]
+
+
+def frame_page(df, **filters):
+    matched = frame_filter(df, **filters)
+    return len(matched), matched.head(500)
+
+
+def median_time(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return result, statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'procore.sqlite3')
+        database = ResultDatabase(path)
+        started = time.perf_counter()
+        load(database, synthetic_rows(args.rows), args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"upsert {args.rows} new rows:      {elapsed:6.2f}s ({args.rows / elapsed:,.0f} rows/s), "
+              f"{os.path.getsize(path) / 2 ** 20:.0f} MiB")
+        again = args.rows // 10
+        started = time.perf_counter()
+        load(database, synthetic_rows(again), args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"upsert {again} existing rows:  {elapsed:6.2f}s ({again / elapsed:,.0f} rows/s)")
+        stored = database.count()
+        if stored != args.rows:
+            raise SystemExit(f"{stored} rows stored, expected {args.rows}")
+
+        started = time.perf_counter()
+        columns, rows = database.query(limit=args.rows)
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        print(f"load every row into pandas:     {time.perf_counter() - started:6.2f}s")
+
+        trades = database.tags('trade')
+        company_types = database.tags('company_type')
+        cities = database.cities(states=['ca'])
+        filters = {
+            'state': {'states': ['tx']},
+            'trade': {'trades': trades[:1]},
+            'state + trade': {'states': ['ca'], 'trades': trades[:1]},
+            'rare trade': {'trades': trades[-1:]},
+            'city': {'cities': cities[:1]},
+            'type + 2 trades': {'company_types': company_types[:1], 'trades': trades[1:3]},
+            'name contains': {'name': 'fire'},
+        }
+        print(f"\n{'filter':18} {'matches':>8} {'database':>10} {'pandas':>10}")
+        mismatches = 0
+        for label, chosen in filters.items():
+            (matches, _), db_time = median_time(lambda: (database.count(**chosen), database.query(**chosen)))
+            (frame_matches, _), pandas_time = median_time(lambda: frame_page(df, **chosen))
+            print(f"{label:18} {matches:8} {db_time * 1000:8.1f}ms {pandas_time * 1000:8.1f}ms")
+            if matches != frame_matches:
+                print(f"  pandas matched {frame_matches}")
+                mismatches += 1
+        database.close()
+    if mismatches:
+        raise SystemExit(f"{mismatches} filters matched differently in the database and pandas")
+
+
+if __name__ == '__main__':
+    main()
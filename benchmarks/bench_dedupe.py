@@ -0,0 +1,109 @@
+"""Measure memory, speed and false positives of the business dedupe set.
+
+Builds ``--businesses`` detail URLs from the recorded listing slugs (with
+``--r<n>`` suffixes, as the mock server repeats them) and dedupes them
+with a ``set`` of names (the old structure), a ``set`` of URLs, a ``set``
+of 64-bit hashes and ``dedupe.SeenSet``. Memory is what tracemalloc sees
+allocated by each structure and its keys. False positives are counted by
+looking up ``--probes`` URLs that were never added; for ``SeenSet`` the
+expected count is about probes * businesses / 2**64.
+
+Also reports how many distinct businesses the recorded listings lose when
+deduped on the display name instead of the canonical ID.
+
+    python -m benchmarks.bench_dedupe [--businesses 1000000] [--probes 1000000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from benchmarks.fixtures import load_responses
+from dedupe import SeenSet, business_key, key_hash
+from parsing import listing_page
+
+
+def recorded_links():
+    links = {}
+    for response in load_responses('listing'):
+        _, page_links, _, _ = listing_page(response, 'ca')
+        for link in page_links:
+            if link is not None:
+                links[link[1]] = link[0]
+    return links
+
+
+def measure(build):
+    # Timed without tracemalloc, which slows allocation down several times
+    gc.collect()
+    started = time.perf_counter()
+    structure = build()
+    elapsed = time.perf_counter() - started
+    del structure
+    gc.collect()
+    tracemalloc.start()
+    structure = build()
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return structure, elapsed, memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--businesses', type=int, default=1_000_000)
+    parser.add_argument('--probes', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    links = recorded_links()
+    names = list(links.values())
+    slug_keys = {business_key(url) for url in links}
+    print(f"recorded listings: {len(links)} distinct businesses, {len(slug_keys)} distinct slugs, "
+          f"{len(set(names))} distinct names ({len(links) - len(set(names))} lost to name dedupe)")
+
+    templates = list(links)
+    count = args.businesses
+
+    def url(i):
+        repeat, index = divmod(i, len(templates))
+        return f"{templates[index]}--r{repeat}"
+
+    def name(i):
+        repeat, index = divmod(i, len(templates))
+        return f"{names[index]} {repeat}"
+
+    def build_seen_set():
+        seen = SeenSet()
+        for i in range(count):
+            seen.add(business_key(url(i)))
+        return seen
+
+    candidates = {
+        'set of names': lambda: {name(i) for i in range(count)},
+        'set of URLs': lambda: {url(i) for i in range(count)},
+        'set of 64-bit hashes': lambda: {key_hash(business_key(url(i))) for i in range(count)},
+        'SeenSet': build_seen_set,
+    }
+    print(f"\n{count} businesses:")
+    results = {}
+    for label, build in candidates.items():
+        structure, elapsed, memory = measure(build)
+        results[label] = structure
+        print(f"  {label:22} {memory / 2 ** 20:8.1f} MiB  {memory / count:6.1f} B/business  "
+              f"{elapsed / count * 1e9:6.0f} ns/add")
+
+    seen = results['SeenSet']
+    if len(seen) != count:
+        raise SystemExit(f"SeenSet holds {len(seen)} businesses, expected {count}")
+    started = time.perf_counter()
+    false_positives = sum(1 for i in range(args.probes) if business_key(f"{url(i)}-new") in seen)
+    elapsed = time.perf_counter() - started
+    expected = args.probes * count / 2 ** 64
+    print(f"\n{args.probes} lookups of new businesses: {false_positives} false positives "
+          f"(expected {expected:.1e}), {elapsed / args.probes * 1e9:.0f} ns/lookup")
+    missed = sum(1 for i in range(0, count, max(1, count // 100_000)) if business_key(url(i)) not in seen)
+    if missed:
+        raise SystemExit(f"{missed} added businesses not found")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare inline page parsing with the parser process pool.
+
+Parses every recorded listing and detail page once on the calling thread,
+then again through a spawned ``ProcessPoolExecutor`` that never has more
+than ``--max-pending`` jobs queued, which is how ``ParserPool`` feeds it.
+Reports pages/s for each worker count, plus the time the calling thread
+spent busy. That busy time is what the reactor thread would lose; in the
+pool it is only job submission, because pickling and result handling run
+on the executor's own thread. Fails if any page parses differently in a
+worker.
+
+    python -m benchmarks.bench_parser_pool [--workers 1,2,4] [--max-pending N]
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from benchmarks.fixtures import load_responses
+from parsing import detail_page, listing_page, parse_detail_body, parse_listing_body
+
+
+def jobs(responses, state):
+    for response in responses:
+        if '/p/' in response.url:
+            yield parse_detail_body, (response.url, response.body, response.encoding)
+        else:
+            yield parse_listing_body, (response.url, response.body, response.encoding, state)
+
+
+def run_inline(responses, state):
+    started = time.perf_counter()
+    results = [
+        detail_page(response) if '/p/' in response.url else listing_page(response, state)
+        for response in responses
+    ]
+    elapsed = time.perf_counter() - started
+    return results, elapsed, elapsed
+
+
+def run_pool(responses, state, workers, max_pending):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        # Start the workers before timing, as a crawl would have
+        list(executor.map(abs, range(workers)))
+        started = time.perf_counter()
+        busy = 0.0
+        futures = []
+        pending = set()
+        for func, args in jobs(responses, state):
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            submit_started = time.perf_counter()
+            future = executor.submit(func, *args)
+            busy += time.perf_counter() - submit_started
+            pending.add(future)
+            futures.append(future)
+        wait(pending)
+        elapsed = time.perf_counter() - started
+    return [future.result()[0] for future in futures], elapsed, busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default=f'1,2,{os.cpu_count() or 1}')
+    parser.add_argument('--max-pending', type=int, help='jobs in the pool at once, default 2 per worker')
+    parser.add_argument('--state', default='ca')
+    args = parser.parse_args()
+
+    responses = load_responses('listing') + load_responses('detail')
+    expected, inline_time, _ = run_inline(responses, args.state)
+    print(f"pages:          {len(responses)} on {os.cpu_count()} CPUs")
+    print(f"inline:         {len(responses) / inline_time:7.1f} pages/s, reactor thread busy {inline_time:.2f}s")
+
+    failures = 0
+    for workers in sorted({int(w) for w in args.workers.split(',')}):
+        max_pending = args.max_pending or 2 * workers
+        results, elapsed, busy = run_pool(responses, args.state, workers, max_pending)
+        mismatches = sum(1 for a, b in zip(expected, results) if a[:2] != b[:2])
+        failures += mismatches
+        print(
+            f"{workers} worker(s):    {len(responses) / elapsed:7.1f} pages/s, reactor thread busy {busy:.2f}s"
+            f" ({inline_time / elapsed:.2f}x inline)"
+        )
+        if mismatches:
+            print(f"  {mismatches} pages parsed differently in the pool")
+    if failures:
+        raise SystemExit("pool results differ from inline parsing")
+
+
+if __name__ == '__main__':
+    main()
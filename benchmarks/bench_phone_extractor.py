@@ -0,0 +1,121 @@
+"""Compare phone_extractor with the old parse_business_detail cascade.
+
+Runs both over every recorded detail page, fails if any phone number
+differs, and reports the time per page. Each response is parsed fresh for
+every run so the lxml tree build is counted on both sides.
+
+    python -m benchmarks.bench_phone_extractor [--repeat N]
+"""
+import argparse
+import re
+import time
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.fixtures import load_responses
+from phone_extractor import extract_phone
+
+
+def legacy_phone(response):
+    # Verbatim copy of the cascade that used to live in parse_business_detail
+    phone_number = None
+    script_tags = response.css('script::text').getall()
+    for script in script_tags:
+        if 'phone' in script.lower() and ('"' in script or "'" in script):
+            phone_patterns = [
+                r'"phone":\s*"([^"]+)"',
+                r"'phone':\s*'([^']+)'",
+                r'"phone":\s*"([^"]*\+[^"]*)"',
+                r"'phone':\s*'([^']*\+[^']*)'",
+            ]
+            for pattern in phone_patterns:
+                matches = re.findall(pattern, script)
+                for match in matches:
+                    if match and ('+' in match or '(' in match or match.replace('-', '').replace(' ', '').isdigit()):
+                        phone_number = match.strip()
+                        break
+                if phone_number:
+                    break
+            if phone_number:
+                break
+    if not phone_number or not phone_number.strip():
+        phone_selectors = [
+            'p.MuiTypography-body1::text',
+            'div[class*="jss"] p.MuiTypography-body1::text',
+            'p[class*="MuiTypography-body1"]::text',
+            'div[class*="sc-"] p[class*="MuiTypography"]::text',
+            'a[href^="tel:"]::text',
+            'a[href^="tel:"]::attr(href)',
+            '[data-test-id*="phone"]::text',
+            '[data-test-id*="contact"]::text',
+        ]
+        for selector in phone_selectors:
+            phone_number = response.css(selector).get()
+            if phone_number and phone_number.strip():
+                phone_number = phone_number.strip()
+                if phone_number.startswith('tel:'):
+                    phone_number = phone_number[4:]
+                break
+    if not phone_number or not phone_number.strip():
+        phone_xpath_selectors = [
+            '//p[contains(@class, "MuiTypography-body1")]/text()',
+            '//div[contains(span, "Phone")]/p/text()',
+            '//span[contains(text(), "Phone")]/following-sibling::p/text()',
+            '//p[contains(text(), "+")]/text()',
+            '//p[contains(text(), "(") and contains(text(), ")")]/text()',
+        ]
+        for xpath_selector in phone_xpath_selectors:
+            phone_candidates = response.xpath(xpath_selector).getall()
+            for candidate in phone_candidates:
+                candidate = candidate.strip()
+                if candidate and (candidate.startswith('+') or
+                               ('(' in candidate and ')' in candidate) or
+                               (candidate.replace('-', '').replace(' ', '').replace('(', '').replace(')', '').isdigit() and len(candidate.replace('-', '').replace(' ', '').replace('(', '').replace(')', '')) >= 10)):
+                    phone_number = candidate
+                    break
+            if phone_number:
+                break
+    if not phone_number or not phone_number.strip():
+        phone_number = "Not Available"
+    return phone_number
+
+
+def fresh(response):
+    return HtmlResponse(response.url, status=response.status, headers=response.headers, body=response.body)
+
+
+def run(extract, responses, repeat):
+    results = None
+    elapsed = 0.0
+    for _ in range(repeat):
+        pages = [fresh(response) for response in responses]
+        started = time.perf_counter()
+        results = [extract(page) for page in pages]
+        elapsed += time.perf_counter() - started
+    return results, elapsed / (repeat * len(responses))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    responses = load_responses('detail', args.limit)
+    legacy, legacy_time = run(legacy_phone, responses, args.repeat)
+    single_pass, single_pass_time = run(lambda r: extract_phone(r.selector), responses, args.repeat)
+
+    mismatches = [(r.url, a, b) for r, a, b in zip(responses, legacy, single_pass) if a != b]
+    for url, expected, got in mismatches:
+        print(f"MISMATCH {url}: cascade={expected!r} single-pass={got!r}")
+
+    print(f"detail pages:    {len(responses)}")
+    print(f"cascade:         {legacy_time * 1000:.3f} ms/page")
+    print(f"single-pass:     {single_pass_time * 1000:.3f} ms/page")
+    print(f"speedup:         {legacy_time / single_pass_time:.2f}x")
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} phone numbers differ from the cascade")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Measure phone normalization against the same rules applied row by row.
+
+Builds ``--rows`` phone numbers in the forms the extractor returns: the
+recorded ones from the listing and detail pages, plus synthetic numbers
+written as E.164, dashed, with parentheses, as ``tel:`` links, with
+extensions, "Not Available" and page text taken for a number. About a
+third of them repeat an earlier value, as businesses listed in several
+states do.
+
+Times three runs over the column:
+- row by row, ``phones.parse_phone`` on every value, as the cleanup in
+  pandas did and as the fallback without pyarrow does;
+- ``normalize_phones`` in batches of ``--batch-size`` with an empty cache,
+  as the pipelines run it during a crawl;
+- ``normalize_phones`` over the whole column again with the cache full,
+  as the app runs it on the finished results.
+
+Fails if the batched results differ from the row by row ones.
+
+    python -m benchmarks.bench_phones [--rows 100000] [--batch-size 1000]
+"""
+import argparse
+import random
+import time
+from collections import Counter
+
+import phones
+from benchmarks.fixtures import load_responses
+from parsing import detail_page, listing_page
+from phone_extractor import NOT_AVAILABLE
+from phones import normalize_phones, parse_phone
+
+FORMATS = [
+    '+1{a}{b}{c}',
+    '+1-{a}-{b}-{c}',
+    '({a}) {b}-{c}',
+    '{a}.{b}.{c}',
+    'tel:+1{a}{b}{c}',
+    '1 {a} {b} {c}',
+    '{a}-{b}-{c} ext. {ext}',
+    '+44 20 {b}{c}',
+    '{a} {b}',
+]
+NOISE = [
+    NOT_AVAILABLE,
+    'Looks like the page you’re trying to visit doesn’t exist. Please check the URL and try again.',
+    '(555) 010-0000',
+    '000-000-0000',
+]
+
+
+def recorded_phones():
+    values = []
+    for response in load_responses('listing'):
+        _, links, _, _ = listing_page(response, 'ca')
+        values.extend(link[3] for link in links if link is not None)
+    for response in load_responses('detail'):
+        values.append(detail_page(response)[0])
+    return values
+
+
+def synthetic_phones(count, seed=0):
+    rng = random.Random(seed)
+    recorded = recorded_phones()
+    values = []
+    for i in range(count):
+        roll = rng.random()
+        if values and roll < 0.3:
+            values.append(rng.choice(values))
+        elif roll < 0.4:
+            values.append(rng.choice(recorded))
+        elif roll < 0.45:
+            values.append(rng.choice(NOISE))
+        else:
+            values.append(rng.choice(FORMATS).format(
+                a=rng.randint(100, 999), b=rng.randint(100, 999), c=f'{rng.randint(0, 9999):04d}',
+                ext=rng.randint(1, 999),
+            ))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    values = synthetic_phones(args.rows)
+    print(f"{len(values)} phone numbers, {len(set(values))} distinct")
+
+    started = time.perf_counter()
+    expected = [parse_phone(value) for value in values]
+    row_time = time.perf_counter() - started
+
+    # Imports pyarrow outside the timings
+    normalize_phones(NOISE)
+    phones._cache.clear()
+    started = time.perf_counter()
+    numbers, statuses = [], []
+    for start in range(0, len(values), args.batch_size):
+        batch_numbers, batch_statuses = normalize_phones(values[start:start + args.batch_size])
+        numbers.extend(batch_numbers)
+        statuses.extend(batch_statuses)
+    batch_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    cached_numbers, cached_statuses = normalize_phones(values)
+    cached_time = time.perf_counter() - started
+
+    for label, elapsed in (
+        ('row by row', row_time),
+        (f'batches of {args.batch_size}', batch_time),
+        ('column, cached', cached_time),
+    ):
+        print(f"  {label:18} {elapsed * 1000:8.1f} ms  {len(values) / elapsed:12,.0f} rows/s")
+    print('  ' + ', '.join(f"{status}: {n}" for status, n in Counter(statuses).most_common()))
+
+    mismatches = sum(
+        1 for result in (list(zip(numbers, statuses)), list(zip(cached_numbers, cached_statuses)))
+        for got, want in zip(result, expected) if got != want
+    )
+    if mismatches:
+        raise SystemExit(f"{mismatches} phone numbers normalized differently from the row by row rules")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Compare building detail requests the old way with the request fast path.
+
+The old way gave every request its own six-header dict and a seven-key
+``meta`` dict, then ran Scrapy's ``DefaultHeadersMiddleware`` and
+``UserAgentMiddleware`` on it, and joined each link with
+``response.urljoin``. The fast path builds requests without headers, has
+``SharedHeadersMiddleware`` add them from its template, passes one
+``ListingRecord`` in ``cb_kwargs`` and joins links with
+``parsing.join_url``.
+
+Builds ``--requests`` detail requests from the businesses on the recorded
+listing pages and reports the time per request, the blocks and bytes each
+one allocates and keeps (as queued requests are kept by the scheduler),
+and the time per joined link. Fails if any request differs in URL or
+headers between the two paths.
+
+    python -m benchmarks.bench_requests [--requests 100000]
+"""
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+import scrapy
+from scrapy.downloadermiddlewares.defaultheaders import DefaultHeadersMiddleware
+from scrapy.downloadermiddlewares.useragent import UserAgentMiddleware
+from scrapy.settings import Settings
+
+from benchmarks.fixtures import load_responses
+from middlewares import SharedHeadersMiddleware
+from parsing import ListingRecord, join_url, listing_page
+from procore_spider import ProcoreSpider
+
+
+def callback(response, listing=None):
+    pass
+
+
+def old_request(url, business_name, classification):
+    location, company_type, market_services, trades_services = classification
+    meta = {
+        'business_name': business_name,
+        'location': location,
+        'company_type': company_type,
+        'market_services': market_services,
+        'trades_services': trades_services,
+        'index_key': url,
+        'content_hash': None,
+    }
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+        'Upgrade-Insecure-Requests': '1',
+    }
+    return scrapy.Request(url, headers=headers, callback=callback, meta=dict(meta))
+
+
+def new_request(url, business_name, classification):
+    listing = ListingRecord(url, business_name, classification, None)
+    return scrapy.Request(listing.detail_url, callback=callback, cb_kwargs={'listing': listing})
+
+
+def recorded_businesses():
+    businesses = []
+    for response in load_responses('listing'):
+        _, links, _, _ = listing_page(response, 'ca')
+        businesses.extend((response, link) for link in links if link is not None)
+    return businesses
+
+
+def build(make, businesses, count, middlewares):
+    requests = []
+    for i in range(count):
+        _, (business_name, url, classification, _) = businesses[i % len(businesses)]
+        request = make(url, business_name, classification)
+        for middleware in middlewares:
+            middleware.process_request(request, None)
+        requests.append(request)
+    return requests
+
+
+def measure(make, businesses, count, middlewares):
+    gc.collect()
+    started = time.perf_counter()
+    build(make, businesses, count, middlewares)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    requests = build(make, businesses, count, middlewares)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    blocks = sys.getallocatedblocks() - blocks
+    return requests, elapsed, blocks, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=100_000)
+    args = parser.parse_args()
+
+    settings = Settings(ProcoreSpider.custom_settings)
+    paths = {
+        'old': (old_request, [
+            DefaultHeadersMiddleware(settings.getdict('DEFAULT_REQUEST_HEADERS').items()),
+            UserAgentMiddleware(settings['USER_AGENT']),
+        ]),
+        'fast path': (new_request, [SharedHeadersMiddleware.from_settings(settings)]),
+    }
+    businesses = recorded_businesses()
+    count = args.requests
+    print(f"{count} detail requests from {len(businesses)} recorded businesses:")
+    results = {}
+    for label, (make, middlewares) in paths.items():
+        requests, elapsed, blocks, retained = measure(make, businesses, count, middlewares)
+        results[label] = requests
+        print(f"  {label:10} {elapsed / count * 1e6:6.2f} us/request  {blocks / count:5.1f} blocks/request  "
+              f"{retained / count:6.0f} B/request kept")
+
+    hrefs = [(response, urlsplit(link[1]).path) for response, link in businesses]
+    rounds = max(1, count // len(hrefs))
+    for label, join in (('urljoin', lambda response, href: response.urljoin(href)), ('join_url', join_url)):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for response, href in hrefs:
+                join(response, href)
+        elapsed = time.perf_counter() - started
+        print(f"  {label:10} {elapsed / (rounds * len(hrefs)) * 1e6:6.2f} us/link")
+
+    mismatches = sum(
+        1 for old, new in zip(results['old'], results['fast path'])
+        if old.url != new.url or old.headers.to_unicode_dict() != new.headers.to_unicode_dict()
+    )
+    mismatches += sum(1 for response, href in hrefs if join_url(response, href) != response.urljoin(href))
+    if mismatches:
+        raise SystemExit(f"{mismatches} requests or links differ between the two paths")
+
+
+if __name__ == '__main__':
+    main()
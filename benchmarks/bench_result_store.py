@@ -0,0 +1,111 @@
+"""Compare results.ResultStore with the old list of row dicts.
+
+Builds N synthetic rows with the field cardinality of a real crawl:
+unique names and phones, and locations, company types, markets and trades
+drawn from the gazetteers. Every value is a fresh string object, as it is
+when parsed from a page. Reports the memory each container retains, and
+the time and size of the DataFrame the app builds from it. Fails if the
+store does not give back the rows it was given.
+
+    python -m benchmarks.bench_result_store [--rows N]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+import pandas as pd
+
+from classifier import read_gazetteer
+from phones import PHONE_STATUSES
+from results import ResultStore
+
+
+def fresh(value):
+    # A new str object with the same contents, like text parsed from HTML
+    return value.encode('utf-8').decode('utf-8') if value is not None else None
+
+
+def synthetic_rows(count, seed=0):
+    rng = random.Random(seed)
+    states = ['CA', 'NY', 'TX', 'MI']
+    locations = read_gazetteer('ca')
+    company_types = read_gazetteer('company_types')
+    markets = read_gazetteer('markets')
+    trades = read_gazetteer('trades')
+
+    def maybe(values):
+        return rng.choice(values) if rng.random() < 0.9 else None
+
+    for i in range(count):
+        yield {
+            "State": fresh(rng.choice(states)),
+            "Business Name": f"{rng.choice(locations)} Builders {i}",
+            "Phone Number": f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{i % 10000:04d}",
+            "Phone Status": fresh(rng.choice(PHONE_STATUSES)),
+            "Location": fresh(maybe(locations)),
+            "Company Type": fresh(maybe(company_types)),
+            "Market and Services": fresh(maybe(markets)),
+            "Trades and Services": fresh(maybe(trades)),
+        }
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    container = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return container, size, elapsed
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def build_store(rows):
+    store = ResultStore()
+    for row in rows:
+        store.append(row)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+
+    dicts, dicts_bytes, dicts_build = retained(lambda: list(synthetic_rows(args.rows)))
+    store, store_bytes, store_build = retained(lambda: build_store(synthetic_rows(args.rows)))
+
+    dicts_df, dicts_df_time = timed(lambda: pd.DataFrame.from_records(dicts))
+    store_df, store_df_time = timed(store.to_pandas)
+    try:
+        _, arrow_time = timed(store.to_arrow)
+    except ImportError:
+        arrow_time = None
+
+    mismatches = sum(1 for expected, got in zip(dicts, store) if expected != got)
+    mismatches += abs(len(dicts) - len(store))
+
+    mib = 1024 * 1024
+    print(f"rows:                 {args.rows}")
+    print(f"list of dicts:        {dicts_bytes / mib:8.1f} MiB retained, built in {dicts_build:.2f}s")
+    print(f"result store:         {store_bytes / mib:8.1f} MiB retained, built in {store_build:.2f}s")
+    print(f"memory ratio:         {dicts_bytes / store_bytes:.2f}x")
+    print(f"DataFrame from dicts: {dicts_df_time * 1000:8.1f} ms, {dicts_df.memory_usage(deep=True).sum() / mib:.1f} MiB")
+    print(f"DataFrame from store: {store_df_time * 1000:8.1f} ms, {store_df.memory_usage(deep=True).sum() / mib:.1f} MiB")
+    if arrow_time is not None:
+        print(f"Arrow table:          {arrow_time * 1000:8.1f} ms")
+    if mismatches:
+        raise SystemExit(f"{mismatches} rows differ after a round trip through the store")
+
+
+if __name__ == '__main__':
+    main()
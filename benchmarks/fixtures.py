@@ -0,0 +1,77 @@
+"""Pages recorded in the Scrapy HTTP cache, loaded as benchmark fixtures.
+
+``.scrapy/httpcache/procore`` holds listing and detail pages from earlier
+crawls in Scrapy's filesystem cache layout: one directory per request with
+``meta``, ``response_headers`` and ``response_body`` files.
+"""
+import ast
+import gzip
+import os
+import zlib
+
+from scrapy.http import HtmlResponse
+from scrapy.http.headers import Headers
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT_DIR, '.scrapy', 'httpcache', 'procore')
+
+
+def page_kind(url):
+    if '/p/' in url:
+        return 'detail'
+    if 'page=' in url:
+        return 'listing'
+    return 'other'
+
+
+def decode_body(body, headers):
+    encoding = (headers.get(b'Content-Encoding') or b'').lower()
+    if encoding == b'gzip':
+        return gzip.decompress(body)
+    if encoding == b'deflate':
+        return zlib.decompress(body)
+    return body
+
+
+def read_headers(path):
+    headers = Headers()
+    with open(path, 'rb') as f:
+        for line in f.read().splitlines():
+            name, _, value = line.partition(b':')
+            if name:
+                headers.appendlist(name.strip(), value.strip())
+    return headers
+
+
+def iter_entries(kind=None, cache_dir=CACHE_DIR):
+    """Yield ``(url, status, headers, body)`` for every recorded page.
+
+    Entries are sorted by URL so runs are repeatable; a URL recorded more
+    than once is returned once.
+    """
+    entries = {}
+    for bucket in sorted(os.listdir(cache_dir)):
+        bucket_dir = os.path.join(cache_dir, bucket)
+        for key in os.listdir(bucket_dir):
+            entry_dir = os.path.join(bucket_dir, key)
+            with open(os.path.join(entry_dir, 'meta')) as f:
+                meta = ast.literal_eval(f.read())
+            if kind is not None and page_kind(meta['url']) != kind:
+                continue
+            entries.setdefault(meta['url'], (meta, entry_dir))
+    for url in sorted(entries):
+        meta, entry_dir = entries[url]
+        headers = read_headers(os.path.join(entry_dir, 'response_headers'))
+        with open(os.path.join(entry_dir, 'response_body'), 'rb') as f:
+            body = decode_body(f.read(), headers)
+        del headers[b'Content-Encoding']
+        yield url, meta['status'], headers, body
+
+
+def load_responses(kind=None, limit=None):
+    responses = []
+    for url, status, headers, body in iter_entries(kind):
+        responses.append(HtmlResponse(url, status=status, headers=headers, body=body))
+        if limit is not None and len(responses) >= limit:
+            break
+    return responses
@@ -0,0 +1,200 @@
+"""Local stand-in for network.procore.com that replays recorded pages.
+
+Listing page N is served from the recorded listing pages in turn. Once
+those run out they are served again with every business slug and name
+suffixed, in the rendered HTML and in the ``__NEXT_DATA__`` results alike,
+so each page still lists new businesses. Pages after ``--pages``
+come back empty, or with ``--past-end repeat`` as the last page again, the
+way some sites answer page numbers past the end. The ``__NEXT_DATA__``
+result count is the number of businesses served on all pages, or
+``--count`` to report a stale one.
+Detail pages are looked up by slug; slugs that were never recorded get a
+recorded detail page chosen by hash. Bodies are sent gzip-encoded, as the
+real site does.
+
+Every response is delayed by ``--latency`` seconds plus or minus
+``--jitter``. ``--error-rate`` of them fail with a 503. With ``--capacity``
+the server throttles like a rate-limited site: a request that arrives while
+that many are already being served gets an immediate 429 with a
+``Retry-After`` of ``--retry-after`` seconds.
+
+    python -m benchmarks.mock_server [--port 8765] [--pages 60] [--latency 0.05]
+        [--capacity 16] [--retry-after 1] [--count N] [--past-end repeat]
+
+The first line on stdout is ``listening on <base url>``.
+"""
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fixtures import iter_entries
+
+SLUG_RE = re.compile(rb'(/p/|"primarySlug":")([A-Za-z0-9_-]+)')
+TRACK_CLICK_RE = re.compile(rb'(data-track-click="[^"]*?)(")')
+REPEAT_SUFFIX_RE = re.compile(r'--r\d+$')
+NEXT_DATA_RE = re.compile(rb'(<script id="__NEXT_DATA__" type="application/json">)(.*?)(</script>)', re.S)
+
+EMPTY_LISTING = b'<html><body><div id="resultsContainer"></div></body></html>'
+
+
+class RecordedSite:
+    def __init__(self, pages, compresslevel=1, count=None, past_end='empty'):
+        self.pages = pages
+        self.compresslevel = compresslevel
+        self.past_end = past_end
+        self.listings = [body for _, _, _, body in iter_entries('listing')]
+        if count is None:
+            count = sum(result_count(self.listings[page % len(self.listings)]) for page in range(pages))
+        self.count = count
+        self.details = {}
+        self.detail_list = []
+        for url, status, headers, body in iter_entries('detail'):
+            entry = (status, gzip.compress(body, compresslevel))
+            self.details[url.rsplit('/p/', 1)[1]] = entry
+            self.detail_list.append(entry)
+        self.empty_listing = gzip.compress(EMPTY_LISTING, compresslevel)
+        self.render_listing = lru_cache(maxsize=128)(self._render_listing)
+
+    def listing(self, page):
+        if page > self.pages and self.past_end == 'repeat' and self.pages >= 1:
+            page = self.pages
+        if page < 1 or page > self.pages or not self.listings:
+            return 200, self.empty_listing
+        return 200, self.render_listing(page)
+
+    def _render_listing(self, page):
+        repeat, index = divmod(page - 1, len(self.listings))
+        body = self.listings[index]
+        if repeat:
+            suffix = f'--r{repeat}'.encode()
+            body = SLUG_RE.sub(lambda m: m.group(1) + m.group(2) + suffix, body)
+            body = TRACK_CLICK_RE.sub(lambda m: m.group(1) + f' {repeat + 1}'.encode() + m.group(2), body)
+        body = NEXT_DATA_RE.sub(
+            lambda m: m.group(1) + rewrite_results(m.group(2), repeat + 1, self.count) + m.group(3), body
+        )
+        return gzip.compress(body, self.compresslevel)
+
+    def detail(self, slug):
+        slug = REPEAT_SUFFIX_RE.sub('', slug)
+        entry = self.details.get(slug)
+        if entry is None:
+            entry = self.detail_list[zlib.crc32(slug.encode()) % len(self.detail_list)]
+        return entry
+
+
+def result_count(body):
+    match = NEXT_DATA_RE.search(body)
+    return len(json.loads(match.group(2))['props']['pageProps']['initialResults']['results']) if match else 0
+
+
+def rewrite_results(blob, number, count):
+    data = json.loads(blob)
+    results = data['props']['pageProps']['initialResults']
+    results['count'] = count
+    if number > 1:
+        for result in results['results']:
+            result['name'] = f"{result['name']} {number}"
+            if result.get('display'):
+                result['display']['name'] = f"{result['display']['name']} {number}"
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def make_handler(site, latency, jitter, error_rate, seed, capacity=None, retry_after=1):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    serving = [0]  # Requests being served right now
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with lock:
+                throttled = capacity is not None and serving[0] >= capacity
+                if not throttled:
+                    serving[0] += 1
+            if throttled:
+                self.send_body(429, b'Too Many Requests', encoded=False, headers={'Retry-After': str(retry_after)})
+                return
+            try:
+                self.serve()
+            finally:
+                with lock:
+                    serving[0] -= 1
+
+        def serve(self):
+            with lock:
+                delay = latency * rng.uniform(1 - jitter, 1 + jitter) if latency else 0
+                fail = rng.random() < error_rate
+            if delay:
+                time.sleep(delay)
+            if fail:
+                self.send_body(503, b'Service Unavailable', encoded=False)
+                return
+            url = urlsplit(self.path)
+            if '/p/' in url.path:
+                status, body = site.detail(url.path.rsplit('/p/', 1)[1])
+            elif 'page' in parse_qs(url.query):
+                status, body = site.listing(int(parse_qs(url.query)['page'][0]))
+            else:
+                self.send_body(404, b'Not Found', encoded=False)
+                return
+            self.send_body(status, body)
+
+        def send_body(self, status, body, encoded=True, headers=None):
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            if encoded:
+                self.send_header('Content-Encoding', 'gzip')
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='0 picks a free port')
+    parser.add_argument('--pages', type=int, default=60, help='non-empty listing pages')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per response')
+    parser.add_argument('--jitter', type=float, default=0.5, help='latency varies by this fraction')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of responses that are 503s')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--capacity', type=int, help='requests served at once before answering 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--count', type=int, help='result count reported, defaults to the businesses served')
+    parser.add_argument('--past-end', choices=['empty', 'repeat'], default='empty',
+                        help='serve pages past the end empty, or as the last page again')
+    args = parser.parse_args()
+
+    site = RecordedSite(args.pages, count=args.count, past_end=args.past_end)
+    handler = make_handler(
+        site, args.latency, args.jitter, args.error_rate, args.seed, capacity=args.capacity, retry_after=args.retry_after,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f'listening on http://{args.host}:{server.server_address[1]}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Persistent index of scraped businesses for incremental re-crawls.
+
+Each business is stored once per state under its detail URL. A row holds
+the business name, a hash of the listing fields, the time its detail page
+was last fetched, the time it was last seen on a listing page, and the
+exported row. On the next crawl a business whose listing fields still hash
+the same and whose detail page was fetched within the TTL is emitted from
+the index without a detail request.
+
+The index only answers whether a stored row is still fresh. Dedupe within
+a crawl is ``dedupe.SeenSet``'s, on the canonical business ID, since
+businesses that share a name are not the same business.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS businesses (
+    state_code TEXT NOT NULL,
+    detail_url TEXT NOT NULL,
+    business_name TEXT NOT NULL,
+    content_hash TEXT,
+    fetched_at REAL,
+    last_seen REAL NOT NULL,
+    row TEXT,
+    PRIMARY KEY (state_code, detail_url)
+);
+"""
+
+# Indexes shared by every spider in the process, keyed by absolute path.
+# All spiders run on the reactor thread, so one connection per file avoids
+# two open write transactions locking each other out.
+_open_indexes = {}
+
+
+def listing_hash(*fields):
+    return hashlib.blake2b(json.dumps(fields).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class BusinessIndex:
+    def __init__(self, path, commit_every=200):
+        self.path = path
+        self.commit_every = commit_every
+        self.pending_writes = 0
+        self.users = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path):
+        path = os.path.abspath(path)
+        index = _open_indexes.get(path)
+        if index is None:
+            index = _open_indexes[path] = cls(path)
+        index.users += 1
+        return index
+
+    def release(self):
+        self.users -= 1
+        if self.users <= 0:
+            _open_indexes.pop(self.path, None)
+            self.conn.commit()
+            self.conn.close()
+        else:
+            self.conn.commit()
+
+    def visit(self, state_code, detail_url, business_name, content_hash, max_age):
+        """Mark the business as seen and return its stored row if still fresh.
+
+        Returns ``None`` when the detail page has to be fetched: the business
+        is new, its listing fields changed, or it was fetched more than
+        ``max_age`` seconds ago.
+        """
+        now = time.time()
+        stored = self.conn.execute(
+            'SELECT content_hash, fetched_at, row FROM businesses WHERE state_code = ? AND detail_url = ?',
+            (state_code, detail_url),
+        ).fetchone()
+        if stored is None:
+            self.conn.execute(
+                'INSERT INTO businesses (state_code, detail_url, business_name, last_seen) VALUES (?, ?, ?, ?)',
+                (state_code, detail_url, business_name, now),
+            )
+        else:
+            self.conn.execute(
+                'UPDATE businesses SET business_name = ?, last_seen = ? WHERE state_code = ? AND detail_url = ?',
+                (business_name, now, state_code, detail_url),
+            )
+        self._wrote()
+        if stored is None:
+            return None
+        stored_hash, fetched_at, row = stored
+        if row is None or stored_hash != content_hash or fetched_at is None or now - fetched_at > max_age:
+            return None
+        return json.loads(row)
+
+    def store(self, state_code, detail_url, content_hash, row):
+        self.conn.execute(
+            'UPDATE businesses SET content_hash = ?, fetched_at = ?, row = ? WHERE state_code = ? AND detail_url = ?',
+            (content_hash, time.time(), json.dumps(row), state_code, detail_url),
+        )
+        self._wrote()
+
+    def _wrote(self):
+        self.pending_writes += 1
+        if self.pending_writes >= self.commit_every:
+            self.conn.commit()
+            self.pending_writes = 0
@@ -0,0 +1,186 @@
+"""Append-only crawl journal for checkpointing and resuming a state's crawl.
+
+With ``PROCORE_CHECKPOINT_DIR`` set, every state appends one JSON line per
+event to ``<dir>/procore_<state>.jsonl``:
+- ``start``: when the crawl started;
+- ``detail``: a detail request was scheduled, with the listing record
+  (``parsing.ListingRecord``, as a list) needed to schedule it again;
+- ``row``: a row was kept, with the detail URL it came from, if any;
+- ``gone``: a detail page answered 404 or 410, so it has no row to wait for;
+- ``page``: a listing page was handled completely. It is written after the
+  ``detail`` and ``row`` entries of that page;
+- ``page_failed``: a listing page failed after its retries; it is fetched
+  again on resume;
+- ``last_page``: the last listing page with results, once ``termination.py``
+  has found it;
+- ``done``: the crawl found the end of the listings and handled every page
+  up to it, with no listing page failed and no detail request pending.
+  Only a journal without it can be resumed.
+
+Lines are never rewritten. They are buffered and flushed, with an fsync,
+at most every ``PROCORE_CHECKPOINT_INTERVAL`` seconds and when the spider
+closes, so a crash loses at most that much work. What survives is always a
+prefix of what was written, and a page is only marked done after
+everything it scheduled, so resuming never skips work. A line cut short by
+the crash is dropped when the journal is opened again.
+
+``read_journal`` folds a journal into a ``CrawlCheckpoint``: the pages
+done, the detail requests still pending, and the rows kept so far.
+"""
+import json
+import os
+import time
+
+ENTRY_START, ENTRY_DETAIL, ENTRY_ROW, ENTRY_GONE, ENTRY_PAGE, ENTRY_PAGE_FAILED, ENTRY_LAST_PAGE, ENTRY_DONE = (
+    'start', 'detail', 'row', 'gone', 'page', 'page_failed', 'last_page', 'done',
+)
+
+
+def journal_path(directory, state_code):
+    return os.path.join(directory, f'procore_{state_code.lower()}.jsonl')
+
+
+class CrawlCheckpoint:
+    """A state's crawl as recorded in its journal."""
+
+    def __init__(self):
+        self.started = None
+        self.pages_done = set()
+        self.pages_failed = set()  # Failed and not handled since
+        self.last_page = None
+        self.pending = {}  # detail URL -> ListingRecord fields, for requests with no row yet
+        self.rows = []
+        self.row_urls = []  # Detail URL of each row, None if it had none
+        self.done = False
+
+    def apply(self, entry):
+        kind = entry['t']
+        if kind == ENTRY_ROW:
+            self.rows.append(entry['row'])
+            self.row_urls.append(entry.get('url'))
+            self.pending.pop(entry.get('url'), None)
+        elif kind == ENTRY_DETAIL:
+            listing = entry['listing']
+            self.pending[listing[0]] = listing
+        elif kind == ENTRY_GONE:
+            self.pending.pop(entry['url'], None)
+        elif kind == ENTRY_PAGE:
+            self.pages_done.add(entry['page'])
+            self.pages_failed.discard(entry['page'])
+        elif kind == ENTRY_PAGE_FAILED:
+            self.pages_failed.add(entry['page'])
+        elif kind == ENTRY_LAST_PAGE:
+            page = entry['page']
+            self.last_page = page if self.last_page is None else min(self.last_page, page)
+        elif kind == ENTRY_START:
+            self.started = entry['started']
+        elif kind == ENTRY_DONE:
+            self.done = True
+
+    @property
+    def next_page(self):
+        page = 1
+        while page in self.pages_done:
+            page += 1
+        return page
+
+    def seen_businesses(self):
+        """Yield ``(detail_url, business_name)`` for every business already handled."""
+        for row, url in zip(self.rows, self.row_urls):
+            yield url, row.get('Business Name')
+        for url, listing in self.pending.items():
+            yield url, listing[1]
+
+
+def read_journal(path):
+    """Return ``(checkpoint, length)``; ``length`` is where the last whole line ends."""
+    checkpoint = CrawlCheckpoint()
+    length = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # Cut short by a crash
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            checkpoint.apply(entry)
+            length += len(line)
+    return checkpoint, length
+
+
+def resumable_states(directory):
+    """State codes with a journal in ``directory`` that did not finish."""
+    states = []
+    if not directory or not os.path.isdir(directory):
+        return states
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('procore_') and name.endswith('.jsonl')):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - 64))
+            finished = b'"t":"done"' in f.read()
+        if not finished:
+            states.append(name[len('procore_'):-len('.jsonl')])
+    return states
+
+
+class CrawlJournal:
+    def __init__(self, path, resume=False, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.checkpoint = None
+        self.entries = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if resume and os.path.exists(path):
+            self.checkpoint, length = read_journal(path)
+            with open(path, 'r+b') as f:
+                f.truncate(length)
+            self.file = open(path, 'a', encoding='utf-8')
+        else:
+            self.file = open(path, 'w', encoding='utf-8')
+        self.flushed_at = time.monotonic()
+
+    @classmethod
+    def open(cls, directory, state_code, resume=False, flush_interval=1.0):
+        return cls(journal_path(directory, state_code), resume, flush_interval)
+
+    def write(self, entry):
+        self.file.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+        self.file.write('\n')
+        self.entries += 1
+        if time.monotonic() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.flushed_at = time.monotonic()
+
+    def start(self, started):
+        self.write({'t': ENTRY_START, 'started': started})
+
+    def detail(self, listing):
+        self.write({'t': ENTRY_DETAIL, 'listing': listing})
+
+    def row(self, row, url=None):
+        self.write({'t': ENTRY_ROW, 'row': row, 'url': url})
+
+    def gone(self, url):
+        self.write({'t': ENTRY_GONE, 'url': url})
+
+    def page(self, page):
+        self.write({'t': ENTRY_PAGE, 'page': page})
+
+    def page_failed(self, page):
+        self.write({'t': ENTRY_PAGE_FAILED, 'page': page})
+
+    def last_page(self, page):
+        self.write({'t': ENTRY_LAST_PAGE, 'page': page})
+
+    def done(self):
+        self.write({'t': ENTRY_DONE})
+
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -0,0 +1,118 @@
+"""Tags listing text fragments with location, company type, market and trade.
+
+The keyword lists live in ``gazetteers/``: one ``<state>.txt`` per state with
+the state name, postal code and city names, plus ``company_types.txt``,
+``markets.txt`` and ``trades.txt`` shared by every state. Each keyword list
+is compiled once into a trie-shaped regular expression, so one ``search``
+over a business's fragments replaces a substring test per keyword.
+
+``classify`` keeps the rules of the loop that used to be inline in
+``ProcoreSpider.parse``. A fragment is a location if it contains a
+gazetteer name. Otherwise it is a company type or market if it equals one
+exactly, and otherwise a trade if it contains a trade name. When several
+fragments match the same field, the last one wins.
+"""
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+GAZETTEER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteers')
+
+# Used for states that have no gazetteer file yet
+US_STATES = {
+    'al': 'Alabama', 'ak': 'Alaska', 'az': 'Arizona', 'ar': 'Arkansas', 'ca': 'California',
+    'co': 'Colorado', 'ct': 'Connecticut', 'de': 'Delaware', 'dc': 'District of Columbia',
+    'fl': 'Florida', 'ga': 'Georgia', 'hi': 'Hawaii', 'id': 'Idaho', 'il': 'Illinois',
+    'in': 'Indiana', 'ia': 'Iowa', 'ks': 'Kansas', 'ky': 'Kentucky', 'la': 'Louisiana',
+    'me': 'Maine', 'md': 'Maryland', 'ma': 'Massachusetts', 'mi': 'Michigan', 'mn': 'Minnesota',
+    'ms': 'Mississippi', 'mo': 'Missouri', 'mt': 'Montana', 'ne': 'Nebraska', 'nv': 'Nevada',
+    'nh': 'New Hampshire', 'nj': 'New Jersey', 'nm': 'New Mexico', 'ny': 'New York',
+    'nc': 'North Carolina', 'nd': 'North Dakota', 'oh': 'Ohio', 'ok': 'Oklahoma', 'or': 'Oregon',
+    'pa': 'Pennsylvania', 'ri': 'Rhode Island', 'sc': 'South Carolina', 'sd': 'South Dakota',
+    'tn': 'Tennessee', 'tx': 'Texas', 'ut': 'Utah', 'vt': 'Vermont', 'va': 'Virginia',
+    'wa': 'Washington', 'wv': 'West Virginia', 'wi': 'Wisconsin', 'wy': 'Wyoming',
+}
+
+# Keywords never contain this, so a match cannot run across two fragments
+FRAGMENT_SEPARATOR = '\x00'
+
+
+def read_gazetteer(name):
+    path = os.path.join(GAZETTEER_DIR, f'{name}.txt')
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def state_locations(state_code):
+    state_code = state_code.lower()
+    if os.path.exists(os.path.join(GAZETTEER_DIR, f'{state_code}.txt')):
+        return read_gazetteer(state_code)
+    if state_code in US_STATES:
+        return [US_STATES[state_code], state_code.upper()]
+    return [state_code.upper()]
+
+
+def trie_regex(words):
+    """Compile ``words`` into a regex that shares common prefixes."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    if not trie:
+        return re.compile(r'(?!)')
+    return re.compile(_trie_pattern(trie))
+
+
+def _trie_pattern(node):
+    branches = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    word_ends_here = '' in node
+    if len(branches) == 1 and not word_ends_here:
+        return branches[0]
+    group = '(?:' + '|'.join(branches) + ')'
+    return group + '?' if word_ends_here else group
+
+
+class BusinessClassifier:
+    def __init__(self, locations, company_types, markets, trades):
+        self.location_re = trie_regex(locations)
+        self.trade_re = trie_regex(trades)
+        self.company_types = frozenset(company_types)
+        self.markets = frozenset(markets)
+
+    def classify(self, fragments):
+        """Return ``(location, company_type, market_services, trades_services)``."""
+        joined = FRAGMENT_SEPARATOR.join(fragments)
+        starts = []
+        offset = 0
+        for text in fragments:
+            starts.append(offset)
+            offset += len(text) + 1
+        location_hits = {bisect_right(starts, m.start()) - 1 for m in self.location_re.finditer(joined)}
+        trade_hits = {bisect_right(starts, m.start()) - 1 for m in self.trade_re.finditer(joined)}
+
+        location = company_type = market_services = trades_services = None
+        for index, text in enumerate(fragments):
+            if index in location_hits:
+                location = text
+            elif text in self.company_types:
+                company_type = text
+            elif text in self.markets:
+                market_services = text
+            elif index in trade_hits:
+                trades_services = text
+        return location, company_type, market_services, trades_services
+
+
+@lru_cache(maxsize=None)
+def classifier_for_state(state_code):
+    return BusinessClassifier(
+        state_locations(state_code),
+        read_gazetteer('company_types'),
+        read_gazetteer('markets'),
+        read_gazetteer('trades'),
+    )
@@ -0,0 +1,277 @@
+"""Local SQLite database of scraped businesses, queryable across crawls.
+
+``ResultDatabase.upsert`` writes a batch of rows in one transaction with
+``executemany``. Rows are keyed on their state and business ID
+(``dedupe.business_key``), so crawling a state again updates its rows in
+place instead of adding copies. Company types and trades are comma-joined
+lists in the rows. Each value is also stored as a tag, so filtering on one
+of them is an index lookup instead of a substring scan.
+
+Indexes cover the app's filters:
+- state, through the ``(state, business_key)`` key;
+- city, as ``(state, location)`` and ``location``;
+- company type and trade, through the ``(kind, value, state,
+  business_id)`` key of ``business_tags``.
+
+``query`` and ``count`` build one SQL statement from the filters, so only
+the rows shown ever leave the database. The most selective company type or
+trade filter is read from the tag index and the others are checked against
+it, and a count that needs nothing else is answered there without reading
+a business. Rows come back in the order they were first stored, so a page
+stops reading once it is full instead of sorting every match. A name
+search is a ``LIKE`` scan of the businesses still left.
+"""
+import os
+import sqlite3
+import time
+from collections import namedtuple
+
+from dedupe import business_key
+from exports import BUSINESS_KEY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS businesses (
+    id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    business_key TEXT NOT NULL,
+    business_name TEXT,
+    phone_number TEXT,
+    phone_status TEXT,
+    location TEXT,
+    company_type TEXT,
+    market_services TEXT,
+    trades_services TEXT,
+    updated_at REAL NOT NULL,
+    UNIQUE (state, business_key)
+);
+CREATE INDEX IF NOT EXISTS businesses_state_location ON businesses (state, location);
+CREATE INDEX IF NOT EXISTS businesses_location ON businesses (location);
+CREATE TABLE IF NOT EXISTS business_tags (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    state TEXT NOT NULL,
+    business_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, value, state, business_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS business_tags_business ON business_tags (business_id);
+"""
+
+UPSERT = """
+INSERT INTO businesses (
+    state, business_key, business_name, phone_number, phone_status, location,
+    company_type, market_services, trades_services, updated_at
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (state, business_key) DO UPDATE SET
+    business_name = excluded.business_name,
+    phone_number = excluded.phone_number,
+    phone_status = excluded.phone_status,
+    location = excluded.location,
+    company_type = excluded.company_type,
+    market_services = excluded.market_services,
+    trades_services = excluded.trades_services,
+    updated_at = excluded.updated_at
+"""
+
+# Result column -> database column
+COLUMN_NAMES = {
+    "State": "state",
+    "Business Name": "business_name",
+    "Phone Number": "phone_number",
+    "Phone Status": "phone_status",
+    "Location": "location",
+    "Company Type": "company_type",
+    "Market and Services": "market_services",
+    "Trades and Services": "trades_services",
+}
+
+# Tag kind -> row column split into tags
+TAG_COLUMNS = {
+    'company_type': "Company Type",
+    'trade': "Trades and Services",
+}
+
+# One company type or trade filter: its condition on business_tags and how many tags it matches
+TagFilter = namedtuple('TagFilter', 'kind values where params tags')
+
+# Databases shared by every spider in the process, keyed by absolute path.
+# Spiders write on the reactor thread, so one connection per file is enough.
+_open_databases = {}
+
+
+def placeholders(values):
+    return ', '.join('?' * len(values))
+
+
+def has_tag(tag_filter, state, business_id):
+    """SQL checking that the business ``business_id`` of ``state`` matches ``tag_filter``."""
+    return (
+        f"EXISTS (SELECT 1 FROM business_tags t WHERE t.kind = ? AND t.value IN ({placeholders(tag_filter.values)}) "
+        f"AND t.state = {state} AND t.business_id = {business_id})"
+    )
+
+
+def split_tags(value):
+    if not value:
+        return ()
+    return {tag.strip() for tag in value.split(',') if tag.strip()}
+
+
+class ResultDatabase:
+    def __init__(self, path):
+        self.path = path
+        self.users = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def open(cls, path):
+        path = os.path.abspath(path)
+        database = _open_databases.get(path)
+        if database is None:
+            database = _open_databases[path] = cls(path)
+        database.users += 1
+        return database
+
+    def release(self):
+        self.users -= 1
+        if self.users <= 0:
+            _open_databases.pop(self.path, None)
+            self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def upsert(self, state, rows):
+        """Insert or update ``rows`` of ``state`` and their tags in one transaction."""
+        state = state.upper()
+        now = time.time()
+        keyed = {}
+        for row in rows:
+            # The last row of a business in the batch wins, as it would row by row
+            keyed[row.get(BUSINESS_KEY) or business_key(None, row.get("Business Name"))] = row
+        with self.conn:
+            self.conn.executemany(UPSERT, [
+                (
+                    state, key, row.get("Business Name"), row.get("Phone Number"), row.get("Phone Status"),
+                    row.get("Location"), row.get("Company Type"), row.get("Market and Services"),
+                    row.get("Trades and Services"), now,
+                )
+                for key, row in keyed.items()
+            ])
+            ids = {}
+            keys = list(keyed)
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                ids.update(self.conn.execute(
+                    f"SELECT business_key, id FROM businesses WHERE state = ? AND business_key IN ({placeholders(chunk)})",
+                    [state, *chunk],
+                ))
+            self.conn.executemany('DELETE FROM business_tags WHERE business_id = ?', [(i,) for i in ids.values()])
+            self.conn.executemany('INSERT OR IGNORE INTO business_tags VALUES (?, ?, ?, ?)', [
+                (kind, tag, state, ids[key])
+                for key, row in keyed.items()
+                for kind, column in TAG_COLUMNS.items()
+                for tag in split_tags(row.get(column))
+            ])
+        return len(keyed)
+
+    def _tag_filters(self, states, company_types, trades):
+        """A ``TagFilter`` per chosen tag kind, fewest matching tags first."""
+        filters = []
+        for kind, values in (('company_type', company_types), ('trade', trades)):
+            if values:
+                where = f"kind = ? AND value IN ({placeholders(values)})"
+                params = [kind, *values]
+                if states:
+                    where += f" AND state IN ({placeholders(states)})"
+                    params.extend(states)
+                tags = self.conn.execute(f"SELECT COUNT(*) FROM business_tags WHERE {where}", params).fetchone()[0]
+                filters.append(TagFilter(kind, values, where, params, tags))
+        return sorted(filters, key=lambda f: f.tags)
+
+    def _where(self, tag_filters, states=(), cities=(), name=None, rows_wanted=None):
+        """Return ``(where, params)``.
+
+        The most selective tag filter drives the query through its index when
+        that reads fewer tags than scanning businesses in order until
+        ``rows_wanted`` of them match; the others are checked per business.
+        """
+        clauses = []
+        params = []
+        checked = list(tag_filters)
+        if checked:
+            if rows_wanted is None:
+                drive = True
+            else:
+                total = self.conn.execute('SELECT MAX(id) FROM businesses').fetchone()[0] or 0
+                drive = checked[0].tags ** 2 <= rows_wanted * total
+            if drive:
+                first = checked.pop(0)
+                clauses.append(f"id IN (SELECT business_id FROM business_tags WHERE {first.where})")
+                params.extend(first.params)
+        for tag_filter in checked:
+            clauses.append(has_tag(tag_filter, 'businesses.state', 'businesses.id'))
+            params.extend([tag_filter.kind, *tag_filter.values])
+        if states:
+            clauses.append(f"state IN ({placeholders(states)})")
+            params.extend(states)
+        if cities:
+            clauses.append(f"location IN ({placeholders(cities)})")
+            params.extend(cities)
+        if name:
+            clauses.append("business_name LIKE ? ESCAPE '\\'")
+            escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f'%{escaped}%')
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ''), params
+
+    def count(self, states=(), cities=(), company_types=(), trades=(), name=None):
+        states = [code.upper() for code in states]
+        tag_filters = self._tag_filters(states, company_types, trades)
+        if tag_filters and not cities and not name:
+            # Counted in the tag index, without reading a business: the tags
+            # of the most selective filter, each checked for the others
+            first, *others = tag_filters
+            if not others and len(first.values) == 1:
+                return first.tags
+            counted = 'COUNT(DISTINCT business_id)' if len(first.values) > 1 else 'COUNT(*)'
+            query = ' AND '.join([
+                f"SELECT {counted} FROM business_tags WHERE {first.where}",
+                *(has_tag(f, 'business_tags.state', 'business_tags.business_id') for f in others),
+            ])
+            params = [*first.params, *(param for f in others for param in (f.kind, *f.values))]
+            return self.conn.execute(query, params).fetchone()[0]
+        where, params = self._where(tag_filters, states, cities, name)
+        return self.conn.execute(f"SELECT COUNT(*) FROM businesses {where}", params).fetchone()[0]
+
+    def query(self, limit=500, offset=0, states=(), cities=(), company_types=(), trades=(), name=None):
+        """Return ``(columns, rows)`` matching the filters, in the order they were first stored."""
+        states = [code.upper() for code in states]
+        tag_filters = self._tag_filters(states, company_types, trades)
+        where, params = self._where(tag_filters, states, cities, name, rows_wanted=limit + offset)
+        rows = self.conn.execute(
+            f"SELECT {', '.join(COLUMN_NAMES.values())} FROM businesses {where} ORDER BY id LIMIT ? OFFSET ?",
+            [*params, limit, offset],
+        ).fetchall()
+        return list(COLUMN_NAMES), rows
+
+    def states(self):
+        return [state for state, in self.conn.execute('SELECT DISTINCT state FROM businesses ORDER BY state')]
+
+    def cities(self, states=()):
+        where, params = self._where([], [code.upper() for code in states])
+        where = f"{where} AND location IS NOT NULL" if where else "WHERE location IS NOT NULL"
+        return [city for city, in self.conn.execute(
+            f"SELECT DISTINCT location FROM businesses {where} ORDER BY location", params
+        )]
+
+    def tags(self, kind):
+        """Values of a tag kind, most common first."""
+        return [value for value, in self.conn.execute(
+            'SELECT value FROM business_tags WHERE kind = ? GROUP BY value ORDER BY COUNT(*) DESC, value', (kind,)
+        )]
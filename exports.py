@@ -0,0 +1,177 @@
+"""Batch writers for scraped rows.
+
+Every writer takes rows in batches through ``write_batch`` and keeps only
+its open file handle between batches, so memory does not grow with the size
+of the crawl. ``write_xlsx`` builds a workbook from any row iterator with
+openpyxl's write-only mode, which streams cells to disk instead of keeping a
+worksheet in memory.
+
+``export_artifact`` writes a finished result set as a download file, once
+per format and content digest, so the app can serve it again from disk.
+
+Parquet is written with ``pyarrow``, which is in requirements.txt. It is
+imported lazily, so the other formats do not pay for the import.
+"""
+import csv
+import hashlib
+import json
+import os
+import time
+
+COLUMNS = [
+    "Business Name",
+    "Phone Number",
+    "Phone Status",  # Set by phones.normalize_phone_rows
+    "Location",
+    "Company Type",
+    "Market and Services",
+    "Trades and Services",
+]
+
+# Rows also carry their business ID (``dedupe.business_key``) under this
+# key; every writer leaves it out and sinks keyed on the business use it
+BUSINESS_KEY = "_business_key"
+
+
+class CsvExporter:
+    def __init__(self, path, columns=COLUMNS):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class JsonLinesExporter:
+    def __init__(self, path, columns=COLUMNS):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.columns = columns
+
+    def write_batch(self, rows):
+        self.file.writelines(
+            json.dumps({column: row.get(column) for column in self.columns}, ensure_ascii=False) + '\n' for row in rows
+        )
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetExporter:
+    def __init__(self, path, columns=COLUMNS):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([(column, pa.string()) for column in columns])
+        self.writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write_batch(self, rows):
+        # Each batch becomes one row group
+        arrays = [self.pa.array([row.get(column) for row in rows], type=self.pa.string()) for column in self.columns]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'jsonl': JsonLinesExporter,
+    'parquet': ParquetExporter,
+}
+
+
+def iter_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def write_xlsx(rows, path, columns=COLUMNS, sheet_name='Sheet1'):
+    write_xlsx_values(([row.get(column) for column in columns] for row in rows), path, columns, sheet_name)
+
+
+def write_xlsx_values(value_rows, path, columns=COLUMNS, sheet_name='Sheet1'):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    sheet.append(columns)
+    for values in value_rows:
+        sheet.append(values)
+    workbook.save(path)
+
+
+# Download formats: file extension and MIME type
+ARTIFACT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+# Artifacts of older result sets are removed after this many seconds
+ARTIFACT_MAX_AGE = 24 * 3600
+
+
+def frame_digest(df):
+    """Content hash of a DataFrame, used to name its export artifacts."""
+    import pandas as pd
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(list(map(str, df.columns))).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def frame_values(df):
+    # openpyxl needs None for empty cells, not NaN; converting whole columns
+    # is much faster than checking cell by cell
+    columns = [series.astype(object).where(series.notna(), None).tolist() for _, series in df.items()]
+    return map(list, zip(*columns))
+
+
+def export_artifact(df, export_format, directory, digest=None):
+    """Path of ``df`` exported as ``export_format``, built on first use.
+
+    Files are named by content digest, so reruns of the app and other
+    sessions with the same results reuse the file instead of exporting
+    again. Files are written under a temporary name and renamed into place.
+    """
+    extension, _ = ARTIFACT_FORMATS[export_format]
+    digest = digest or frame_digest(df)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'procore_{digest}.{extension}')
+    if os.path.exists(path):
+        os.utime(path)  # Keep it from being pruned while still in use
+        return path
+
+    prune_artifacts(directory)
+    partial = f'{path}.{os.getpid()}.part'
+    if export_format == 'csv':
+        df.to_csv(partial, index=False)
+    elif export_format == 'csv.gz':
+        df.to_csv(partial, index=False, compression={'method': 'gzip', 'compresslevel': 6})
+    elif export_format == 'xlsx':
+        write_xlsx_values(frame_values(df), partial, list(df.columns))
+    elif export_format == 'parquet':
+        df.to_parquet(partial, index=False, engine='pyarrow', compression='zstd')
+    os.replace(partial, path)
+    return path
+
+
+def prune_artifacts(directory, max_age=ARTIFACT_MAX_AGE):
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.name.startswith('procore_') and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
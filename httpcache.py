@@ -0,0 +1,195 @@
+"""HTTP cache tier kept in a single compressed SQLite file.
+
+Scrapy's ``FilesystemCacheStorage`` writes one directory and six files per
+response, uncompressed and without a size limit, so long crawls run out of
+inodes before disk. ``SQLiteCacheStorage`` keeps every response as a
+zlib-compressed row in ``<HTTPCACHE_DIR>/<spider>.sqlite3``. It evicts the
+least recently used entries once ``HTTPCACHE_MAX_BYTES`` of compressed data
+is exceeded.
+
+``RevalidatingCachePolicy`` serves entries younger than
+``HTTPCACHE_EXPIRATION_SECS`` straight from the cache. Older entries that
+carry an ``ETag`` or ``Last-Modified`` header are revalidated with a
+conditional request, and a 304 reuses the cached body. Older entries
+without validators are downloaded again.
+
+Scrapy's ``HttpCacheMiddleware`` serves the cached response on a 304 but
+leaves the stored entry alone, so once an entry expired every later hit
+would revalidate again. ``RevalidatingCacheMiddleware`` takes its place and
+has the storage restart the entry's freshness and keep the validators the
+304 sent.
+"""
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import DummyPolicy
+from scrapy.http.headers import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    fingerprint BLOB PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    response_url TEXT NOT NULL,
+    headers BLOB NOT NULL,
+    body BLOB NOT NULL,
+    raw_size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+"""
+
+STORED_AT_META_KEY = '_httpcache_stored_at'
+
+# Headers of a 304 that update the cached response, as RFC 9111 section 4.3.4 asks
+REVALIDATED_HEADERS = [b'ETag', b'Last-Modified', b'Cache-Control', b'Expires', b'Date']
+
+
+class SQLiteCacheStorage:
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.max_bytes = settings.getint('HTTPCACHE_MAX_BYTES', 1024 ** 3)
+        self.compression_level = settings.getint('HTTPCACHE_COMPRESSION_LEVEL', 6)
+        self.conn = None
+
+    def open_spider(self, spider):
+        self.path = os.path.join(self.cachedir, f'{spider.name}.sqlite3')
+        # Autocommit keeps every write a short transaction, so the spiders of
+        # a multi-state crawl can share the file without holding locks
+        self.conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.stats = spider.crawler.stats
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        self.stored_bytes = self._total_stored_bytes()
+
+    def close_spider(self, spider):
+        stats = self.stats
+        hits = stats.get_value('httpcache/hit', 0) + stats.get_value('httpcache/revalidate', 0)
+        lookups = hits + stats.get_value('httpcache/miss', 0) + stats.get_value('httpcache/invalidate', 0)
+        if lookups:
+            stats.set_value('httpcache/hit_ratio', round(hits / lookups, 4))
+        entries, stored_bytes = self.conn.execute('SELECT COUNT(*), COALESCE(SUM(stored_size), 0) FROM responses').fetchone()
+        stats.set_value('httpcache/entries', entries)
+        stats.set_value('httpcache/stored_bytes', stored_bytes)
+        self.conn.close()
+        self.conn = None
+        stats.set_value('httpcache/inodes', self.inode_count())
+
+    def inode_count(self):
+        return sum(os.path.exists(self.path + suffix) for suffix in ('', '-wal', '-shm'))
+
+    def retrieve_response(self, spider, request):
+        fingerprint = self._fingerprinter.fingerprint(request)
+        entry = self.conn.execute(
+            'SELECT status, response_url, headers, body, stored_at FROM responses WHERE fingerprint = ?',
+            (fingerprint,),
+        ).fetchone()
+        if entry is None:
+            return None
+        status, url, raw_headers, body, stored_at = entry
+        self.conn.execute('UPDATE responses SET accessed_at = ? WHERE fingerprint = ?', (time.time(), fingerprint))
+        # The policy needs the entry's age; Response objects have no meta of their own
+        request.meta[STORED_AT_META_KEY] = stored_at
+        headers = Headers(headers_raw_to_dict(zlib.decompress(raw_headers)))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        raw_headers = headers_dict_to_raw(response.headers)
+        headers = zlib.compress(raw_headers, self.compression_level)
+        body = zlib.compress(response.body, self.compression_level)
+        raw_size = len(raw_headers) + len(response.body)
+        stored_size = len(headers) + len(body)
+        now = time.time()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self._fingerprinter.fingerprint(request), request.url, response.status, response.url,
+             headers, body, raw_size, stored_size, now, now),
+        )
+        self.stats.inc_value('httpcache/compression_saved_bytes', raw_size - stored_size)
+        self.stored_bytes += stored_size
+        if self.stored_bytes > self.max_bytes:
+            self._evict()
+
+    def refresh_response(self, spider, request, response, validation):
+        """Restart the freshness of ``response``, validated by the 304 ``validation``."""
+        for name in REVALIDATED_HEADERS:
+            values = validation.headers.getlist(name)
+            if values:
+                response.headers.setlist(name, values)
+        raw_headers = headers_dict_to_raw(response.headers)
+        headers = zlib.compress(raw_headers, self.compression_level)
+        fingerprint = self._fingerprinter.fingerprint(request)
+        entry = self.conn.execute('SELECT length(headers) FROM responses WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        if entry is None:
+            return
+        now = time.time()
+        self.conn.execute(
+            'UPDATE responses SET headers = ?, raw_size = ?, stored_size = stored_size - length(headers) + ?, '
+            'stored_at = ?, accessed_at = ? WHERE fingerprint = ?',
+            (headers, len(raw_headers) + len(response.body), len(headers), now, now, fingerprint),
+        )
+        self.stored_bytes += len(headers) - entry[0]
+
+    def _total_stored_bytes(self):
+        return self.conn.execute('SELECT COALESCE(SUM(stored_size), 0) FROM responses').fetchone()[0]
+
+    def _evict(self):
+        # Other spiders may share the file, so recount before deleting, then
+        # drop least recently used entries until 90% of the budget is left
+        self.stored_bytes = self._total_stored_bytes()
+        target = self.max_bytes * 0.9
+        while self.stored_bytes > target:
+            evicted = self.conn.execute(
+                'SELECT fingerprint, stored_size FROM responses ORDER BY accessed_at LIMIT 100'
+            ).fetchall()
+            if not evicted:
+                break
+            self.conn.executemany('DELETE FROM responses WHERE fingerprint = ?', [(f,) for f, _ in evicted])
+            self.stored_bytes -= sum(size for _, size in evicted)
+            self.stats.inc_value('httpcache/evicted', len(evicted))
+
+
+class RevalidatingCachePolicy(DummyPolicy):
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        stored_at = request.meta.get(STORED_AT_META_KEY)
+        if self.expiration_secs <= 0 or stored_at is None or time.time() - stored_at < self.expiration_secs:
+            return True
+        etag = cachedresponse.headers.get(b'ETag')
+        last_modified = cachedresponse.headers.get(b'Last-Modified')
+        if etag:
+            request.headers[b'If-None-Match'] = etag
+        if last_modified:
+            request.headers[b'If-Modified-Since'] = last_modified
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status == 304
+
+
+class RevalidatingCacheMiddleware(HttpCacheMiddleware):
+    """``HttpCacheMiddleware`` that stores what a 304 revalidation tells about an entry."""
+
+    def process_response(self, request, response, spider):
+        cachedresponse = request.meta.get('cached_response')
+        served = super().process_response(request, response, spider)
+        if served is cachedresponse and response.status == 304:
+            refresh_response = getattr(self.storage, 'refresh_response', None)
+            if refresh_response is not None:
+                refresh_response(spider, request, cachedresponse, response)
+        return served
@@ -0,0 +1,153 @@
+"""Crawl instrumentation: download latency, queue depth and profiling.
+
+``CrawlInstrumentation`` is a Scrapy extension. It records into the crawler
+stats:
+- a download latency histogram per request type (the callback name), as
+  ``latency/<callback>/<bucket>`` counts plus ``count`` and ``total``;
+- the scheduler queue depth and downloads in flight, sampled every
+  ``PROCORE_DEPTH_INTERVAL`` seconds, as ``scheduler/depth`` (latest) and
+  ``scheduler/depth_max``. The samples themselves are kept in
+  ``depth_samples`` for plotting.
+
+With ``PROCORE_PROFILE`` set to ``cprofile`` or ``pyinstrument``, the reactor
+thread is profiled while any spider runs. Spiders of a multi-state crawl
+share one profiler, because a thread can only run one at a time. The
+report is saved under ``PROCORE_PROFILE_DIR`` when the last of them closes.
+"""
+import logging
+import os
+import time
+from collections import deque
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds; the last bucket catches everything slower
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LATENCY_LABELS = tuple(f'le_{int(bound * 1000)}ms' for bound in LATENCY_BUCKETS) + ('slower',)
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# The profiler shared by every spider on the reactor thread
+_profiling = {'profiler': None, 'kind': None, 'users': 0}
+
+
+def latency_label(seconds):
+    for bound, label in zip(LATENCY_BUCKETS, LATENCY_LABELS):
+        if seconds <= bound:
+            return label
+    return LATENCY_LABELS[-1]
+
+
+class CrawlInstrumentation:
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PROCORE_INSTRUMENTATION', True):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.depth_interval = settings.getfloat('PROCORE_DEPTH_INTERVAL', 1.0)
+        self.depth_samples = deque(maxlen=3600)
+        self.depth_task = None
+        self.opened_at = None
+        self.profile_kind = (settings.get('PROCORE_PROFILE') or '').lower() or None
+        if self.profile_kind and self.profile_kind not in PROFILERS:
+            raise NotConfigured(f"PROCORE_PROFILE must be one of {', '.join(PROFILERS)}")
+        self.profile_dir = settings.get('PROCORE_PROFILE_DIR', 'data/profiles')
+        self.profile_report = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        self.opened_at = time.monotonic()
+        if self.depth_interval > 0:
+            self.depth_task = task.LoopingCall(self.sample_depth)
+            self.depth_task.start(self.depth_interval, now=True)
+        if self.profile_kind:
+            self.start_profiler()
+
+    def spider_closed(self, spider):
+        if self.depth_task is not None and self.depth_task.running:
+            self.depth_task.stop()
+        if self.profile_kind:
+            self.stop_profiler(spider)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return  # Served from the HTTP cache
+        kind = getattr(request.callback, '__name__', 'parse')
+        self.stats.inc_value(f'latency/{kind}/{latency_label(latency)}')
+        self.stats.inc_value(f'latency/{kind}/count')
+        self.stats.inc_value(f'latency/{kind}/total', latency)
+
+    def sample_depth(self):
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return
+        queued = len(engine.slot.scheduler)
+        in_flight = len(engine.downloader.active)
+        self.depth_samples.append((round(time.monotonic() - self.opened_at, 3), queued, in_flight))
+        self.stats.set_value('scheduler/depth', queued)
+        self.stats.max_value('scheduler/depth_max', queued)
+        self.stats.max_value('downloader/in_flight_max', in_flight)
+
+    def start_profiler(self):
+        if _profiling['users'] == 0:
+            if self.profile_kind == 'pyinstrument':
+                try:
+                    from pyinstrument import Profiler
+                except ImportError:
+                    logger.warning("pyinstrument is not installed, profiling with cProfile instead")
+                    self.profile_kind = 'cprofile'
+            if self.profile_kind == 'cprofile':
+                import cProfile
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                profiler = Profiler()
+                profiler.start()
+            _profiling.update(profiler=profiler, kind=self.profile_kind)
+        _profiling['users'] += 1
+
+    def stop_profiler(self, spider):
+        _profiling['users'] -= 1
+        if _profiling['users'] > 0:
+            return
+        profiler, kind = _profiling['profiler'], _profiling['kind']
+        _profiling.update(profiler=None, kind=None)
+        os.makedirs(self.profile_dir, exist_ok=True)
+        stem = os.path.join(self.profile_dir, f"{spider.name}_{time.strftime('%Y%m%d-%H%M%S')}")
+        if kind == 'cprofile':
+            import io
+            import pstats
+            profiler.disable()
+            path = stem + '.prof'
+            profiler.dump_stats(path)
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(30)
+            self.profile_report = report.getvalue()
+        else:
+            profiler.stop()
+            path = stem + '.html'
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            self.profile_report = profiler.output_text()
+        self.stats.set_value('profile/path', path)
+        logger.info("Saved %s profile to %s", kind, path)
+
+
+def find_instrumentation(crawler):
+    extensions = getattr(crawler, 'extensions', None)
+    for extension in getattr(extensions, 'middlewares', ()):
+        if isinstance(extension, CrawlInstrumentation):
+            return extension
+    return None
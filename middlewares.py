@@ -0,0 +1,337 @@
+import math
+import time
+from array import array
+from collections import defaultdict
+from email.utils import parsedate_to_datetime
+
+from scrapy import signals
+from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http.headers import Headers
+
+# Weight of the newest response in a slot's smoothed latency
+LATENCY_SMOOTHING = 0.1
+# How fast a slot's best latency drifts up per response, so a site that
+# slows down for good does not keep the target at its minimum
+BEST_LATENCY_DRIFT = 0.001
+# Round trips spent just under the last throttled concurrency before the
+# target tries one more; each failed probe costs a cut and maybe a pause
+PROBE_ROUNDS = 20
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted sequence
+    if not sorted_values:
+        return None
+    rank = min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+class ListingCutoffMiddleware:
+    """Drops requests the crawl no longer needs before they are downloaded.
+
+    With a pagination window several listing pages are requested ahead of the
+    one being parsed. Once the spider knows the last page (``spider.end``, see
+    ``termination.py``) every queued or in-flight request for a later page is
+    discarded here instead of being downloaded and parsed. Once the spider is
+    stopping, every queued request is: the downloads already in flight are
+    left to finish and their callbacks still run, so the crawl drains instead
+    of fetching its queue. The listing pages that do come back are recorded
+    on ``spider.end``, which counts those past the last page as wasted.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _check_page(self, request):
+        page = request.meta.get('page')
+        end = getattr(self.crawler.spider, 'end', None)
+        if page is not None and end is not None and end.past_end(page):
+            self.crawler.stats.inc_value('pagination/cancelled')
+            raise IgnoreRequest(f"Listing page {page} is past the last page")
+
+    def process_request(self, request, spider=None):
+        if getattr(self.crawler.spider, 'stop_requested', False):
+            self.crawler.stats.inc_value('termination/dropped')
+            raise IgnoreRequest("The crawl is stopping")
+        self._check_page(request)
+
+    def process_response(self, request, response, spider=None):
+        page = request.meta.get('page')
+        end = getattr(self.crawler.spider, 'end', None)
+        if page is not None and end is not None:
+            end.downloaded.add(page)
+        self._check_page(request)
+        return response
+
+
+class SharedHeadersMiddleware:
+    """Sets ``DEFAULT_REQUEST_HEADERS`` and ``USER_AGENT`` from one shared template.
+
+    Stands in for Scrapy's ``DefaultHeadersMiddleware`` and
+    ``UserAgentMiddleware``, which normalize every header name and value
+    again for each request. Here they are normalized once, when the crawler
+    starts, into bytes that every request shares; a request only gets its
+    own one-item value lists, which ``Headers`` needs to stay mutable.
+    Headers a request already has are kept, as with ``setdefault``.
+    """
+
+    def __init__(self, headers):
+        self.headers = tuple((key, tuple(values)) for key, values in headers.items())
+
+    @classmethod
+    def from_settings(cls, settings):
+        headers = Headers(settings.getdict('DEFAULT_REQUEST_HEADERS'))
+        if settings.get('USER_AGENT'):
+            headers.setdefault('User-Agent', settings['USER_AGENT'])
+        return cls(headers)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(crawler.settings)
+
+    def process_request(self, request, spider=None):
+        headers = request.headers
+        for key, values in self.headers:
+            # Keys are already normalized, so Headers' own lookups are skipped
+            if not dict.__contains__(headers, key):
+                dict.__setitem__(headers, key, list(values))
+
+
+class CallbackTimingMiddleware:
+    """Records how long each spider callback takes per response.
+
+    Sits closest to the spider, so only the time spent inside the callback
+    while it produces its output is counted, not the downstream handling of
+    the requests and items it yields. ``callback/<name>/count`` and
+    ``total`` (seconds) are updated after every response; ``p50`` and
+    ``p99`` are added when the spider closes.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.samples = defaultdict(lambda: array('d'))
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def process_spider_output(self, response, result, spider=None):
+        callback = response.request.callback
+        return self._timed(result, getattr(callback, '__name__', 'parse'))
+
+    def _timed(self, result, name):
+        elapsed = 0.0
+        iterator = iter(result)
+        while True:
+            started = time.perf_counter()
+            try:
+                output = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            elapsed += time.perf_counter() - started
+            yield output
+        self.samples[name].append(elapsed)
+        self.crawler.stats.inc_value(f'callback/{name}/count')
+        self.crawler.stats.inc_value(f'callback/{name}/total', elapsed)
+
+    def spider_closed(self, spider):
+        stats = self.crawler.stats
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            stats.set_value(f'callback/{name}/p50', round(percentile(ordered, 0.50), 6))
+            stats.set_value(f'callback/{name}/p99', round(percentile(ordered, 0.99), 6))
+
+
+def retry_after_seconds(value, now=None):
+    # Retry-After is either a number of seconds or an HTTP date
+    if not value:
+        return None
+    value = value.decode('latin-1') if isinstance(value, bytes) else value
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - (time.time() if now is None else now))
+
+
+class SlotController:
+    """AIMD state of one download slot."""
+
+    def __init__(self, target):
+        self.target = float(target)
+        self.ceiling = None  # Concurrency that was last throttled
+        self.latency = None  # Smoothed download latency
+        self.best_latency = None
+        self.hold_until = 0.0  # No further decrease before this time
+        self.paused_until = 0.0
+        self.saved_delay = None  # (delay, randomize_delay) while paused
+        self.resume_call = None
+
+
+class AdaptiveConcurrencyMiddleware:
+    """Adjusts each download slot's concurrency with an AIMD controller.
+
+    Every downloaded response moves the slot's target concurrency:
+    - a throttling status (``PROCORE_THROTTLE_CODES``) or a download error
+      multiplies it by ``PROCORE_CONCURRENCY_BACKOFF``, at most once per
+      round trip so one burst of errors counts once. The concurrency that
+      was throttled is remembered as the slot's ceiling;
+    - a smoothed latency above ``PROCORE_LATENCY_TOLERANCE`` times the
+      slot's best holds it where it is;
+    - any other response adds ``1 / target``, so the target grows by one
+      for every round trip's worth of responses. Below the ceiling it grows
+      by one per response instead, back to just under the ceiling within
+      a round trip, and at the ceiling it waits ``PROBE_ROUNDS`` round trips
+      before trying one more.
+    The target starts at the slot's ``CONCURRENT_REQUESTS_PER_DOMAIN`` and
+    stays between ``PROCORE_CONCURRENCY_MIN`` and ``CONCURRENT_REQUESTS``.
+
+    A ``Retry-After`` header pauses the slot for that long, capped at
+    ``PROCORE_RETRY_AFTER_MAX`` seconds, through the slot's download delay
+    as AutoThrottle does. Retrying the request is left to RetryMiddleware,
+    so this middleware must sit above it to see the response first.
+
+    ``concurrency/target`` (summed over slots) and ``concurrency/current``
+    (downloads in flight) are kept in the stats, along with
+    ``concurrency/decreases`` and the ``throttle/*`` counts.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('PROCORE_ADAPTIVE_CONCURRENCY'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = max(1, settings.getint('PROCORE_CONCURRENCY_MIN', 1))
+        self.max_concurrency = max(self.min_concurrency, settings.getint('CONCURRENT_REQUESTS'))
+        self.backoff = settings.getfloat('PROCORE_CONCURRENCY_BACKOFF', 0.5)
+        self.latency_tolerance = settings.getfloat('PROCORE_LATENCY_TOLERANCE', 2.0)
+        self.retry_after_max = settings.getfloat('PROCORE_RETRY_AFTER_MAX', 60.0)
+        self.throttle_codes = {int(code) for code in settings.getlist('PROCORE_THROTTLE_CODES', [429, 503])}
+        self.controllers = {}  # download slot key -> SlotController
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _slot(self, request):
+        key = request.meta.get('download_slot')
+        engine = self.crawler.engine
+        if key is None or engine is None:
+            return None, None  # Never reached the downloader, e.g. a cache hit
+        slot = engine.downloader.slots.get(key)
+        if slot is None:
+            return None, None
+        controller = self.controllers.get(key)
+        if controller is None:
+            target = min(max(slot.concurrency, self.min_concurrency), self.max_concurrency)
+            controller = self.controllers[key] = SlotController(target)
+        return slot, controller
+
+    def process_response(self, request, response, spider=None):
+        slot, controller = self._slot(request)
+        if slot is None:
+            return response
+        now = time.monotonic()
+        latency = request.meta.get('download_latency')
+        if response.status in self.throttle_codes:
+            self.stats.inc_value('throttle/responses')
+            self._decrease(controller, now, latency)
+            pause = retry_after_seconds(response.headers.get('Retry-After'))
+            if pause:
+                self._pause(slot, controller, min(pause, self.retry_after_max))
+        elif latency is not None and self._congested(controller, latency):
+            # Slow but successful: hold the target rather than cut it, since
+            # latency also rises when this process, not the site, is busy
+            self.stats.inc_value('throttle/slow_responses')
+        else:
+            self._increase(controller)
+        self._apply(slot, controller)
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        if not isinstance(exception, RetryMiddleware.EXCEPTIONS_TO_RETRY):
+            return None
+        slot, controller = self._slot(request)
+        if slot is not None:
+            self.stats.inc_value('throttle/errors')
+            self._decrease(controller, time.monotonic(), controller.latency)
+            self._apply(slot, controller)
+        return None
+
+    def _congested(self, controller, latency):
+        if controller.latency is None:
+            controller.latency = controller.best_latency = latency
+            return False
+        controller.latency += LATENCY_SMOOTHING * (latency - controller.latency)
+        controller.best_latency = min(controller.latency, controller.best_latency * (1 + BEST_LATENCY_DRIFT))
+        return controller.latency > self.latency_tolerance * controller.best_latency
+
+    def _increase(self, controller):
+        ceiling = controller.ceiling
+        if ceiling is None:
+            step = 1 / controller.target
+        elif controller.target < ceiling - 1:
+            step = min(1.0, ceiling - 1 - controller.target)
+        else:
+            step = 1 / (controller.target * PROBE_ROUNDS)
+        controller.target = min(self.max_concurrency, controller.target + step)
+
+    def _decrease(self, controller, now, latency):
+        if now < controller.hold_until:
+            return
+        controller.ceiling = max(self.min_concurrency + 1, int(controller.target))
+        controller.target = max(self.min_concurrency, controller.target * self.backoff)
+        # Responses already in flight were sent at the old concurrency; give
+        # them a round trip to come back before cutting again. A 429 comes
+        # back at once, so its own latency is no measure of a round trip.
+        controller.hold_until = now + max(latency or 0.0, controller.latency or 1.0)
+        self.stats.inc_value('concurrency/decreases')
+
+    def _apply(self, slot, controller):
+        slot.concurrency = max(self.min_concurrency, int(controller.target))
+        self.stats.set_value('concurrency/target', round(sum(c.target for c in self.controllers.values()), 2))
+        self.stats.max_value('concurrency/target_max', slot.concurrency)
+        slots = self.crawler.engine.downloader.slots.values()
+        self.stats.set_value('concurrency/current', sum(len(s.transferring) for s in slots))
+
+    def _pause(self, slot, controller, seconds):
+        from twisted.internet import reactor
+
+        # The downloader holds a slot's queue until its delay has passed
+        # since the last request went out
+        now = time.time()
+        until = now + seconds
+        if until <= controller.paused_until:
+            return
+        if controller.saved_delay is None:
+            controller.saved_delay = (slot.delay, slot.randomize_delay)
+        controller.paused_until = until
+        slot.delay, slot.randomize_delay, slot.lastseen = seconds, False, now
+        if controller.resume_call is not None and controller.resume_call.active():
+            controller.resume_call.reset(seconds)
+        else:
+            controller.resume_call = reactor.callLater(seconds, self._resume, slot, controller)
+        self.stats.inc_value('throttle/retry_after_pauses')
+        self.stats.inc_value('throttle/retry_after_seconds', seconds)
+
+    def _resume(self, slot, controller):
+        slot.delay, slot.randomize_delay = controller.saved_delay
+        controller.saved_delay = None
+        controller.resume_call = None
+
+    def spider_closed(self, spider):
+        for controller in self.controllers.values():
+            if controller.resume_call is not None and controller.resume_call.active():
+                controller.resume_call.cancel()
@@ -0,0 +1,67 @@
+"""Process pool that parses response bodies off the reactor thread.
+
+``ParserPool.run`` submits a function from ``parsing`` to a
+``ProcessPoolExecutor`` and returns a Deferred that fires on the reactor
+thread with its result. A ``DeferredSemaphore`` keeps at most
+``max_pending`` jobs in the pool; later calls wait on the reactor without
+holding a worker. While a callback awaits its job, Scrapy counts the
+response against ``SCRAPER_SLOT_MAX_ACTIVE_SIZE``, so a saturated pool also
+slows down downloads instead of letting parsed-later bodies pile up.
+
+Workers are spawned rather than forked because the crawling process
+already runs the reactor thread. Spiders asking for the same worker count
+and ``max_pending`` share one pool, which is shut down when the last of
+them releases it.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from twisted.internet import defer
+
+# Open pools keyed by (workers, max_pending)
+_open_pools = {}
+
+
+class ParserPool:
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.users = 0
+        self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+        self.semaphore = defer.DeferredSemaphore(max_pending)
+
+    @classmethod
+    def open(cls, workers, max_pending=None):
+        key = (workers, max_pending or 2 * workers)
+        pool = _open_pools.get(key)
+        if pool is None:
+            pool = _open_pools[key] = cls(*key)
+        pool.users += 1
+        return pool
+
+    def release(self):
+        self.users -= 1
+        if self.users <= 0:
+            _open_pools.pop((self.workers, self.max_pending), None)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, func, *args):
+        return self.semaphore.run(self._submit, func, *args)
+
+    def _submit(self, func, *args):
+        from twisted.internet import reactor
+
+        result = defer.Deferred()
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda done: reactor.callFromThread(self._resolve, result, done))
+        return result
+
+    def _resolve(self, result, future):
+        if future.cancelled():
+            result.errback(defer.CancelledError())
+            return
+        error = future.exception()
+        if error is not None:
+            result.errback(error)
+        else:
+            result.callback(future.result())
@@ -0,0 +1,208 @@
+"""Page extraction that can run in the spider or in a parser worker process.
+
+``listing_page`` and ``detail_page`` take a Scrapy response and return only
+plain tuples and lists, so the same code serves the inline path and the
+process pool. ``parse_listing_body`` and ``parse_detail_body`` rebuild the
+response from its URL, body and encoding inside a worker and report the
+seconds spent parsing. This module must not import the spider: workers are
+spawned fresh and should only pay for the parsers.
+
+A listing page comes back as ``(divs, links, source, pagination)``. ``links`` has one
+entry per distinct business: ``(business_name, detail_page_link,
+classification, phone_number)``. ``divs`` lists, for every business div in
+page order, the indices of the links inside it. The spider walks ``divs``
+exactly as it used to walk the selectors, so which link a div contributes
+still depends on the businesses already seen.
+
+``source`` says where the businesses came from. Listing pages are rendered
+by Next.js and carry the search results, phone numbers included, in the
+``__NEXT_DATA__`` script, so ``json`` records are complete and need no
+detail request; the blob is cut out of the raw body with a regex, without
+building a selector tree. Pages without a usable blob fall back to the
+rendered HTML (``html``), whose links have no phone number. The blob also
+gives a ``Pagination`` record, which ``termination.ListingEnd`` reads the
+end of the results from; it is None for ``html``.
+
+A business that still needs its detail page travels with the request as a
+``ListingRecord``, the whole row but the phone number.
+"""
+import json
+import re
+import time
+from collections import namedtuple
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+from scrapy.http import HtmlResponse
+from scrapy.utils.response import get_base_url
+
+from classifier import classifier_for_state
+from phone_extractor import locate_phone
+
+SOURCE_JSON, SOURCE_HTML = 'json', 'html'
+
+NEXT_DATA_RE = re.compile(rb'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>', re.S)
+
+# Results on the page, total results and page size, as ``__NEXT_DATA__`` reports them
+Pagination = namedtuple('Pagination', 'results total page_size')
+
+# ``classification`` is ``(location, company_type, market_services, trades_services)``
+ListingRecord = namedtuple('ListingRecord', 'detail_url business_name classification content_hash')
+
+
+@lru_cache(maxsize=64)
+def url_origin(base_url):
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def join_url(response, href):
+    """``response.urljoin(href)``, without reparsing the base URL for root-relative links."""
+    # Every business link is root-relative; dot segments would need urljoin
+    if href.startswith('/') and not href.startswith('//') and '/.' not in href:
+        return url_origin(get_base_url(response)) + href
+    return response.urljoin(href)
+
+
+def link_details(link, response, classifier):
+    # Get business name from the link text or data attributes
+    business_name = link.css('::text').get()
+    if not business_name:
+        business_name = link.css('::attr(data-track-click)').get()
+        if business_name and ',' in business_name:
+            business_name = business_name.split(',')[-1].strip()
+    if not business_name:
+        return None
+
+    # Clean up business name
+    business_name = business_name.strip()
+    if not business_name or len(business_name) < 3:
+        return None
+
+    # Get the detail page link
+    detail_page_link = link.css('::attr(href)').get()
+    if detail_page_link:
+        detail_page_link = join_url(response, detail_page_link)
+
+    # Try to extract additional info from the link's parent elements
+    all_text = link.xpath('..').css('::text').getall()
+    clean_text = [text.strip() for text in all_text if text.strip() and len(text.strip()) > 1]
+    return business_name, detail_page_link, classifier.classify(clean_text), None
+
+
+def next_data(body):
+    """Return the page's ``__NEXT_DATA__`` state blob, or None."""
+    match = NEXT_DATA_RE.search(body)
+    if match is None:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+
+def joined(values):
+    values = [value.strip() for value in values if value and value.strip()]
+    return ', '.join(values) or None
+
+
+def record_details(record, response, base_path):
+    # The rendered link shows the display name (the DBA), not the legal name
+    business_name = ((record.get('display') or {}).get('name') or record.get('name') or '').strip()
+    slug = record.get('primarySlug')
+    if len(business_name) < 3 or not slug:
+        return None
+    address = record.get('primaryAddress') or {}
+    classification = (
+        (address.get('display') or {}).get('cityState') or None,
+        joined(record.get('businessTypes') or ()),
+        joined(record.get('constructionSectors') or ()),
+        joined(service.get('name') for service in record.get('providedServices') or ()),
+    )
+    # Same URL as the rendered link, so index keys match the HTML path
+    detail_page_link = join_url(response, f"{base_path}/p/{slug}")
+    return business_name, detail_page_link, classification, record.get('phone') or None
+
+
+def mount_path(response, route):
+    """The path the site is served under: the response path without the page route's segments.
+
+    ``route`` is the Next.js page, such as ``/[country]/[state]`` for
+    ``/network/us/ca``. Returns None if the path is too short for it.
+    """
+    depth = len([segment for segment in route.split('/') if segment])
+    segments = urlsplit(response.url).path.rstrip('/').split('/')
+    if depth == 0 or len(segments) <= depth:
+        return None
+    return '/'.join(segments[:-depth])
+
+
+def json_listing(response):
+    """Return ``(divs, links, pagination)`` from the state blob, or None to fall back to HTML."""
+    data = next_data(response.body)
+    try:
+        page_props = data['props']['pageProps']
+        results = page_props['initialResults']
+        records = results['results']
+    except (TypeError, KeyError):
+        return None
+    if not isinstance(records, list):
+        return None
+    # Not assetPrefix: that is where static assets live, possibly a CDN
+    route = data.get('page')
+    base_path = mount_path(response, route) if isinstance(route, str) else None
+    if base_path is None:
+        return None
+    links = [details for details in (record_details(r, response, base_path) for r in records) if details]
+    page_size = (page_props.get('initialPaginationData') or {}).get('pageSize')
+    pagination = Pagination(len(records), count_value(results.get('count')), count_value(page_size))
+    return [[index] for index in range(len(links))], links, pagination
+
+
+def count_value(value):
+    return value if isinstance(value, int) and value > 0 else None
+
+
+def listing_page(response, state_code, use_json=True):
+    """Return ``(divs, links, source, pagination)`` for a listing page; ``divs`` is empty past the last page."""
+    if use_json:
+        listing = json_listing(response)
+        if listing is not None:
+            divs, links, pagination = listing
+            return divs, links, SOURCE_JSON, pagination
+
+    classifier = classifier_for_state(state_code)
+    links = []
+    link_indices = {}  # lxml element -> index in links
+    divs = []
+    for business in response.css("div.sc-eCstZk.MuiBox-root"):
+        # Nested divs share links, so each link is extracted once
+        indices = []
+        for link in business.css('a[href*="/p/"]'):
+            index = link_indices.get(link.root)
+            if index is None:
+                index = link_indices[link.root] = len(links)
+                links.append(link_details(link, response, classifier))
+            if links[index] is not None:
+                indices.append(index)
+        divs.append(indices)
+    return divs, links, SOURCE_HTML, None
+
+
+def detail_page(response):
+    """Return ``(phone_number, stage, timings)`` for a detail page."""
+    timings = {}
+    phone_number, stage = locate_phone(response.selector, timings)
+    return phone_number, stage, timings
+
+
+def parse_listing_body(url, body, encoding, state_code, use_json=True):
+    started = time.perf_counter()
+    result = listing_page(HtmlResponse(url, body=body, encoding=encoding), state_code, use_json)
+    return result, time.perf_counter() - started
+
+
+def parse_detail_body(url, body, encoding):
+    started = time.perf_counter()
+    result = detail_page(HtmlResponse(url, body=body, encoding=encoding))
+    return result, time.perf_counter() - started
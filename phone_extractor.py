@@ -0,0 +1,266 @@
+"""Single-pass phone number extraction for business detail pages.
+
+``extract_phone`` returns exactly what the old cascade in
+``ProcoreSpider.parse_business_detail`` returned: four ``re`` patterns run
+over each ``<script>``, then 8 CSS selectors, then 5 XPath queries, each
+stage walking the whole document again. Here the scripts are scanned once
+with one precompiled pattern. If that finds nothing, a single walk over the
+element tree collects the first hit of every CSS and XPath rule, and the
+rules are then resolved in the cascade's order.
+
+``locate_phone`` also reports which stage found the number and the time
+spent in the script scan and in the tree walk, for the crawl stats.
+"""
+import re
+import time
+from bisect import bisect_right
+
+# Anchored on the literal "phone" so the regex engine can skip ahead with a
+# fast substring search. The opening quote is checked by hand: '"phone": "..."'
+# fills group 1 and "'phone': '...'" fills group 2.
+SCRIPT_PHONE_RE = re.compile(r'phone(?:":\s*"([^"]+)"|\':\s*\'([^\']+)\')')
+
+# cssselect splits class attributes on XML whitespace only
+XML_WHITESPACE_RE = re.compile(r'[ \t\r\n]+')
+
+NOT_AVAILABLE = "Not Available"
+
+# Slots for the first hit of each CSS selector, in cascade order
+CSS_BODY1, CSS_JSS_BODY1, CSS_BODY1_ATTR, CSS_SC_TYPOGRAPHY, CSS_TEL_TEXT, CSS_TEL_HREF, CSS_PHONE_ID, CSS_CONTACT_ID = range(8)
+# Slots for the first accepted candidate of each XPath query, in cascade order
+XPATH_BODY1, XPATH_DIV_PHONE_SPAN, XPATH_PHONE_SPAN_SIBLING, XPATH_PLUS, XPATH_PARENS = range(5)
+
+
+# Stages reported by locate_phone
+STAGE_SCRIPT, STAGE_CSS, STAGE_XPATH, STAGE_NONE = 'script', 'css', 'xpath', 'none'
+
+
+def extract_phone(selector):
+    """Return the phone number for a detail page, or "Not Available".
+
+    ``selector`` is a parsel/Scrapy ``Selector`` (``response.selector``).
+    """
+    return locate_phone(selector)[0]
+
+
+def locate_phone(selector, timings=None):
+    """Return ``(phone_number, stage)`` for a detail page.
+
+    ``stage`` is the cascade stage that found the number: ``script``,
+    ``css``, ``xpath``, or ``none`` for "Not Available". If ``timings`` is a
+    dict, the seconds spent scanning scripts and walking the tree are added
+    to its ``script`` and ``dom`` entries.
+    """
+    started = time.perf_counter()
+    root = selector.root
+    scripts = [script.text for script in root.iter('script') if script.text is not None]
+    phone_number = script_phone(scripts)
+    stage = STAGE_SCRIPT
+    scanned = time.perf_counter()
+    if timings is not None:
+        timings['script'] = timings.get('script', 0.0) + scanned - started
+    if phone_number is None:
+        phone_number, stage = dom_phone(root)
+        if timings is not None:
+            timings['dom'] = timings.get('dom', 0.0) + time.perf_counter() - scanned
+    if not phone_number or not phone_number.strip():
+        return NOT_AVAILABLE, STAGE_NONE
+    return phone_number, stage
+
+
+def looks_like_script_phone(value):
+    return '+' in value or '(' in value or value.replace('-', '').replace(' ', '').isdigit()
+
+
+def looks_like_text_phone(value):
+    digits = value.replace('-', '').replace(' ', '').replace('(', '').replace(')', '')
+    return bool(value) and (
+        value.startswith('+')
+        or ('(' in value and ')' in value)
+        or (digits.isdigit() and len(digits) >= 10)
+    )
+
+
+def script_phone(scripts):
+    """First acceptable "phone" value across the script texts.
+
+    Scripts are tried in order. Within a script the double-quoted form wins
+    over the single-quoted one, and each form is matched the way
+    ``re.findall`` would match it on that script alone.
+    """
+    if not scripts:
+        return None
+    payload = '\n'.join(scripts)
+    script_ends = []
+    offset = 0
+    for script in scripts:
+        offset += len(script)
+        script_ends.append(offset)
+        offset += 1
+
+    next_double = next_single = 0  # where each form's findall scan would resume
+    current_script = None
+    single_quoted = None  # acceptable single-quoted value in the current script
+    position = 0
+    while True:
+        match = SCRIPT_PHONE_RE.search(payload, position)
+        if match is None:
+            return single_quoted
+        position = match.start() + 1
+        start = match.start() - 1  # opening quote
+        end = match.end()
+        index = bisect_right(script_ends, match.start())
+        script_start = script_ends[index - 1] + 1 if index else 0
+        if start < script_start or end > script_ends[index]:
+            continue  # would span two scripts
+        if index != current_script:
+            if single_quoted is not None:
+                return single_quoted
+            current_script = index
+        double_value, single_value = match.groups()
+        if double_value is not None:
+            if payload[start] != '"' or start < next_double:
+                continue
+            next_double = end
+            if looks_like_script_phone(double_value):
+                return double_value.strip()
+        else:
+            if payload[start] != "'" or start < next_single:
+                continue
+            next_single = end
+            if single_quoted is None and looks_like_script_phone(single_value):
+                single_quoted = single_value.strip()
+
+
+def first_text(element):
+    # XPath's text() in a string context: the first text child, if any
+    if element.text is not None:
+        return element.text
+    for child in element:
+        if child.tail is not None:
+            return child.tail
+    return None
+
+
+class _ElementRules:
+    """Which CSS/XPath rules select the text children of one element."""
+
+    __slots__ = ('css', 'xpath', 'phone_span_seen', 'div_phone_span', 'jss_div', 'sc_div')
+
+    def __init__(self, element, parent):
+        tag = element.tag
+        css = []
+        xpath = []
+        self.phone_span_seen = False
+        self.div_phone_span = False
+        self.jss_div = parent.jss_div if parent else False
+        self.sc_div = parent.sc_div if parent else False
+
+        class_attr = element.get('class')
+        if tag == 'p':
+            has_body1_class = class_attr is not None and 'MuiTypography-body1' in XML_WHITESPACE_RE.split(class_attr)
+            if has_body1_class:
+                css.append(CSS_BODY1)
+                if parent and parent.jss_div:
+                    css.append(CSS_JSS_BODY1)
+            if class_attr is not None and 'MuiTypography-body1' in class_attr:
+                css.append(CSS_BODY1_ATTR)
+                xpath.append(XPATH_BODY1)
+            if class_attr is not None and 'MuiTypography' in class_attr and parent and parent.sc_div:
+                css.append(CSS_SC_TYPOGRAPHY)
+            if parent is not None:
+                if parent.div_phone_span:
+                    xpath.append(XPATH_DIV_PHONE_SPAN)
+                if parent.phone_span_seen:
+                    xpath.append(XPATH_PHONE_SPAN_SIBLING)
+            text = first_text(element)
+            if text is not None:
+                if '+' in text:
+                    xpath.append(XPATH_PLUS)
+                if '(' in text and ')' in text:
+                    xpath.append(XPATH_PARENS)
+        elif tag == 'a':
+            href = element.get('href')
+            if href is not None and href.startswith('tel:'):
+                css.append(CSS_TEL_TEXT)
+        elif tag == 'div':
+            if class_attr is not None:
+                self.jss_div = self.jss_div or 'jss' in class_attr
+                self.sc_div = self.sc_div or 'sc-' in class_attr
+            span = element.find('span')
+            self.div_phone_span = span is not None and 'Phone' in span.xpath('string()')
+        elif tag == 'span' and parent is not None:
+            text = first_text(element)
+            if text is not None and 'Phone' in text:
+                parent.phone_span_seen = True
+
+        test_id = element.get('data-test-id')
+        if test_id is not None:
+            if 'phone' in test_id:
+                css.append(CSS_PHONE_ID)
+            if 'contact' in test_id:
+                css.append(CSS_CONTACT_ID)
+
+        self.css = css
+        self.xpath = xpath
+
+
+def dom_phone(root):
+    """Resolve the CSS and XPath fallbacks from a single tree walk.
+
+    Returns ``(phone_number, stage)``.
+    """
+    css_hits = [None] * 8
+    xpath_hits = [None] * 5
+
+    def take_text(rules, text):
+        for slot in rules.css:
+            if css_hits[slot] is None:
+                css_hits[slot] = text
+        if rules.xpath:
+            candidate = text.strip()
+            if looks_like_text_phone(candidate):
+                for slot in rules.xpath:
+                    if xpath_hits[slot] is None:
+                        xpath_hits[slot] = candidate
+
+    def enter(element, parent):
+        rules = _ElementRules(element, parent)
+        if element.tag == 'a' and css_hits[CSS_TEL_HREF] is None:
+            href = element.get('href')
+            if href is not None and href.startswith('tel:'):
+                css_hits[CSS_TEL_HREF] = href
+        if element.text is not None:
+            take_text(rules, element.text)
+        stack.append((element, rules, iter(element)))
+
+    stack = []
+    enter(root, None)
+    while stack:
+        element, rules, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if stack and element.tail is not None:
+                take_text(stack[-1][1], element.tail)
+        elif isinstance(child.tag, str):
+            enter(child, rules)
+        elif child.tail is not None:
+            # Comments and processing instructions only contribute their tail
+            take_text(rules, child.tail)
+
+    phone_number = None
+    for phone_number in css_hits:
+        if phone_number and phone_number.strip():
+            phone_number = phone_number.strip()
+            if phone_number.startswith('tel:'):
+                phone_number = phone_number[4:]
+            break
+    if phone_number and phone_number.strip():
+        return phone_number, STAGE_CSS
+    # In the cascade a whitespace-only leftover from the last CSS selector
+    # ended the XPath stage after its first query
+    for candidate in (xpath_hits[:1] if phone_number else xpath_hits):
+        if candidate is not None:
+            return candidate, STAGE_XPATH
+    return phone_number, STAGE_CSS
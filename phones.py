@@ -0,0 +1,155 @@
+"""Normalization of scraped phone numbers to E.164, a batch at a time.
+
+Detail pages give phone numbers in whatever form the page used:
+"+16502887088", "+1-650-288-7088", "(650) 288-7088", ``tel:`` links with
+an extension, and now and then a sentence the extractor took for a number.
+``normalize_phones`` turns a column of them into E.164 numbers and a
+status:
+- ``valid``: a North American number with a possible area code and
+  exchange, or an international one of 8 to 15 digits;
+- ``suspect``: well formed but unlikely to be real: an N11 or impossible
+  area code or exchange, one digit repeated, or the fictional 555-0100 to
+  555-0199 range. The E.164 form is kept, so it can be checked by hand;
+- ``invalid``: not a phone number; the scraped text is kept;
+- ``missing``: no number on the page, "Not Available".
+
+Each pattern runs once over the batch in pyarrow's compute kernels rather
+than once per row in Python, and only over values not seen before. Results
+are cached by the scraped text, so a number seen on an earlier batch, in
+another state or in a replayed journal is a dict lookup. Without pyarrow
+``parse_phone`` applies the same rules one value at a time.
+``benchmarks.bench_phones`` measures both and checks they agree.
+"""
+import re
+from functools import reduce
+
+from phone_extractor import NOT_AVAILABLE
+
+PHONE_VALID = 'valid'
+PHONE_SUSPECT = 'suspect'
+PHONE_INVALID = 'invalid'
+PHONE_MISSING = 'missing'
+PHONE_STATUSES = [PHONE_VALID, PHONE_SUSPECT, PHONE_INVALID, PHONE_MISSING]
+
+# Patterns use the syntax shared by Python's re and pyarrow's RE2: no
+# backreferences, flags inline. Digits and whitespace are spelled out:
+# Python's \d takes any Unicode digit and its \s the vertical tab, RE2's
+# neither.
+
+# Leftovers of a tel: link and a trailing extension, dropped before parsing
+TEL_PREFIX_RE = r'(?i)^tel:[\t\n\f\r ]*'
+EXTENSION_RE = r'(?i)[\t\n\f\r ]*(?:ext\.?|extension|x|#)[\t\n\f\r ]*[0-9]{1,6}$'
+# Digits and the usual separators only; anything else is not a number
+PHONE_TEXT_RE = r'^\+?[0-9\t\n\f\r ().\-/]+$'
+NANP_RE = r'^\+1[2-9][0-9]{2}[2-9][0-9]{6}$'
+N11_RE = r'^\+1(?:[2-9]11|[0-9]{3}[2-9]11)'
+REPEATED_RE = r'^\+1?(?:0+|1+|2+|3+|4+|5+|6+|7+|8+|9+)$'
+FICTIONAL_RE = r'^\+1[0-9]{3}55501[0-9]{2}$'
+
+# Scraped text -> (number, status); cleared when it reaches this size. The
+# pipelines fill it on the reactor thread and the app on its script thread,
+# so a batch is resolved from its own dict and only then merged in.
+CACHE_SIZE = 100_000
+_cache = {}
+
+
+def normalize_phones(values):
+    """Return ``(numbers, statuses)`` lists for a sequence of scraped phone numbers."""
+    values = list(values)
+    resolved = {}
+    new = []
+    for value in set(values):
+        result = _cache.get(value)
+        if result is None:
+            new.append(value)
+        else:
+            resolved[value] = result
+    if new:
+        parsed = parse_phones(new)
+        resolved.update(parsed)
+        if len(_cache) + len(parsed) > CACHE_SIZE:
+            _cache.clear()
+        _cache.update(parsed)
+    results = [resolved[value] for value in values]
+    return [number for number, _ in results], [status for _, status in results]
+
+
+def parse_phones(values):
+    """Map each of ``values``, which should be distinct, to ``(number, status)``."""
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        return {value: parse_phone(value) for value in values}
+
+    text = pc.utf8_trim_whitespace(pa.array(values, pa.string(), from_pandas=True)).fill_null('')
+    missing = pc.or_(pc.equal(text, ''), pc.equal(pc.utf8_lower(text), NOT_AVAILABLE.lower()))
+    cleaned = pc.replace_substring_regex(pc.replace_substring_regex(text, TEL_PREFIX_RE, ''), EXTENSION_RE, '')
+    digits = pc.replace_substring_regex(cleaned, r'[^0-9]', '')
+    length = pc.utf8_length(digits)
+    plus = pc.starts_with(cleaned, '+')
+    # Without a country code only a North American number can be read
+    national = pc.and_(pc.invert(plus), pc.equal(length, 10))
+    e164 = pc.binary_join_element_wise('+', pc.if_else(national, pc.binary_join_element_wise('1', digits, ''), digits), '')
+    north_american = pc.starts_with(e164, '+1')
+    parsed = reduce(pc.and_, [
+        pc.match_substring_regex(cleaned, PHONE_TEXT_RE),
+        reduce(pc.or_, [plus, pc.equal(length, 10), pc.and_(pc.equal(length, 11), pc.starts_with(digits, '1'))]),
+        pc.greater_equal(length, 8),
+        pc.less_equal(length, 15),
+        pc.or_(pc.invert(north_american), pc.equal(pc.utf8_length(e164), 12)),
+    ])
+    suspect = reduce(pc.or_, [
+        pc.and_(north_american, pc.invert(pc.match_substring_regex(e164, NANP_RE))),
+        pc.and_(north_american, pc.match_substring_regex(e164, N11_RE)),
+        pc.match_substring_regex(e164, REPEATED_RE),
+        pc.match_substring_regex(e164, FICTIONAL_RE),
+    ])
+    statuses = pc.if_else(
+        missing, PHONE_MISSING, pc.if_else(parsed, pc.if_else(suspect, PHONE_SUSPECT, PHONE_VALID), PHONE_INVALID)
+    )
+    numbers = pc.if_else(missing, NOT_AVAILABLE, pc.if_else(parsed, e164, text))
+    return dict(zip(values, zip(numbers.to_pylist(), statuses.to_pylist())))
+
+
+def parse_phone(value):
+    """``(number, status)`` of one scraped phone number, by the rules of ``parse_phones``."""
+    text = value.strip() if isinstance(value, str) else ''
+    if not text or text.lower() == NOT_AVAILABLE.lower():
+        return NOT_AVAILABLE, PHONE_MISSING
+    cleaned = re.sub(EXTENSION_RE, '', re.sub(TEL_PREFIX_RE, '', text))
+    digits = re.sub(r'[^0-9]', '', cleaned)
+    plus = cleaned.startswith('+')
+    e164 = '+' + ('1' + digits if not plus and len(digits) == 10 else digits)
+    north_american = e164.startswith('+1')
+    if not (
+        re.search(PHONE_TEXT_RE, cleaned)
+        and (plus or len(digits) == 10 or (len(digits) == 11 and digits.startswith('1')))
+        and 8 <= len(digits) <= 15
+        and (not north_american or len(e164) == 12)
+    ):
+        return text, PHONE_INVALID
+    if (
+        (north_american and (not re.search(NANP_RE, e164) or re.search(N11_RE, e164)))
+        or re.search(REPEATED_RE, e164)
+        or re.search(FICTIONAL_RE, e164)
+    ):
+        return e164, PHONE_SUSPECT
+    return e164, PHONE_VALID
+
+
+def normalize_phone_rows(rows):
+    """Normalize the "Phone Number" of ``rows`` in place and set their "Phone Status"."""
+    numbers, statuses = normalize_phones([row.get("Phone Number") for row in rows])
+    for row, number, status in zip(rows, numbers, statuses):
+        row["Phone Number"] = number
+        row["Phone Status"] = status
+
+
+def normalize_phone_column(df):
+    """Normalize the "Phone Number" column of ``df`` in place and set its "Phone Status"."""
+    import pandas as pd
+
+    numbers, statuses = normalize_phones(df["Phone Number"])
+    df["Phone Number"] = numbers
+    df["Phone Status"] = pd.Categorical(statuses, categories=PHONE_STATUSES)
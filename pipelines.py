@@ -0,0 +1,165 @@
+import logging
+import os
+import time
+
+from scrapy.exceptions import NotConfigured
+from twisted.internet import threads
+
+from database import ResultDatabase
+from exports import EXPORTERS, iter_jsonl, write_xlsx
+from phones import normalize_phone_rows
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingExportPipeline:
+    """Streams scraped rows to per-state files while the crawl runs.
+
+    Rows are buffered up to ``PROCORE_EXPORT_BATCH_SIZE`` and then appended
+    to one file per format in ``PROCORE_EXPORT_FORMATS`` (``csv``, ``jsonl``,
+    ``parquet``) under ``PROCORE_EXPORT_DIR``, named ``procore_<state>.<ext>``.
+    Only the current batch is held in memory. Each batch's phone numbers
+    are normalized to E.164 in one pass before it is written (see
+    ``phones.py``).
+
+    ``xlsx`` cannot be appended to, so it is built once when the spider
+    closes by streaming the JSON Lines file back through openpyxl's
+    write-only mode, in a thread so the reactor keeps crawling. If ``jsonl`` was not requested it is written to a
+    spool file that is removed afterwards.
+    """
+
+    def __init__(self, export_dir, formats, batch_size):
+        self.export_dir = export_dir
+        self.formats = formats
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        export_dir = settings.get('PROCORE_EXPORT_DIR')
+        formats = [f.strip().lower() for f in settings.getlist('PROCORE_EXPORT_FORMATS') if f.strip()]
+        if not export_dir or not formats:
+            raise NotConfigured('PROCORE_EXPORT_DIR and PROCORE_EXPORT_FORMATS are required')
+        unknown = set(formats) - set(EXPORTERS) - {'xlsx'}
+        if unknown:
+            raise NotConfigured(f"Unknown export formats: {', '.join(sorted(unknown))}")
+        pipeline = cls(export_dir, formats, max(1, settings.getint('PROCORE_EXPORT_BATCH_SIZE', 1000)))
+        pipeline.crawler = crawler
+        return pipeline
+
+    def export_path(self, spider, extension):
+        state_code = getattr(spider, 'state_code', spider.name)
+        return os.path.join(self.export_dir, f'procore_{state_code}.{extension}')
+
+    def open_spider(self, spider):
+        os.makedirs(self.export_dir, exist_ok=True)
+        self.buffer = []
+        self.paths = {}
+        self.exporters = {}
+        formats = list(self.formats)
+        self.spool_path = None
+        if 'xlsx' in formats and 'jsonl' not in formats:
+            self.spool_path = self.export_path(spider, 'xlsx.jsonl')
+            formats.append('jsonl')
+        for export_format in formats:
+            if export_format == 'xlsx':
+                continue
+            path = self.spool_path if export_format == 'jsonl' and self.spool_path else self.export_path(spider, export_format)
+            try:
+                self.exporters[export_format] = EXPORTERS[export_format](path)
+            except ImportError as e:
+                logger.warning("Skipping %s export: %s", export_format, e)
+                continue
+            self.paths[export_format] = path
+
+    def process_item(self, item, spider):
+        self.buffer.append(dict(item))
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        if not self.buffer:
+            return
+        normalize_phone_rows(self.buffer)
+        for exporter in self.exporters.values():
+            exporter.write_batch(self.buffer)
+        self.crawler.stats.inc_value('export/rows', len(self.buffer))
+        self.crawler.stats.inc_value('export/batches')
+        self.buffer = []
+
+    def close_spider(self, spider):
+        self.flush()
+        for exporter in self.exporters.values():
+            exporter.close()
+        if 'xlsx' not in self.formats:
+            self.finish_exports()
+            return None
+        # openpyxl takes a while on a large state; a thread keeps the
+        # reactor, and with it the other states' crawls, running meanwhile
+        xlsx_path = self.export_path(spider, 'xlsx')
+        built = threads.deferToThread(write_xlsx, iter_jsonl(self.paths['jsonl']), xlsx_path)
+        built.addCallback(lambda _: self.finish_exports(xlsx_path))
+        return built
+
+    def finish_exports(self, xlsx_path=None):
+        if xlsx_path is not None:
+            self.paths['xlsx'] = xlsx_path
+        if self.spool_path:
+            os.remove(self.spool_path)
+            del self.paths['jsonl']
+        for export_format, path in self.paths.items():
+            self.crawler.stats.set_value(f'export/{export_format}', path)
+
+
+class DatabasePipeline:
+    """Bulk-upserts scraped rows into the SQLite database at ``PROCORE_DATABASE_PATH``.
+
+    Rows are buffered up to ``PROCORE_DATABASE_BATCH_SIZE`` and written in
+    one transaction per batch, keyed on state and business ID, so replayed
+    and re-crawled rows update the rows already stored. Rows without a
+    business name cannot be told apart and are not stored. Spiders writing
+    to the same file share one connection. See ``database.py``.
+    """
+
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('PROCORE_DATABASE_PATH')
+        if not path:
+            raise NotConfigured('PROCORE_DATABASE_PATH is not set')
+        pipeline = cls(path, max(1, settings.getint('PROCORE_DATABASE_BATCH_SIZE', 1000)))
+        pipeline.crawler = crawler
+        return pipeline
+
+    def open_spider(self, spider):
+        self.database = ResultDatabase.open(self.path)
+        self.state_code = getattr(spider, 'state_code', spider.name)
+        self.buffer = []
+
+    def process_item(self, item, spider):
+        if item.get("Business Name"):
+            self.buffer.append(dict(item))
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+        return item
+
+    def flush(self):
+        if not self.buffer:
+            return
+        started = time.perf_counter()
+        normalize_phone_rows(self.buffer)
+        self.database.upsert(self.state_code, self.buffer)
+        stats = self.crawler.stats
+        stats.inc_value('database/rows', len(self.buffer))
+        stats.inc_value('database/batches')
+        stats.inc_value('database/time', time.perf_counter() - started)
+        self.buffer = []
+
+    def close_spider(self, spider):
+        self.flush()
+        self.database.release()
@@ -1,125 +1,348 @@
 # ./procore_spider.py
+import time
+
 import scrapy
-from crochet import setup
-setup()
+from scrapy.spidermiddlewares.httperror import HttpError
+
+from business_index import BusinessIndex, listing_hash
+from checkpoint import CrawlJournal
+from dedupe import SeenSet, business_key
+from exports import BUSINESS_KEY
+from parsing import ListingRecord, detail_page, listing_page, parse_detail_body, parse_listing_body
+from results import ResultStore
+from termination import ListingEnd
+
 
 class ProcoreSpider(scrapy.Spider):
     name = "procore"
     state_code = "ca"  # Default state code
-    stop_requested = False  # Flag to stop the spider
-    page_number = 1
-
-    seen_business_names = set()
-    scraped_data = []
-    consecutive_empty_count = 0  # Counter for consecutive empty rows
+    page_window = None  # Listing pages kept in flight, defaults to PROCORE_PAGE_WINDOW
+    row_feed = None  # Optional RowFeed that gets every kept row as it is scraped
+    scraped_data = None  # ResultStore for kept rows, may be shared by several states
 
     custom_settings = {
-        "CONCURRENT_REQUESTS": 20,
-        "DOWNLOAD_DELAY": 0,
         "LOG_LEVEL": "ERROR",
         "TWISTED_REACTOR": "twisted.internet.selectreactor.SelectReactor",
+        "PROCORE_BASE_URL": "https://network.procore.com",
+        # Set on every request by SharedHeadersMiddleware, so requests are
+        # built without headers of their own
+        "USER_AGENT": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+        "DEFAULT_REQUEST_HEADERS": {
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+            "Upgrade-Insecure-Requests": "1",
+        },
+        "PROCORE_PAGE_WINDOW": 8,
+        "PROCORE_LISTING_FAILURE_LIMIT": 10,  # Listing pages failing in a row before no more are scheduled
+        "PROCORE_LISTING_JSON": True,  # Read listings from the page's __NEXT_DATA__, False forces the HTML parser
+        "PROCORE_INDEX_PATH": None,  # SQLite business index, enables incremental crawls
+        "PROCORE_INDEX_TTL": 7 * 24 * 3600,  # Seconds before a stored detail page is fetched again
+        "PROCORE_CHECKPOINT_DIR": None,  # Journal each state's progress here, see checkpoint.py
+        "PROCORE_CHECKPOINT_INTERVAL": 1.0,  # Seconds between journal flushes
+        "PROCORE_RESUME": False,  # Continue from the journal instead of starting again
+        "PROCORE_PARSE_WORKERS": 0,  # Parser processes; 0 parses on the reactor thread
+        "PROCORE_PARSE_MAX_PENDING": None,  # Parse jobs in the pool at once, defaults to 2 per worker
+        "PROCORE_KEEP_ROWS": True,  # Keep rows in scraped_data for the app; exports do not need it
+        "PROCORE_EXPORT_DIR": None,  # Stream rows to files here as they are scraped
+        "PROCORE_EXPORT_FORMATS": ["csv", "jsonl", "parquet", "xlsx"],
+        "PROCORE_EXPORT_BATCH_SIZE": 1000,
+        "PROCORE_DATABASE_PATH": None,  # Upsert rows into this SQLite database, see database.py
+        "PROCORE_DATABASE_BATCH_SIZE": 1000,  # Rows per upsert transaction
+        "DOWNLOADER_MIDDLEWARES": {
+            "middlewares.ListingCutoffMiddleware": 50,
+            "middlewares.SharedHeadersMiddleware": 400,
+            "scrapy.downloadermiddlewares.defaultheaders.DefaultHeadersMiddleware": None,
+            "scrapy.downloadermiddlewares.useragent.UserAgentMiddleware": None,
+            "middlewares.AdaptiveConcurrencyMiddleware": 560,  # Above RetryMiddleware
+            # Keeps the freshness a 304 revalidation renews, see httpcache.py
+            "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+            "httpcache.RevalidatingCacheMiddleware": 900,
+        },
+        "PROCORE_ADAPTIVE_CONCURRENCY": True,  # AIMD per-slot concurrency, see middlewares.py
+        "PROCORE_CONCURRENCY_MIN": 1,
+        "PROCORE_CONCURRENCY_BACKOFF": 0.5,  # Target is multiplied by this on throttling
+        "PROCORE_LATENCY_TOLERANCE": 2.0,  # Smoothed latency over best latency that counts as congestion
+        "PROCORE_THROTTLE_CODES": [429, 503],
+        "PROCORE_RETRY_AFTER_MAX": 60.0,  # Longest Retry-After pause honoured, in seconds
+        "SPIDER_MIDDLEWARES": {
+            "middlewares.CallbackTimingMiddleware": 950,
+        },
+        "ITEM_PIPELINES": {
+            "pipelines.StreamingExportPipeline": 300,
+            "pipelines.DatabasePipeline": 310,
+        },
+        "EXTENSIONS": {
+            "instrumentation.CrawlInstrumentation": 500,
+        },
+        "PROCORE_DEPTH_INTERVAL": 1.0,  # Seconds between queue depth samples
+        "PROCORE_PROFILE": None,  # "cprofile" or "pyinstrument" to profile the crawl
+        "PROCORE_PROFILE_DIR": "data/profiles",
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Crawl state lives on the instance so several states can be crawled
+        # at the same time on one reactor
+        self.state_code = self.state_code.lower()
+        self.stop_requested = False  # Flag to stop the spider
+        self.page_number = 1  # Next listing page to schedule
+        self.end = ListingEnd()  # Finds the last listing page, see termination.py
+        self.seen_businesses = SeenSet()  # Canonical IDs, see dedupe.py
+        if self.scraped_data is None:
+            self.scraped_data = ResultStore()
+        self.state_fields = {"State": self.state_code.upper()}
+        self.index = None
+        self.parser_pool = None
+        self.journal = None
+        self.pages_done = set()  # Listing pages finished by an earlier run
+        self.failed_pages = set()  # Listing pages that failed after their retries
+        self.failure_run = 0  # Listing pages failed since the last one handled
+        self.pending_details = set()  # Detail URLs requested that have no row yet
+        self.replay_rows = []  # Rows kept by an earlier run, sent through the pipelines again
+
     def start_requests(self):
-        self.base_url = f"https://network.procore.com/us/{self.state_code}?page="
-        url = self.base_url + str(self.page_number)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        yield scrapy.Request(url, headers=headers, callback=self.parse)
+        self.base_url = f"{self.settings.get('PROCORE_BASE_URL').rstrip('/')}/us/{self.state_code}?page="
+        self.page_window = max(1, int(self.page_window or self.settings.getint("PROCORE_PAGE_WINDOW", 1)))
+        self.failure_limit = self.settings.getint("PROCORE_LISTING_FAILURE_LIMIT", 10)
+        self.crawl_started = time.time()
+        index_path = self.settings.get("PROCORE_INDEX_PATH")
+        if index_path:
+            self.index = BusinessIndex.open(index_path)
+            self.index_ttl = self.settings.getfloat("PROCORE_INDEX_TTL")
+        self.keep_rows = self.settings.getbool("PROCORE_KEEP_ROWS", True)
+        self.listing_json = self.settings.getbool("PROCORE_LISTING_JSON", True)
+        parse_workers = self.settings.getint("PROCORE_PARSE_WORKERS", 0)
+        if parse_workers > 0:
+            from parser_pool import ParserPool
+            self.parser_pool = ParserPool.open(parse_workers, self.settings.getint("PROCORE_PARSE_MAX_PENDING") or None)
+        self.page_scheduled = {}
+        self.page_timings = []
+
+        checkpoint_dir = self.settings.get("PROCORE_CHECKPOINT_DIR")
+        if checkpoint_dir:
+            self.journal = CrawlJournal.open(
+                checkpoint_dir, self.state_code,
+                resume=self.settings.getbool("PROCORE_RESUME"),
+                flush_interval=self.settings.getfloat("PROCORE_CHECKPOINT_INTERVAL", 1.0),
+            )
+            if self.journal.checkpoint is not None:
+                yield from self.resume(self.journal.checkpoint)
+            else:
+                self.journal.start(self.crawl_started)
+
+        # The listing blob gives the result count, so the first page goes
+        # out alone and its count bounds the window; HTML pages cannot tell
+        yield from self.fill_window(1 if self.listing_json else self.page_window)
+
+    def resume(self, checkpoint):
+        # Pick up where the journal ends: finished pages are skipped, pending
+        # detail pages requested again and kept rows replayed
+        self.pages_done = set(checkpoint.pages_done)
+        self.end = ListingEnd(checkpoint.last_page)
+        for detail_url, business_name in checkpoint.seen_businesses():
+            self.seen_businesses.add(business_key(detail_url, business_name))
+        stats = self.crawler.stats
+        stats.set_value('checkpoint/pages_done', len(self.pages_done))
+        stats.set_value('checkpoint/pages_failed', len(checkpoint.pages_failed))
+        stats.set_value('checkpoint/pending_details', len(checkpoint.pending))
+        stats.set_value('checkpoint/replayed_rows', len(checkpoint.rows))
+        self.logger.info(
+            "Resuming %s: %d listing pages done, %d detail pages pending, %d rows kept",
+            self.state_code.upper(), len(self.pages_done), len(checkpoint.pending), len(checkpoint.rows),
+        )
+        if checkpoint.rows:
+            self.replay_rows = checkpoint.rows
+            # Items can only come from callbacks, so the rows ride on a data: URL
+            yield scrapy.Request('data:,', callback=self.replay, dont_filter=True, meta={'dont_cache': True})
+        for fields in checkpoint.pending.values():
+            yield self.detail_request(ListingRecord(*fields), journal=False)
+
+    def replay(self, response):
+        rows, self.replay_rows = self.replay_rows, []
+        for row in rows:
+            self.store_row(row)
+            yield row
+
+    def next_listing_page(self):
+        while self.page_number in self.pages_done:
+            self.page_number += 1
+        return self.page_number
+
+    def listing_request(self):
+        page = self.next_listing_page()
+        self.page_number += 1
+        self.page_scheduled[page] = time.time()
+        callback = self.parse_in_pool if self.parser_pool else self.parse
+        return scrapy.Request(self.base_url + str(page), callback=callback, errback=self.listing_failed, meta={'page': page})
+
+    def listing_failed(self, failure):
+        # A page that never reaches its callback gives its window slot back,
+        # or every failure would shrink the window for the rest of the crawl
+        page = failure.request.meta['page']
+        self.page_scheduled.pop(page, None)
+        # Pages dropped by ListingCutoffMiddleware are not failures
+        if not (self.stop_requested or self.end.past_end(page)):
+            self.failed_pages.add(page)
+            self.failure_run += 1
+            self.crawler.stats.inc_value('listing/failed')
+            if failure.check(HttpError):
+                error = f"HTTP {failure.value.response.status}"
+                self.crawler.stats.inc_value(f'listing/failed/{failure.value.response.status}')
+            else:
+                error = failure.getErrorMessage()
+            if self.journal is not None:
+                self.journal.page_failed(page)
+            self.logger.warning(f"Listing page {page} failed: {error}")
+            if self.failure_run == self.failure_limit:
+                self.logger.error(f"{self.failure_run} listing pages failed in a row; scheduling no more.")
+        yield from self.fill_window()
+
+    def detail_request(self, listing, journal=True):
+        # Headers come from SharedHeadersMiddleware, and the listing rides in
+        # cb_kwargs as the one tuple the journal also keeps
+        if journal and self.journal is not None:
+            self.journal.detail(listing)
+        self.pending_details.add(listing.detail_url)
+        return scrapy.Request(
+            listing.detail_url,
+            callback=self.parse_business_detail_in_pool if self.parser_pool else self.parse_business_detail,
+            errback=self.detail_failed,
+            cb_kwargs={'listing': listing},
+        )
+
+    def detail_failed(self, failure):
+        # The request stays pending in the journal, so a resume asks again,
+        # unless the page is gone for good
+        detail_url = failure.request.url
+        if failure.check(HttpError) and failure.value.response.status in (404, 410):
+            self.pending_details.discard(detail_url)
+            self.crawler.stats.inc_value('detail/gone')
+            if self.journal is not None:
+                self.journal.gone(detail_url)
+        elif not self.stop_requested:
+            self.crawler.stats.inc_value('detail/failed')
+
+    def keep_row(self, row, detail_url=None):
+        # For sinks keyed on the business; exports leave it out
+        row[BUSINESS_KEY] = business_key(detail_url, row.get("Business Name"))
+        self.store_row(row)
+        if self.journal is not None:
+            self.journal.row(row, detail_url)
+
+    def store_row(self, row):
+        if self.keep_rows:
+            self.scraped_data.append(row, self.state_fields)
+        if self.row_feed is not None:
+            self.row_feed.publish(self.state_code, row)
+
+    def fill_window(self, size=None):
+        # Keep a sliding window of listing pages in flight instead of waiting
+        # for page N to be parsed before requesting page N+1, and schedule
+        # nothing past the end of the results
+        while (
+            not self.stop_requested
+            and self.failure_run < self.failure_limit
+            and len(self.page_scheduled) < (size or self.page_window)
+            and self.end.can_schedule(self.next_listing_page())
+        ):
+            yield self.listing_request()
+
+    def listing_wanted(self, response):
+        return not self.stop_requested and not self.end.past_end(response.meta['page'])
 
     def parse(self, response):
-        if self.stop_requested:
+        if not self.listing_wanted(response):
             return
+        parse_started = time.time()
+        listing = listing_page(response, self.state_code, self.listing_json)
+        yield from self.handle_listing(response, listing, parse_started)
 
-        business_divs = response.css("div.sc-eCstZk.MuiBox-root")
+    async def parse_in_pool(self, response):
+        # Same as parse, with the selector work done by a parser worker
+        if not self.listing_wanted(response):
+            return []
+        parse_started = time.time()
+        listing, worker_time = await self.parser_pool.run(
+            parse_listing_body, response.url, response.body, response.encoding, self.state_code, self.listing_json
+        )
+        self.crawler.stats.inc_value('parser_pool/listing_time', worker_time)
+        return self.handle_listing(response, listing, parse_started)
 
-        if not business_divs:
-            self.logger.info(f"No more businesses found on page {self.page_number}. Scraping finished.")
+    def handle_listing(self, response, listing, parse_started):
+        # The crawl may have stopped or found its last page while this one
+        # was being parsed
+        if not self.listing_wanted(response):
             return
 
-        for business in business_divs:
+        page = response.meta['page']
+        self.failure_run = 0
+        divs, links, source, pagination = listing
+        self.crawler.stats.inc_value(f'listing/source/{source}')
+        last_page = self.end.last_page
+        past_end = self.end.observe(page, links if divs else (), pagination)
+        if self.end.last_page != last_page:
+            # Pages after the end that are already scheduled get dropped by
+            # ListingCutoffMiddleware
+            if self.journal is not None:
+                self.journal.last_page(self.end.last_page)
+            self.logger.info(f"Results end on page {self.end.last_page} ({self.end.reason}).")
+        if past_end:
+            self.record_page_timing(response, page, parse_started, 0)
+            return
+
+        business_count = 0
+
+        for link_indices in divs:
             if self.stop_requested:
                 return
 
             # Look for business links within this div
-            business_links = business.css('a[href*="/p/"]')
-            
-            for link in business_links:
-                # Get business name from the link text or data attributes
-                business_name = link.css('::text').get()
-                if not business_name:
-                    business_name = link.css('::attr(data-track-click)').get()
-                    if business_name and ',' in business_name:
-                        business_name = business_name.split(',')[-1].strip()
-                
-                if not business_name or business_name in self.seen_business_names:
-                    continue
-                
-                # Clean up business name
-                business_name = business_name.strip()
-                if not business_name or len(business_name) < 3:
+            for link_index in link_indices:
+                business_name, detail_page_link, classification, phone_number = links[link_index]
+
+                # The index only decides freshness; names are not IDs
+                if not self.seen_businesses.add(business_key(detail_page_link, business_name)):
                     continue
-                
-                self.seen_business_names.add(business_name)
-                
-                # Get the detail page link
-                detail_page_link = link.css('::attr(href)').get()
-                
-                # Try to extract additional info from the link's parent elements
-                parent_div = link.xpath('..')
-                all_text = parent_div.css('::text').getall()
-                clean_text = [text.strip() for text in all_text if text.strip() and len(text.strip()) > 1]
-                
-                # Parse business information from the text
-                location = None
-                company_type = None
-                market_services = None
-                trades_services = None
-                
-                # Look for patterns in the text to extract business information
-                for text in clean_text:
-                    # Look for location patterns (state names, cities)
-                    if any(loc in text for loc in ['California', 'CA', 'Los Angeles', 'San Francisco', 'San Diego', 'Sacramento', 'Oakland', 'Fresno', 'Long Beach', 'Bakersfield', 'Anaheim', 'Santa Ana', 'Riverside', 'Stockton', 'Irvine', 'Chula Vista', 'Fremont', 'San Bernardino', 'Modesto', 'Fontana', 'Oxnard', 'Moreno Valley', 'Huntington Beach', 'Glendale', 'Santa Clarita', 'Garden Grove', 'Oceanside', 'Rancho Cucamonga', 'Santa Rosa', 'Ontario', 'Lancaster', 'Elk Grove', 'Palmdale', 'Corona', 'Salinas', 'Pomona', 'Hayward', 'Escondido', 'Torrance', 'Sunnyvale', 'Orange', 'Fullerton', 'Pasadena', 'Thousand Oaks', 'Visalia', 'Simi Valley', 'Concord', 'Roseville', 'Santa Clara', 'Vallejo', 'Victorville', 'El Monte', 'Berkeley', 'Downey', 'Costa Mesa', 'Inglewood', 'Ventura', 'West Covina', 'Norwalk', 'Carlsbad', 'Fairfield', 'Richmond', 'Murrieta', 'Burbank', 'Antioch', 'Daly City', 'Santa Monica', 'Temecula', 'Clovis', 'Compton', 'Jurupa Valley', 'Vista', 'South Gate', 'Mission Viejo', 'Vacaville', 'Carson', 'Hesperia', 'Santa Barbara', 'Redding', 'Santa Cruz', 'Chico', 'Newport Beach', 'San Leandro', 'Hawthorne', 'Citrus Heights', 'Tracy', 'Alhambra', 'Livermore', 'Buena Park', 'Lakewood', 'Merced', 'Hemet', 'Chino', 'Menifee', 'Lake Forest', 'Napa', 'Redwood City', 'Bellflower', 'Indio', 'Baldwin Park', 'Chino Hills', 'Mountain View', 'Alameda', 'Upland', 'Folsom', 'San Ramon', 'Pleasanton', 'Union City', 'Lynwood', 'Apple Valley', 'Redlands', 'Turlock', 'Perris', 'Manteca', 'Milpitas', 'Lodi', 'Madera', 'Glendora', 'Pittsburg', 'Camarillo', 'Hanford', 'San Luis Obispo', 'Huntington Park', 'La Mesa', 'Arcadia', 'Fountain Valley', 'Diamond Bar', 'Santee', 'Porterville', 'Colton', 'Covina', 'Rohnert Park', 'Yorba Linda', 'Pacifica', 'Rancho Cordova', 'Montebello', 'Lompoc', 'Hollister', 'San Gabriel', 'Brea', 'La Habra', 'San Bruno', 'Beverly Hills', 'Coachella', 'Morgan Hill', 'Seaside', 'Calexico', 'San Dimas', 'Culver City', 'Los Banos', 'Martinez', 'San Mateo', 'Cypress', 'La Puente', 'Palm Desert', 'Novato', 'San Jacinto', 'La Verne', 'Goleta', 'Tulare', 'Petaluma']):
-                        location = text
-                    # Look for company type patterns
-                    elif text in ['General Contractor', 'Specialty Contractor', 'Consultant', 'Supplier', 'Architect', 'Engineer', 'Owner Real Estate Developer']:
-                        company_type = text
-                    # Look for market services patterns
-                    elif text in ['Commercial', 'Healthcare', 'Industrial and Energy', 'Infrastructure', 'Institutional', 'Residential']:
-                        market_services = text
-                    # Look for trades and services patterns
-                    elif any(trade in text for trade in ['Concrete', 'Demolition', 'Design and Engineering', 'Project Management', 'HVAC', 'Structural Steel', 'Communications', 'Electrical', 'Plumbing', 'Roofing', 'Masonry', 'Landscaping', 'Earthwork', 'Fire Suppression', 'Electronic Security', 'Signage', 'Brick Tiling', 'Rough Carpentry', 'Heating Ventilating and Air Conditioning HVAC']):
-                        trades_services = text
-                
+                business_count += 1
+
+                location, company_type, market_services, trades_services = classification
+
+                # Businesses unchanged since a recent crawl come straight from
+                # the index instead of their detail page. A listing with the
+                # phone number is newer than any stored row, so it never does
+                cached_row = None
+                content_hash = None
+                if self.index is not None:
+                    index_key = detail_page_link or business_name
+                    content_hash = listing_hash(business_name, location, company_type, market_services, trades_services)
+                    cached = self.index.visit(self.state_code, index_key, business_name, content_hash, self.index_ttl)
+                    if not phone_number:
+                        cached_row = cached
+
                 # Process this business
-                if detail_page_link:
-                    detail_page_link = response.urljoin(detail_page_link)
-                    headers = {
-                        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                        'Accept-Language': 'en-US,en;q=0.5',
-                        'Accept-Encoding': 'gzip, deflate',
-                        'Connection': 'keep-alive',
-                        'Upgrade-Insecure-Requests': '1',
+                if phone_number:
+                    # The listing's state blob has everything; no detail request
+                    row = {
+                        "Business Name": business_name,
+                        "Phone Number": phone_number,
+                        "Location": location,
+                        "Company Type": company_type,
+                        "Market and Services": market_services,
+                        "Trades and Services": trades_services,
                     }
-                    yield scrapy.Request(
-                        detail_page_link,
-                        headers=headers,
-                        callback=self.parse_business_detail,
-                        meta={
-                            'business_name': business_name,
-                            'location': location,
-                            'company_type': company_type,
-                            'market_services': market_services,
-                            'trades_services': trades_services
-                        }
-                    )
+                    self.crawler.stats.inc_value('listing/complete_rows')
+                    self.keep_row(row, detail_page_link)
+                    if self.index is not None:
+                        self.index.store(self.state_code, index_key, content_hash, row)
+                    yield row
+                elif cached_row is not None:
+                    self.crawler.stats.inc_value('index/reused')
+                    self.keep_row(cached_row, detail_page_link)
+                    yield cached_row
+                elif detail_page_link:
+                    yield self.detail_request(ListingRecord(detail_page_link, business_name, classification, content_hash))
                 else:
                     # If no detail page, just yield the basic info
                     row = {
@@ -130,126 +353,111 @@ class ProcoreSpider(scrapy.Spider):
                         "Market and Services": market_services,
                         "Trades and Services": trades_services,
                     }
-                    self.scraped_data.append(row)
+                    self.keep_row(row)
                     yield row
-                
+
                 # Only process one business per div to avoid duplicates
                 break
 
-        # Increment the page number and proceed to the next page
-        self.page_number += 1
-        next_page_url = self.base_url + str(self.page_number)
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        yield scrapy.Request(next_page_url, headers=headers, callback=self.parse)
+        # Written after everything the page scheduled, so a resumed crawl
+        # only skips pages whose businesses are all journaled
+        if self.journal is not None:
+            self.journal.page(page)
+        self.record_page_timing(response, page, parse_started, business_count)
+
+        # Refill the window with the next pages not yet scheduled
+        yield from self.fill_window()
+
+    def record_page_timing(self, response, page, parse_started, business_count):
+        now = time.time()
+        self.page_timings.append({
+            'page': page,
+            'download_latency': response.meta.get('download_latency'),
+            'parse_time': now - parse_started,
+            'elapsed': now - self.page_scheduled.pop(page, now),
+            'businesses': business_count,
+        })
 
-    def parse_business_detail(self, response):
-        if self.stop_requested:
+    def closed(self, reason):
+        if self.index is not None:
+            self.index.release()
+        if self.parser_pool is not None:
+            self.parser_pool.release()
+        if self.journal is not None:
+            # Done only once every listing page up to the end and every
+            # detail page has been handled. A user stop also closes as
+            # "finished"; like a crawl that lost pages, it stays resumable
+            if (
+                reason == 'finished'
+                and not self.stop_requested
+                and self.end.last_page is not None
+                and not self.failed_pages
+                and not self.pending_details
+            ):
+                self.journal.done()
+            else:
+                self.logger.info(
+                    "%s stays resumable: %d listing pages failed, %d detail pages pending%s",
+                    self.state_code.upper(), len(self.failed_pages), len(self.pending_details),
+                    "" if self.end.last_page is not None else ", end of results not found",
+                )
+            self.crawler.stats.set_value('checkpoint/entries', self.journal.entries)
+            self.journal.close()
+        stats = self.crawler.stats
+        if self.end.last_page is not None:
+            stats.set_value('termination/last_page', self.end.last_page)
+            stats.set_value('termination/reason', self.end.reason)
+        stats.set_value('termination/wasted_requests', self.end.wasted())
+        if not getattr(self, 'page_timings', None):
             return
+        wall_time = time.time() - self.crawl_started
+        latencies = [t['download_latency'] for t in self.page_timings if t['download_latency'] is not None]
+        stats.set_value('pagination/window', self.page_window)
+        stats.set_value('pagination/pages', len(self.page_timings))
+        stats.set_value('pagination/wall_time', round(wall_time, 3))
+        self.logger.info(
+            "Listing pages: %d in %.2fs with window %d (%.2f pages/s, mean latency %.3fs)",
+            len(self.page_timings), wall_time, self.page_window,
+            len(self.page_timings) / wall_time if wall_time else 0.0,
+            sum(latencies) / len(latencies) if latencies else 0.0,
+        )
+        for timing in sorted(self.page_timings, key=lambda t: t['page']):
+            self.logger.debug(
+                "page %(page)d: latency=%(download_latency)s parse=%(parse_time).4fs "
+                "elapsed=%(elapsed).3fs businesses=%(businesses)d", timing
+            )
 
-        # Try to extract phone number from JSON data first
-        phone_number = None
-        
-        # Look for JSON data in script tags
-        script_tags = response.css('script::text').getall()
-        for script in script_tags:
-            if 'phone' in script.lower() and ('"' in script or "'" in script):
-                # Try to find phone number patterns in the script
-                import re
-                phone_patterns = [
-                    r'"phone":\s*"([^"]+)"',
-                    r"'phone':\s*'([^']+)'",
-                    r'"phone":\s*"([^"]*\+[^"]*)"',
-                    r"'phone':\s*'([^']*\+[^']*)'",
-                ]
-                
-                for pattern in phone_patterns:
-                    matches = re.findall(pattern, script)
-                    for match in matches:
-                        if match and ('+' in match or '(' in match or match.replace('-', '').replace(' ', '').isdigit()):
-                            phone_number = match.strip()
-                            break
-                    if phone_number:
-                        break
-                if phone_number:
-                    break
-        
-        # If no phone number found in JSON, try HTML selectors
-        if not phone_number or not phone_number.strip():
-            phone_selectors = [
-                'p.MuiTypography-body1::text',
-                'div[class*="jss"] p.MuiTypography-body1::text',
-                'p[class*="MuiTypography-body1"]::text',
-                'div[class*="sc-"] p[class*="MuiTypography"]::text',
-                'a[href^="tel:"]::text',
-                'a[href^="tel:"]::attr(href)',
-                '[data-test-id*="phone"]::text',
-                '[data-test-id*="contact"]::text',
-            ]
-            
-            for selector in phone_selectors:
-                phone_number = response.css(selector).get()
-                if phone_number and phone_number.strip():
-                    phone_number = phone_number.strip()
-                    if phone_number.startswith('tel:'):
-                        phone_number = phone_number[4:]
-                    break
-        
-        # If still no phone number found, try XPath approach
-        if not phone_number or not phone_number.strip():
-            phone_xpath_selectors = [
-                '//p[contains(@class, "MuiTypography-body1")]/text()',
-                '//div[contains(span, "Phone")]/p/text()',
-                '//span[contains(text(), "Phone")]/following-sibling::p/text()',
-                '//p[contains(text(), "+")]/text()',
-                '//p[contains(text(), "(") and contains(text(), ")")]/text()',
-            ]
-            
-            for xpath_selector in phone_xpath_selectors:
-                phone_candidates = response.xpath(xpath_selector).getall()
-                for candidate in phone_candidates:
-                    candidate = candidate.strip()
-                    if candidate and (candidate.startswith('+') or 
-                                   ('(' in candidate and ')' in candidate) or
-                                   (candidate.replace('-', '').replace(' ', '').replace('(', '').replace(')', '').isdigit() and len(candidate.replace('-', '').replace(' ', '').replace('(', '').replace(')', '')) >= 10)):
-                        phone_number = candidate
-                        break
-                if phone_number:
-                    break
-        
-        # If no phone number found, set as "Not Available"
-        if not phone_number or not phone_number.strip():
-            phone_number = "Not Available"
+    def parse_business_detail(self, response, listing):
+        # Embedded script JSON first, then the HTML fallbacks, in one pass each
+        yield from self.handle_detail(response, detail_page(response), listing)
+
+    async def parse_business_detail_in_pool(self, response, listing):
+        detail, worker_time = await self.parser_pool.run(
+            parse_detail_body, response.url, response.body, response.encoding
+        )
+        self.crawler.stats.inc_value('parser_pool/detail_time', worker_time)
+        return self.handle_detail(response, detail, listing)
 
+    def handle_detail(self, response, detail, listing):
+        # Also runs for pages still in flight when the crawl is stopped; their
+        # rows are kept, so a resume does not fetch them again
+        phone_number, stage, timings = detail
+        stats = self.crawler.stats
+        stats.inc_value(f'phone/stage/{stage}')
+        for name, seconds in timings.items():
+            stats.inc_value(f'phone/time/{name}', seconds)
+
+        location, company_type, market_services, trades_services = listing.classification
         row = {
-            "Business Name": response.meta['business_name'],
+            "Business Name": listing.business_name,
             "Phone Number": phone_number,
-            "Location": response.meta['location'],
-            "Company Type": response.meta['company_type'],
-            "Market and Services": response.meta['market_services'],
-            "Trades and Services": response.meta['trades_services'],
+            "Location": location,
+            "Company Type": company_type,
+            "Market and Services": market_services,
+            "Trades and Services": trades_services,
         }
-
-        # Check if the row is empty (all values are None)
-        if all(value is None for value in row.values()):
-            self.consecutive_empty_count += 1
-            if 1 <= self.consecutive_empty_count <= 4:
-                # Add a row with None values
-                empty_row = {key: None for key in row.keys()}
-                self.scraped_data.append(empty_row)
-            elif self.consecutive_empty_count > 18:
-                # Stop the spider
-                self.stop_requested = True
-                self.crawler.engine.close_spider(self, 'Encountered more than 8 consecutive empty rows.')
-        else:
-            # Reset the counter if a non-empty row is found
-            self.consecutive_empty_count = 0
-            self.scraped_data.append(row)
-
-        yield row  # Yield the row for data export
+        self.keep_row(row, listing.detail_url)
+        self.pending_details.discard(listing.detail_url)
+        if self.index is not None:
+            self.index.store(self.state_code, listing.detail_url, listing.content_hash, row)
+        yield row
@@ -0,0 +1,106 @@
+"""Columnar store for scraped rows.
+
+A crawl keeps tens of thousands of rows whose location, company type,
+market and trade fields repeat a few hundred values. ``ResultStore`` keeps
+each categorical column as an int32 code array plus one list of distinct
+values, and the free-text columns as plain lists. ``to_pandas`` and
+``to_arrow`` wrap those arrays as categorical / dictionary columns instead
+of converting row by row.
+
+Rows are appended on the reactor thread while the app may read from the
+Streamlit thread. Code arrays grow by allocating a bigger array, so a
+reader's view of the first ``len(store)`` rows never sees a write.
+"""
+import numpy as np
+
+from exports import COLUMNS
+
+RESULT_COLUMNS = ["State", *COLUMNS]
+CATEGORICAL_COLUMNS = frozenset({
+    "State",
+    "Phone Status",
+    "Location",
+    "Company Type",
+    "Market and Services",
+    "Trades and Services",
+})
+
+
+class ResultStore:
+    def __init__(self, columns=RESULT_COLUMNS, categorical=CATEGORICAL_COLUMNS, capacity=1024):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.length = 0
+        self.text = {column: [] for column in self.columns if column not in categorical}
+        # -1 marks a missing value, as in pandas' categorical codes
+        self.codes = {column: np.full(capacity, -1, dtype=np.int32) for column in self.columns if column in categorical}
+        self.categories = {column: [] for column in self.codes}
+        self.lookup = {column: {} for column in self.codes}
+
+    def __len__(self):
+        return self.length
+
+    def append(self, row, extra=None):
+        """Add ``row``; ``extra`` supplies columns the row does not have, such as the state."""
+        n = self.length
+        if n == self.capacity:
+            self._grow()
+        for column, values in self.text.items():
+            values.append(extra[column] if extra and column in extra else row.get(column))
+        for column, codes in self.codes.items():
+            value = extra[column] if extra and column in extra else row.get(column)
+            if value is None:
+                continue
+            lookup = self.lookup[column]
+            code = lookup.get(value)
+            if code is None:
+                categories = self.categories[column]
+                code = lookup[value] = len(categories)
+                categories.append(value)
+            codes[n] = code
+        self.length = n + 1
+
+    def _grow(self):
+        self.capacity *= 2
+        for column, codes in self.codes.items():
+            grown = np.full(self.capacity, -1, dtype=np.int32)
+            grown[:self.length] = codes[:self.length]
+            self.codes[column] = grown
+
+    def __iter__(self):
+        n = self.length
+        columns = [self._values(column, n) for column in self.columns]
+        for values in zip(*columns):
+            yield dict(zip(self.columns, values))
+
+    def _values(self, column, n):
+        if column in self.text:
+            return self.text[column][:n]
+        categories = self.categories[column]
+        return [categories[code] if code >= 0 else None for code in self.codes[column][:n].tolist()]
+
+    def to_pandas(self):
+        import pandas as pd
+
+        n = self.length
+        data = {}
+        for column in self.columns:
+            if column in self.codes:
+                data[column] = pd.Categorical.from_codes(self.codes[column][:n], categories=list(self.categories[column]))
+            else:
+                data[column] = self.text[column][:n]
+        return pd.DataFrame(data, columns=self.columns)
+
+    def to_arrow(self):
+        import pyarrow as pa
+
+        n = self.length
+        arrays = []
+        for column in self.columns:
+            if column in self.codes:
+                codes = self.codes[column][:n]
+                indices = pa.array(codes, mask=codes < 0)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(list(self.categories[column]), pa.string())))
+            else:
+                arrays.append(pa.array(self.text[column][:n], pa.string()))
+        return pa.table(arrays, names=self.columns)
@@ -0,0 +1,239 @@
+import os
+import sys
+import time
+from collections import deque
+
+from scrapy.crawler import Crawler
+from scrapy.utils.project import get_project_settings
+from scrapy.utils.reactor import install_reactor
+from twisted.internet import defer
+
+from instrumentation import LATENCY_LABELS, find_instrumentation
+from procore_spider import ProcoreSpider
+from results import ResultStore
+
+# Seconds of history behind the items/s figure in progress()
+RATE_WINDOW = 10.0
+
+
+def project_settings():
+    """The settings in settings.py, whichever directory the process runs from."""
+    os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'settings')
+    return get_project_settings()
+
+
+def install_project_reactor(settings):
+    """Install ``TWISTED_REACTOR`` unless this process already has a reactor.
+
+    Must run before anything imports ``twisted.internet.reactor``, which
+    would install the platform default. Nothing in this project does that at
+    import time, so callers only have to run it before starting crawls or
+    crochet.
+    """
+    if 'twisted.internet.reactor' not in sys.modules:
+        install_reactor(settings['TWISTED_REACTOR'])
+
+
+class RowFeed:
+    """Ring buffer that hands new rows from the reactor thread to the UI.
+
+    Spiders call ``publish`` for every row they keep; the UI calls ``drain``
+    to take whatever arrived since its last call. ``deque.append`` and
+    ``popleft`` are atomic, so no lock is needed. Only the newest ``maxlen``
+    rows are held, which is all a capped preview can show anyway, and a UI
+    that stops draining cannot make the buffer grow.
+    """
+
+    def __init__(self, maxlen=500):
+        self.rows = deque(maxlen=maxlen)
+        self.published = 0
+
+    def publish(self, state_code, row):
+        self.published += 1
+        self.rows.append({"State": state_code.upper(), **row})
+
+    def drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.rows.popleft())
+            except IndexError:
+                return rows
+
+
+class StateCrawlScheduler:
+    """Crawls several states concurrently on the shared reactor.
+
+    At most ``max_states`` spiders run at once and each one gets an equal
+    share of ``max_requests`` as its ``CONCURRENT_REQUESTS`` (fewer states
+    than ``max_states`` get bigger shares), so the whole job never has more
+    than ``max_requests`` downloads in flight. Within that share the
+    adaptive concurrency middleware decides how many actually go out. Every state
+    runs its own ``ProcoreSpider`` instance and all of them keep their rows,
+    tagged with the state, in the shared ``results`` store; ``partitions()``
+    splits it back up per state.
+    New rows are also published to ``feed`` as they are scraped, and
+    ``progress()`` sums the crawler stats for a live throughput readout.
+
+    ``crawl()`` must be called from the reactor thread: the CLI runs it on a
+    ``CrawlerProcess`` and the app through crochet's ``run_in_reactor``. The
+    other methods are also safe to call from the Streamlit thread.
+    """
+
+    def __init__(self, runner, max_states=4, max_requests=64, spider_kwargs=None, settings=None):
+        self.runner = runner
+        self.settings = settings or {}
+        self.max_states = max(1, int(max_states))
+        self.max_requests = max(1, int(max_requests))
+        self.spider_kwargs = spider_kwargs or {}
+        self.crawlers = {}  # state code -> Crawler, in the order requested
+        self.running_states = self.max_states  # States that can run at once in this crawl
+        self.results = ResultStore()
+        self.feed = RowFeed()
+        self.stop_requested = False
+        self.finished = False
+        self.rate_samples = deque()
+
+    @property
+    def requests_per_state(self):
+        return max(1, self.max_requests // self.running_states)
+
+    def crawl(self, state_codes):
+        state_codes = list(dict.fromkeys(code.strip().lower() for code in state_codes if code.strip()))
+        self.running_states = max(1, min(self.max_states, len(state_codes)))
+        semaphore = defer.DeferredSemaphore(self.max_states)
+        crawls = [semaphore.run(self._crawl_state, code) for code in state_codes]
+        done = defer.DeferredList(crawls, consumeErrors=True)
+        done.addBoth(self._crawls_finished)
+        return done
+
+    def _crawl_state(self, state_code):
+        if self.stop_requested:
+            return None
+        settings = self.runner.settings.copy()
+        settings.setdict(self.settings, priority="cmdline")
+        settings.set("CONCURRENT_REQUESTS", self.requests_per_state, priority="cmdline")
+        crawler = Crawler(ProcoreSpider, settings)
+        self.crawlers[state_code] = crawler
+        return self.runner.crawl(
+            crawler, state_code=state_code, row_feed=self.feed, scraped_data=self.results, **self.spider_kwargs
+        )
+
+    def _crawls_finished(self, result):
+        self.finished = True
+        return result
+
+    def partitions(self):
+        """A DataFrame of rows per state code, in the order the states were requested."""
+        df = self.results.to_pandas()
+        groups = {state: rows.reset_index(drop=True) for state, rows in df.groupby("State", observed=True, sort=False)}
+        return {code: groups.get(code.upper(), df.iloc[:0]) for code in list(self.crawlers)}
+
+    def state_summaries(self):
+        """Per state: items, requests, seconds it ran and why it finished."""
+        summaries = {}
+        for code, crawler in list(self.crawlers.items()):
+            stats = crawler.stats
+            if stats is None:
+                # The spider could not be created
+                summaries[code] = {'items': 0, 'requests': 0, 'seconds': None, 'finish_reason': 'failed'}
+                continue
+            summaries[code] = {
+                'items': stats.get_value('item_scraped_count', 0),
+                'requests': stats.get_value('downloader/request_count', 0),
+                'seconds': stats.get_value('elapsed_time_seconds'),
+                'finish_reason': stats.get_value('finish_reason'),
+            }
+        return summaries
+
+    def spiders(self):
+        return {code: crawler.spider for code, crawler in list(self.crawlers.items()) if crawler.spider is not None}
+
+    def progress(self):
+        """Totals across states: items, items/s, pending requests, concurrency and latency."""
+        items = requests = responses = in_flight = queued = throttled = 0
+        concurrency_target = 0.0
+        latencies = []
+        for crawler in list(self.crawlers.values()):
+            stats = crawler.stats
+            if stats is None:
+                # Not started yet, or the spider could not be created
+                continue
+            items += stats.get_value('item_scraped_count', 0)
+            requests += stats.get_value('downloader/request_count', 0)
+            responses += stats.get_value('downloader/response_count', 0)
+            throttled += stats.get_value('throttle/responses', 0)
+            concurrency_target += stats.get_value('concurrency/target', 0)
+            engine = crawler.engine
+            if engine is not None and engine.running and engine.slot is not None:
+                in_flight += len(engine.downloader.active)
+                queued += len(engine.slot.scheduler)
+            timings = getattr(crawler.spider, 'page_timings', None) or []
+            latencies.extend(t['download_latency'] for t in timings[-20:] if t['download_latency'] is not None)
+
+        now = time.monotonic()
+        self.rate_samples.append((now, items))
+        while len(self.rate_samples) > 1 and now - self.rate_samples[0][0] > RATE_WINDOW:
+            self.rate_samples.popleft()
+        since, items_then = self.rate_samples[0]
+        return {
+            'items': items,
+            'items_per_sec': (items - items_then) / (now - since) if now > since else 0.0,
+            'requests': requests,
+            'responses': responses,
+            'in_flight': in_flight,
+            'queued': queued,
+            'concurrency_target': concurrency_target,
+            'throttled': throttled,
+            'latency': sum(latencies) / len(latencies) if latencies else None,
+        }
+
+    def instrumentation(self):
+        """Callback, phone stage, latency and queue depth figures across states.
+
+        Counts and totals are summed; percentiles are per state, so the
+        worst state's is reported.
+        """
+        callbacks = {}
+        phone_stages = {}
+        phone_time = {}
+        latency = {}
+        depth = {}
+        profile = None
+        for code, crawler in list(self.crawlers.items()):
+            if crawler.stats is None:
+                continue
+            for name, value in dict(crawler.stats.get_stats()).items():
+                group, _, rest = name.partition('/')
+                if group == 'callback':
+                    callback, figure = rest.split('/')
+                    figures = callbacks.setdefault(callback, {})
+                    if figure in ('p50', 'p99'):
+                        figures[figure] = max(figures.get(figure, 0.0), value)
+                    else:
+                        figures[figure] = figures.get(figure, 0) + value
+                elif group == 'phone':
+                    kind, _, key = rest.partition('/')
+                    target = phone_stages if kind == 'stage' else phone_time
+                    target[key] = target.get(key, 0) + value
+                elif group == 'latency':
+                    kind, _, bucket = rest.partition('/')
+                    buckets = latency.setdefault(kind, dict.fromkeys(LATENCY_LABELS, 0))
+                    buckets[bucket] = buckets.get(bucket, 0) + value
+            extension = find_instrumentation(crawler)
+            if extension is not None:
+                depth[code] = list(extension.depth_samples)
+                profile = extension.profile_report or profile
+        return {
+            'callbacks': callbacks,
+            'phone_stages': phone_stages,
+            'phone_time': phone_time,
+            'latency': latency,
+            'depth': depth,
+            'profile': profile,
+        }
+
+    def stop(self):
+        self.stop_requested = True
+        for spider in self.spiders().values():
+            spider.stop_requested = True
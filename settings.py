@@ -1,6 +1,16 @@
+# The only place concurrency is configured. CONCURRENT_REQUESTS caps each
+# crawler (StateCrawlScheduler splits its total between states) and is the
+# most the adaptive controller will go to; CONCURRENT_REQUESTS_PER_DOMAIN is
+# where it starts. See middlewares.AdaptiveConcurrencyMiddleware.
 CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+# Installed by scheduler.install_project_reactor before anything starts crawling
+TWISTED_REACTOR = 'twisted.internet.selectreactor.SelectReactor'
 DNS_RESOLVER = 'scrapy.resolver.CachingHostnameResolver'
 DOWNLOAD_DELAY = 0
 LOG_LEVEL = 'INFO'
 HTTPCACHE_ENABLED = True
-HTTPCACHE_EXPIRATION_SECS = 3600 
+HTTPCACHE_EXPIRATION_SECS = 3600  # Older entries are revalidated or downloaded again
+HTTPCACHE_STORAGE = 'httpcache.SQLiteCacheStorage'
+HTTPCACHE_POLICY = 'httpcache.RevalidatingCachePolicy'
+HTTPCACHE_MAX_BYTES = 1024 ** 3  # Compressed bytes kept before LRU eviction
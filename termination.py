@@ -0,0 +1,100 @@
+"""End-of-results detection for one state's listing pages.
+
+The listing pages of a state are fetched through a window of pages in
+flight, so by the time a page shows the results have ended, the pages after
+it are already queued or downloading. ``ListingEnd`` works out the last page
+as early as the pages allow:
+- ``count``: the ``__NEXT_DATA__`` blob reports the total number of results
+  and the page size, so the first page parsed tells how many pages to
+  schedule and the pages past them are never requested. The count bounds
+  the crawl but does not end it: the site reports slightly different
+  totals on different pages, so the largest is used, and a full page where
+  the count says the results end may be followed by more, so one page more
+  is fetched to see. If that page is full too, the count is stale and stops
+  bounding the window, which the other signals then end;
+- ``short_page``: a page with fewer results than the page size is the last;
+- ``empty_page``: a page without businesses follows the last one, which is
+  all the rendered HTML can tell;
+- ``repeated_page``: a page listing exactly the businesses of another page
+  (same ``page_fingerprint``) is past the end, as when a site serves its
+  last page again for any page number after it.
+
+Once the last page is known the spider schedules nothing past it, and
+``middlewares.ListingCutoffMiddleware`` drops the later pages still queued.
+Listing pages downloaded past the last page are the requests the crawl
+wasted on finding its end; ``wasted`` counts them for the crawl stats.
+"""
+from dedupe import key_hash
+
+END_SHORT_PAGE = 'short_page'
+END_EMPTY_PAGE = 'empty_page'
+END_REPEATED_PAGE = 'repeated_page'
+END_JOURNAL = 'journal'  # Found by the interrupted crawl a resume continues
+
+
+def page_fingerprint(links):
+    """64-bit hash of the businesses a listing page shows, in order."""
+    return key_hash('\n'.join(link[1] or link[0] for link in links if link is not None))
+
+
+class ListingEnd:
+    def __init__(self, last_page=None):
+        self.last_page = last_page  # Last page with results, once known
+        self.reason = END_JOURNAL if last_page is not None else None
+        self.total = None  # Largest result count any page reported
+        self.count_pages = None  # Pages the count needs, a bound on scheduling
+        self.count_stale = False  # Results went on past the count, which then bounds nothing
+        self.fingerprints = {}  # page_fingerprint -> earliest page showing it
+        self.downloaded = set()  # Listing pages whose response arrived
+
+    def past_end(self, page):
+        return self.last_page is not None and page > self.last_page
+
+    def can_schedule(self, page):
+        return not self.past_end(page) and (self.count_pages is None or page <= self.count_pages)
+
+    def found(self, page, reason):
+        if self.last_page is None or page < self.last_page:
+            self.last_page = page
+            self.reason = reason
+
+    def observe(self, page, links, pagination=None):
+        """Learn what listing ``page`` tells about the end; return True if it is past the end."""
+        if not links:
+            self.found(page - 1, END_EMPTY_PAGE)
+            return True
+        fingerprint = page_fingerprint(links)
+        first = self.fingerprints.setdefault(fingerprint, page)
+        if first != page:
+            # The later of the two pages repeats the earlier one
+            self.fingerprints[fingerprint] = min(first, page)
+            self.found(max(first, page) - 1, END_REPEATED_PAGE)
+        if pagination is not None and pagination.page_size:
+            self.observe_count(page, pagination)
+        return self.past_end(page)
+
+    def observe_count(self, page, pagination):
+        results, total, page_size = pagination
+        if 0 < results < page_size:
+            self.found(page, END_SHORT_PAGE)
+            return
+        if self.count_stale:
+            return
+        if total:
+            self.total = max(self.total or 0, total)
+        if self.total is None:
+            return
+        counted = -(-self.total // page_size)
+        if page > counted:
+            # A full page past the count's last one
+            self.count_stale = True
+            self.count_pages = None
+            return
+        self.count_pages = max(self.count_pages or 0, counted)
+        if page >= self.count_pages:
+            # A full page where the count ends: look one page further
+            self.count_pages = page + 1
+
+    def wasted(self):
+        """Listing pages downloaded past the last page."""
+        return sum(1 for page in self.downloaded if self.past_end(page))
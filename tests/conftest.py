@@ -0,0 +1,5 @@
+from scheduler import install_project_reactor, project_settings
+
+# Spiders ask for the project's reactor, so it has to be installed before
+# anything imports the default one
+install_project_reactor(project_settings())
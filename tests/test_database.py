@@ -0,0 +1,125 @@
+import random
+
+import pytest
+
+from database import ResultDatabase, split_tags
+from dedupe import business_key
+from exports import BUSINESS_KEY
+
+STATES = ['CA', 'NY', 'TX']
+CITIES = ['San Jose, CA', 'Austin, TX', 'Albany, NY', None]
+COMPANY_TYPES = ['General Contractor', 'Subcontractor', 'Owner']
+# Weighted so some trades are common and 'Demolition' is rare
+TRADES = ['Electrical'] * 6 + ['Plumbing'] * 4 + ['Concrete'] * 3 + ['Roofing'] * 2 + ['Demolition']
+NAMES = ['Acme', '100% Builders', 'A_B Construction', 'AxB Construction', 'Fire & Safety', 'Back\\slash Co']
+
+
+def make_rows(count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            "Business Name": f"{rng.choice(NAMES)} {i % 40}",
+            "Phone Number": f"+1408555{i:04d}",
+            "Phone Status": 'valid',
+            "Location": rng.choice(CITIES),
+            "Company Type": ', '.join(sorted(set(rng.sample(COMPANY_TYPES, rng.randint(1, 2))))),
+            "Market and Services": None,
+            "Trades and Services": ', '.join(sorted(set(rng.sample(TRADES, rng.randint(0, 3))))) or None,
+            BUSINESS_KEY: business_key(f'https://example.com/p/business-{i % 150}'),
+        }
+        rows.append((rng.choice(STATES) if i < 150 else STATES[i % 3], row))
+    return rows
+
+
+@pytest.fixture(scope='module')
+def stored(tmp_path_factory):
+    database = ResultDatabase(str(tmp_path_factory.mktemp('db') / 'procore.sqlite3'))
+    expected = {}  # (state, key) -> row, in the order first stored
+    rows = make_rows(200, seed=1)
+    for start in range(0, len(rows), 37):
+        batches = {}
+        for state, row in rows[start:start + 37]:
+            batches.setdefault(state, []).append(row)
+        for state, batch in batches.items():
+            for row in batch:
+                # A business already stored keeps its place and takes the new values
+                expected[(state, row[BUSINESS_KEY])] = (state, row)
+            database.upsert(state.lower(), batch)
+    yield database, list(expected.values())
+    database.close()
+
+
+def brute_force(rows, states=(), cities=(), company_types=(), trades=(), name=None):
+    states = [code.upper() for code in states]
+    return [
+        (state, row) for state, row in rows
+        if (not states or state in states)
+        and (not cities or row["Location"] in cities)
+        and (not company_types or set(split_tags(row["Company Type"])) & set(company_types))
+        and (not trades or set(split_tags(row["Trades and Services"])) & set(trades))
+        and (name is None or name.lower() in row["Business Name"].lower())
+    ]
+
+
+FILTERS = [
+    {},
+    {'states': ['ca']},
+    {'states': ['ca', 'ny']},
+    {'trades': ['Electrical']},
+    {'trades': ['Demolition']},
+    {'trades': ['Plumbing', 'Roofing']},
+    {'states': ['tx'], 'trades': ['Concrete']},
+    {'company_types': ['Owner']},
+    {'company_types': ['Owner'], 'trades': ['Electrical', 'Demolition']},
+    {'company_types': ['Owner', 'Subcontractor'], 'trades': ['Concrete']},
+    {'cities': ['San Jose, CA']},
+    {'cities': ['San Jose, CA', 'Austin, TX'], 'trades': ['Electrical']},
+    {'name': 'acme'},
+    {'name': '100%'},
+    {'name': '%'},
+    {'name': 'A_B'},
+    {'name': '_'},
+    {'name': 'back\\slash'},
+    {'name': 'construction', 'company_types': ['General Contractor'], 'states': ['ny']},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS, ids=[repr(f) for f in FILTERS])
+def test_count_and_pages_match_brute_force(stored, filters):
+    database, rows = stored
+    expected = brute_force(rows, **filters)
+    assert database.count(**filters) == len(expected)
+    for limit, offset in [(500, 0), (3, 0), (3, 5), (10, len(expected) - 4)]:
+        columns, page = database.query(limit=limit, offset=max(0, offset), **filters)
+        want = expected[max(0, offset):max(0, offset) + limit]
+        assert [(row[0], row[columns.index("Business Name")]) for row in page] == [
+            (state, row["Business Name"]) for state, row in want
+        ]
+
+
+def test_both_query_shapes_are_covered(stored):
+    database, rows = stored
+    total = len(rows)
+    rare = database._tag_filters([], (), ['Demolition'])[0].tags
+    common = database._tag_filters([], (), ['Electrical'])[0].tags
+    # A short page of a rare trade drives from the tag index, of a common one scans businesses
+    assert rare ** 2 <= 3 * total < common ** 2 <= 500 * total
+
+
+def test_upsert_again_replaces_values_and_tags(tmp_path):
+    database = ResultDatabase(str(tmp_path / 'procore.sqlite3'))
+    first, second = (row for state, row in make_rows(2, seed=2))
+    first.update({"Trades and Services": 'Electrical, Plumbing', "Company Type": 'Owner'})
+    second.update({"Trades and Services": 'Concrete', "Company Type": 'Owner'})
+    database.upsert('ca', [first, second])
+    database.upsert('ca', [dict(first, **{"Trades and Services": 'Roofing', "Phone Number": '+14085550000'})])
+    assert database.count() == 2
+    assert database.count(trades=['Electrical']) == 0
+    assert database.count(trades=['Roofing']) == 1
+    assert database.count(company_types=['Owner'], trades=['Roofing', 'Plumbing']) == 1
+    columns, rows = database.query()
+    # Updated in place, so still the first row
+    assert rows[0][columns.index("Phone Number")] == '+14085550000'
+    assert rows[0][columns.index("Business Name")] == first["Business Name"]
+    database.close()
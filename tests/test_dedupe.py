@@ -0,0 +1,56 @@
+import dedupe
+from benchmarks.fixtures import load_responses
+from dedupe import SeenSet, business_key
+from parsing import listing_page
+
+
+def test_key_is_the_slug():
+    assert business_key('https://www.procore.com/network/p/Acme-Builders?utm=x#top', 'Acme') == 'p/acme-builders'
+    assert business_key('/network/p/acme-builders/', 'Other Name') == 'p/acme-builders'
+
+
+def test_key_falls_back_to_the_normalized_name():
+    assert business_key(None, '  Acme   BUILDERS ') == business_key('', 'acme builders') == 'name:acme builders'
+    assert business_key('https://example.com/about', 'Acme') == 'name:acme'
+
+
+def test_keys_match_across_json_and_html_listings():
+    for response in list(load_responses('listing'))[:5]:
+        _, json_links, source, _ = listing_page(response, 'ca')
+        _, html_links, _, _ = listing_page(response, 'ca', use_json=False)
+        assert source == 'json'
+        json_keys = {business_key(link[1], link[0]) for link in json_links}
+        html_keys = {business_key(link[1], link[0]) for link in html_links if link is not None}
+        assert json_keys and json_keys <= html_keys
+
+
+def test_membership_and_growth():
+    seen = SeenSet(capacity=4)
+    keys = [f'p/business-{i}' for i in range(1000)]
+    assert all(seen.add(key) for key in keys)
+    assert len(seen) == 1000
+    assert all(key in seen for key in keys)
+    assert not any(seen.add(key) for key in keys[::7])
+    assert 'p/never-added' not in seen
+    assert len(seen.slots) >= 2 * len(seen)
+
+
+def test_keys_in_the_same_slot_are_probed(monkeypatch):
+    # Hashes 1, 17 and 33 share slot 1 of a 16 slot table
+    hashes = {'a': 1, 'b': 17, 'c': 33, 'd': 2}
+    monkeypatch.setattr(dedupe, 'key_hash', hashes.__getitem__)
+    seen = SeenSet(capacity=4)
+    assert len(seen.slots) == 16
+    assert seen.add('a') and seen.add('b') and seen.add('d') and seen.add('c')
+    assert all(key in seen for key in hashes)
+    assert not seen.add('b')
+
+
+def test_equal_hashes_count_as_seen(monkeypatch):
+    # The documented cost of keeping hashes: a full collision reads as a duplicate
+    monkeypatch.setattr(dedupe, 'key_hash', lambda key: 42)
+    seen = SeenSet()
+    assert seen.add('p/one')
+    assert not seen.add('p/two')
+    assert 'p/three' in seen
+    assert len(seen) == 1
@@ -0,0 +1,47 @@
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+
+from httpcache import RevalidatingCacheMiddleware
+
+
+def open_middleware(tmp_path):
+    crawler = get_crawler(Spider, {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_STORAGE': 'httpcache.SQLiteCacheStorage',
+        'HTTPCACHE_POLICY': 'httpcache.RevalidatingCachePolicy',
+        'HTTPCACHE_EXPIRATION_SECS': 3600,
+    })
+    spider = Spider.from_crawler(crawler, name='test')
+    middleware = RevalidatingCacheMiddleware.from_crawler(crawler)
+    middleware.spider_opened(spider)
+    return middleware, spider
+
+
+def test_revalidated_entry_is_fresh_again(tmp_path):
+    middleware, spider = open_middleware(tmp_path)
+    url = 'https://example.com/us/ca?page=1'
+    first = Request(url)
+    assert middleware.process_request(first, spider) is None
+    middleware.process_response(first, HtmlResponse(url, body=b'<html>1</html>', headers={'ETag': '"v1"'}), spider)
+
+    # Expire the entry, so the next hit sends a conditional request
+    middleware.storage.conn.execute('UPDATE responses SET stored_at = stored_at - 7200')
+    second = Request(url)
+    assert middleware.process_request(second, spider) is None
+    assert second.headers[b'If-None-Match'] == b'"v1"'
+    served = middleware.process_response(second, Response(url, status=304, headers={'ETag': '"v2"'}), spider)
+    assert served.body == b'<html>1</html>'
+    assert served.headers[b'ETag'] == b'"v2"'
+
+    # The 304 restarted the entry's freshness: no request goes out
+    third = Request(url)
+    cached = middleware.process_request(third, spider)
+    assert cached is not None
+    assert cached.body == b'<html>1</html>'
+    assert cached.headers[b'ETag'] == b'"v2"'
+    assert b'If-None-Match' not in third.headers
+    assert spider.crawler.stats.get_value('httpcache/hit') == 1
+    assert spider.crawler.stats.get_value('httpcache/revalidate') == 1
+    middleware.spider_closed(spider)
@@ -0,0 +1,14 @@
+from parser_pool import ParserPool
+
+
+def test_pools_are_shared_only_with_the_same_limits():
+    pool = ParserPool.open(1)
+    same = ParserPool.open(1, 2)
+    other = ParserPool.open(1, 8)
+    try:
+        assert same is pool
+        assert other is not pool
+        assert (pool.max_pending, other.max_pending) == (2, 8)
+    finally:
+        for opened in (pool, same, other):
+            opened.release()
@@ -0,0 +1,43 @@
+import json
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.fixtures import load_responses
+from parsing import NEXT_DATA_RE, SOURCE_JSON, listing_page
+
+
+def recorded_listing():
+    return next(iter(load_responses('listing')))
+
+
+def with_next_data(response, url, **changes):
+    data = json.loads(NEXT_DATA_RE.search(response.body).group(1))
+    data.update(changes)
+    blob = json.dumps(data).encode('utf-8')
+    body = NEXT_DATA_RE.sub(lambda m: m.group(0).replace(m.group(1), blob), response.body)
+    return HtmlResponse(url, body=body, encoding='utf-8')
+
+
+def detail_urls(response, use_json=True):
+    _, links, source, _ = listing_page(response, 'ca', use_json)
+    return source, [link[1] for link in links if link is not None]
+
+
+def test_json_detail_urls_match_the_rendered_links():
+    response = recorded_listing()
+    source, urls = detail_urls(response)
+    assert source == SOURCE_JSON
+    assert urls[0].startswith('https://www.procore.com/network/p/')
+    assert set(urls) <= set(detail_urls(response, use_json=False)[1])
+
+
+def test_detail_urls_ignore_a_cdn_asset_prefix():
+    response = recorded_listing()
+    moved = with_next_data(response, response.url, assetPrefix='https://cdn.example.com/network')
+    assert detail_urls(moved) == detail_urls(response)
+
+
+def test_detail_urls_follow_the_mount_path():
+    response = with_next_data(recorded_listing(), 'http://127.0.0.1:8765/us/ca?page=1')
+    _, urls = detail_urls(response)
+    assert urls[0].startswith('http://127.0.0.1:8765/p/')
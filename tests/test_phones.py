@@ -0,0 +1,71 @@
+import pytest
+
+import phones
+from phone_extractor import NOT_AVAILABLE
+from phones import PHONE_INVALID, PHONE_MISSING, PHONE_SUSPECT, PHONE_VALID, normalize_phones, parse_phone
+
+pytest.importorskip('pyarrow')
+
+VALUES = [
+    '+16502887088',
+    '+1-650-288-7088',
+    '(650) 288-7088',
+    '650.288.7088',
+    'tel:+16502887088',
+    'TEL: 650 288 7088',
+    '1 650 288 7088',
+    '650-288-7088 ext. 12',
+    '650-288-7088 x12',
+    '650-288-7088 EXTENSION 12',
+    '650-288-7088 eXtenſion 12',
+    '+44 20 7946 0958',
+    '+1 911 288 7088',
+    '(650) 555-0123',
+    '000-000-0000',
+    '+1 (111) 111-1111',
+    '650 288',
+    '',
+    '   ',
+    None,
+    NOT_AVAILABLE,
+    NOT_AVAILABLE.upper(),
+    'Call us today!',
+    '٣٤٥٦٧٨٩٠١٢',
+    '６５０２８８７０８８',
+    '650\x0b288\x0b7088',
+    '650\t288\n7088',
+    '(650)\xa0288-7088',
+    '650-288-7088 ext. ٣',
+    '+١٦٥٠٢٨٨٧٠٨٨',
+]
+
+
+def test_pyarrow_and_python_rules_agree():
+    parsed = phones.parse_phones(VALUES)
+    for value in VALUES:
+        assert parsed[value] == parse_phone(value), value
+
+
+def test_unicode_digits_are_not_a_number():
+    assert parse_phone('٣٤٥٦٧٨٩٠١٢') == ('٣٤٥٦٧٨٩٠١٢', PHONE_INVALID)
+
+
+def test_statuses():
+    numbers, statuses = normalize_phones(['(650) 288-7088', '(650) 555-0123', 'Call us today!', NOT_AVAILABLE])
+    assert numbers == ['+16502887088', '+16505550123', 'Call us today!', NOT_AVAILABLE]
+    assert statuses == [PHONE_VALID, PHONE_SUSPECT, PHONE_INVALID, PHONE_MISSING]
+
+
+def test_batch_survives_the_cache_being_cleared(monkeypatch):
+    # Another thread clearing the cache mid-batch must not lose the batch's results
+    parse_phones = phones.parse_phones
+
+    def parse_and_clear(values):
+        parsed = parse_phones(values)
+        phones._cache.clear()
+        return parsed
+
+    monkeypatch.setattr(phones, '_cache', {'(650) 288-7088': ('+16502887088', PHONE_VALID)})
+    monkeypatch.setattr(phones, 'parse_phones', parse_and_clear)
+    numbers, _ = normalize_phones(['(650) 288-7088', '650.288.7088'])
+    assert numbers == ['+16502887088', '+16502887088']
@@ -0,0 +1,204 @@
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.spidermiddlewares.httperror import HttpError
+from scrapy.utils.test import get_crawler
+from twisted.python.failure import Failure
+
+from checkpoint import CrawlJournal, journal_path, read_journal
+from dedupe import business_key
+from parsing import ListingRecord, Pagination
+from procore_spider import ProcoreSpider
+
+
+def make_spider(**settings):
+    # Spider settings take precedence over the project ones get_crawler sets
+    custom_settings = {**ProcoreSpider.custom_settings, 'PROCORE_LISTING_JSON': False, 'PROCORE_PAGE_WINDOW': 2, **settings}
+    spidercls = type('ProcoreTestSpider', (ProcoreSpider,), {'custom_settings': custom_settings})
+    return spidercls.from_crawler(get_crawler(spidercls))
+
+
+def fail(request, status=503):
+    failure = Failure(HttpError(HtmlResponse(request.url, status=status, request=request)))
+    failure.request = request
+    return list(request.errback(failure) or ())
+
+
+def test_failed_listing_page_frees_its_window_slot(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path))
+    first, second = spider.start_requests()
+    assert [first.meta['page'], second.meta['page']] == [1, 2]
+
+    refill = fail(first)
+
+    assert [request.meta['page'] for request in refill] == [3]
+    assert sorted(spider.page_scheduled) == [2, 3]
+    assert spider.crawler.stats.get_value('listing/failed') == 1
+    assert spider.crawler.stats.get_value('listing/failed/503') == 1
+    spider.journal.close()
+    checkpoint, _ = read_journal(journal_path(str(tmp_path), spider.state_code))
+    assert checkpoint.pages_failed == {1}
+    assert 1 not in checkpoint.pages_done
+
+
+def test_listing_pages_failing_in_a_row_stop_scheduling():
+    spider = make_spider(PROCORE_LISTING_FAILURE_LIMIT=3)
+    requests = list(spider.start_requests())
+    failed = []
+    while requests:
+        request = requests.pop(0)
+        failed.append(request.meta['page'])
+        requests.extend(fail(request))
+    # Page 4 was already in flight when the third failure stopped the window
+    assert failed == [1, 2, 3, 4]
+    assert not spider.page_scheduled
+
+
+def test_pages_dropped_past_the_end_are_not_failures():
+    spider = make_spider()
+    first, second = spider.start_requests()
+    spider.end.found(1, 'empty_page')
+
+    assert fail(second) == []
+    assert not spider.page_scheduled.get(2)
+    assert spider.crawler.stats.get_value('listing/failed') is None
+
+
+def closed_journal(spider, tmp_path):
+    spider.closed('finished')
+    checkpoint, _ = read_journal(journal_path(str(tmp_path), spider.state_code))
+    return checkpoint
+
+
+def test_journal_is_done_once_the_end_is_found(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path))
+    list(spider.start_requests())
+    spider.end.found(1, 'empty_page')
+    assert closed_journal(spider, tmp_path).done
+
+
+def test_journal_stays_resumable_when_page_one_failed(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path), PROCORE_LISTING_FAILURE_LIMIT=1)
+    first, second = spider.start_requests()
+    fail(first)
+    spider.end.found(1, 'empty_page')
+    fail(second)
+    checkpoint = closed_journal(spider, tmp_path)
+    assert not checkpoint.done
+    assert checkpoint.pages_failed == {1}
+
+
+def test_journal_stays_resumable_without_the_end(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path))
+    list(spider.start_requests())
+    assert not closed_journal(spider, tmp_path).done
+
+
+def test_journal_stays_resumable_with_detail_pages_pending(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path))
+    list(spider.start_requests())
+    detail = spider.detail_request(ListingRecord('https://example.com/p/acme', 'Acme', (None, None, None, None), None))
+    fail(detail)
+    spider.end.found(1, 'empty_page')
+    checkpoint = closed_journal(spider, tmp_path)
+    assert not checkpoint.done
+    assert list(checkpoint.pending) == ['https://example.com/p/acme']
+
+
+def test_missing_detail_page_is_not_pending(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path))
+    list(spider.start_requests())
+    detail = spider.detail_request(ListingRecord('https://example.com/p/acme', 'Acme', (None, None, None, None), None))
+    fail(detail, status=404)
+    spider.end.found(1, 'empty_page')
+    checkpoint = closed_journal(spider, tmp_path)
+    assert checkpoint.done
+    assert not checkpoint.pending
+
+
+def interrupted_journal(tmp_path, state_code, pages_done, last_page=None):
+    # A crawl cut short: Acme was scraped, Bolt's detail page never came back
+    acme = ListingRecord('https://example.com/p/acme', 'Acme', (None, None, None, None), None)
+    bolt = ListingRecord('https://example.com/p/bolt', 'Bolt', ('Austin, TX', None, None, None), None)
+    journal = CrawlJournal.open(str(tmp_path), state_code)
+    journal.start(0)
+    journal.detail(acme)
+    journal.detail(bolt)
+    journal.row({"Business Name": 'Acme', "Phone Number": '+14085550100'}, acme.detail_url)
+    for page in pages_done:
+        journal.page(page)
+    if last_page is not None:
+        journal.last_page(last_page)
+    journal.close()
+    return acme, bolt
+
+
+def test_resume_skips_done_pages_and_replays_the_journal(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path), PROCORE_RESUME=True)
+    acme, bolt = interrupted_journal(tmp_path, spider.state_code, pages_done=[1, 3])
+
+    replay, detail, *listings = spider.start_requests()
+
+    assert [request.meta['page'] for request in listings] == [2, 4]
+    assert detail.url == bolt.detail_url
+    assert detail.cb_kwargs['listing'].classification[0] == 'Austin, TX'
+    assert spider.pending_details == {bolt.detail_url}
+    assert replay.url == 'data:,'
+    assert [row["Business Name"] for row in replay.callback(HtmlResponse(replay.url, body=b''))] == ['Acme']
+    assert business_key(acme.detail_url, 'Acme') in spider.seen_businesses
+    assert business_key(bolt.detail_url, 'Bolt') in spider.seen_businesses
+    assert spider.crawler.stats.get_value('checkpoint/replayed_rows') == 1
+
+
+def test_resumed_journal_keeps_appending(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path), PROCORE_RESUME=True)
+    acme, bolt = interrupted_journal(tmp_path, spider.state_code, pages_done=[1, 2], last_page=2)
+    [detail] = [request for request in spider.start_requests() if request.url == bolt.detail_url]
+    list(spider.handle_detail(HtmlResponse(detail.url, body=b''), ('+15125550100', 'script', {}), **detail.cb_kwargs))
+
+    checkpoint = closed_journal(spider, tmp_path)
+
+    assert checkpoint.done
+    assert [row["Business Name"] for row in checkpoint.rows] == ['Acme', 'Bolt']
+    assert not checkpoint.pending
+
+
+def test_stopped_crawl_is_not_done(tmp_path):
+    spider = make_spider(PROCORE_CHECKPOINT_DIR=str(tmp_path), PROCORE_RESUME=True)
+    interrupted_journal(tmp_path, spider.state_code, pages_done=[1, 2], last_page=2)
+    list(spider.start_requests())
+    spider.pending_details.clear()
+    spider.stop_requested = True
+
+    checkpoint = closed_journal(spider, tmp_path)
+
+    assert not checkpoint.done
+    assert checkpoint.pages_done == {1, 2}
+
+
+def listing_response(spider, page=1):
+    url = spider.base_url + str(page)
+    return HtmlResponse(url, body=b'', request=Request(url, meta={'page': page}))
+
+
+def json_listing(*links):
+    return [[index] for index in range(len(links))], list(links), 'json', Pagination(len(links), None, 20)
+
+
+def test_json_phone_wins_over_the_index(tmp_path):
+    url = 'https://www.procore.com/network/p/acme'
+    classification = ('San Jose, CA', 'General Contractor', None, None)
+    index_path = str(tmp_path / 'index.sqlite3')
+    old = make_spider(PROCORE_INDEX_PATH=index_path)
+    list(old.start_requests())
+    old_rows = list(old.handle_listing(listing_response(old), json_listing(('Acme', url, classification, '+14085550100')), 0))
+    old.closed('finished')
+    assert old_rows[0]["Phone Number"] == '+14085550100'
+
+    spider = make_spider(PROCORE_INDEX_PATH=index_path)
+    list(spider.start_requests())
+    listing = json_listing(('Acme', url, classification, '+14082887088'))
+    rows = [row for row in spider.handle_listing(listing_response(spider), listing, 0) if isinstance(row, dict)]
+    spider.closed('finished')
+
+    assert [row["Phone Number"] for row in rows] == ['+14082887088']
+    assert spider.crawler.stats.get_value('index/reused') is None
@@ -0,0 +1,40 @@
+from scrapy.crawler import Crawler
+
+from procore_spider import ProcoreSpider
+from scheduler import StateCrawlScheduler
+
+
+def test_partitions_split_the_shared_store_per_state():
+    scheduler = StateCrawlScheduler(runner=None)
+    scheduler.crawlers = dict.fromkeys(['ny', 'ca', 'tx'])
+    for name, state in [('Acme', 'CA'), ('Bolt', 'NY'), ('Crane', 'CA')]:
+        scheduler.results.append({"Business Name": name}, {"State": state})
+
+    partitions = scheduler.partitions()
+
+    assert list(partitions) == ['ny', 'ca', 'tx']
+    assert list(partitions['ca']["Business Name"]) == ['Acme', 'Crane']
+    assert list(partitions['ny']["Business Name"]) == ['Bolt']
+    assert partitions['tx'].empty
+
+
+def test_progress_skips_crawlers_without_stats():
+    scheduler = StateCrawlScheduler(runner=None)
+    crawler = Crawler(ProcoreSpider)
+    assert crawler.stats is None
+    scheduler.crawlers = {'ca': crawler}
+
+    progress = scheduler.progress()
+
+    assert progress['items'] == 0
+    assert progress['requests'] == 0
+
+
+def test_instrumentation_skips_crawlers_without_stats():
+    scheduler = StateCrawlScheduler(runner=None)
+    scheduler.crawlers = {'ca': Crawler(ProcoreSpider)}
+
+    figures = scheduler.instrumentation()
+
+    assert figures['callbacks'] == {}
+    assert figures['depth'] == {}
@@ -0,0 +1,121 @@
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest
+from scrapy.utils.test import get_crawler
+
+from middlewares import ListingCutoffMiddleware
+from parsing import Pagination
+from procore_spider import ProcoreSpider
+from termination import END_EMPTY_PAGE, END_REPEATED_PAGE, END_SHORT_PAGE, ListingEnd, page_fingerprint
+
+PAGE_SIZE = 10
+
+
+def links(page, count=PAGE_SIZE):
+    return [(f'Business {page}-{i}', f'https://example.com/p/b-{page}-{i}', (None,) * 4, None) for i in range(count)]
+
+
+def test_short_page_is_the_last():
+    end = ListingEnd()
+    assert not end.observe(1, links(1), Pagination(PAGE_SIZE, None, PAGE_SIZE))
+    assert not end.observe(2, links(2, 4), Pagination(4, None, PAGE_SIZE))
+    assert (end.last_page, end.reason) == (2, END_SHORT_PAGE)
+    assert end.past_end(3) and not end.can_schedule(3)
+
+
+def test_empty_page_follows_the_last():
+    end = ListingEnd()
+    assert not end.observe(1, links(1))
+    assert end.observe(2, [])
+    assert (end.last_page, end.reason) == (1, END_EMPTY_PAGE)
+
+
+def test_repeated_page_is_past_the_end():
+    end = ListingEnd()
+    end.observe(1, links(1))
+    end.observe(2, links(2))
+    assert end.observe(3, links(2))
+    assert (end.last_page, end.reason) == (2, END_REPEATED_PAGE)
+
+
+def test_repeated_page_arriving_first_still_ends_at_the_earlier():
+    end = ListingEnd()
+    end.observe(3, links(2))
+    end.observe(2, links(2))
+    assert end.last_page == 2
+
+
+def test_fingerprint_ignores_empty_links():
+    assert page_fingerprint(links(1) + [None]) == page_fingerprint(links(1))
+    assert page_fingerprint(links(1)) != page_fingerprint(links(2))
+
+
+def test_count_bounds_scheduling():
+    end = ListingEnd()
+    end.observe(1, links(1), Pagination(PAGE_SIZE, 25, PAGE_SIZE))
+    assert end.count_pages == 3
+    assert end.can_schedule(3) and not end.can_schedule(4)
+    # Another page reports a larger total; the largest is used
+    end.observe(2, links(2), Pagination(PAGE_SIZE, 31, PAGE_SIZE))
+    assert end.count_pages == 4
+
+
+def test_full_page_where_the_count_ends_is_probed():
+    end = ListingEnd()
+    end.observe(1, links(1), Pagination(PAGE_SIZE, 20, PAGE_SIZE))
+    end.observe(2, links(2), Pagination(PAGE_SIZE, 20, PAGE_SIZE))
+    assert end.last_page is None
+    assert end.can_schedule(3) and not end.can_schedule(4)
+    # An accurate count: the probe comes back empty
+    assert end.observe(3, [], Pagination(0, 20, PAGE_SIZE))
+    assert (end.last_page, end.reason) == (2, END_EMPTY_PAGE)
+
+
+def test_stale_count_stops_bounding_the_window():
+    end = ListingEnd()
+    end.observe(1, links(1), Pagination(PAGE_SIZE, 20, PAGE_SIZE))
+    end.observe(2, links(2), Pagination(PAGE_SIZE, 20, PAGE_SIZE))
+    end.observe(3, links(3), Pagination(PAGE_SIZE, 20, PAGE_SIZE))
+    assert end.count_stale
+    assert all(end.can_schedule(page) for page in range(4, 20))
+    end.observe(7, links(7, 3), Pagination(3, 20, PAGE_SIZE))
+    assert (end.last_page, end.reason) == (7, END_SHORT_PAGE)
+
+
+def test_wasted_counts_downloads_past_the_end():
+    end = ListingEnd()
+    end.downloaded.update({1, 2, 3, 4})
+    end.found(2, END_EMPTY_PAGE)
+    assert end.wasted() == 2
+
+
+def test_resumed_end_only_moves_earlier():
+    end = ListingEnd(5)
+    end.found(7, END_EMPTY_PAGE)
+    assert end.last_page == 5
+    end.found(4, END_SHORT_PAGE)
+    assert (end.last_page, end.reason) == (4, END_SHORT_PAGE)
+
+
+def cutoff_middleware():
+    crawler = get_crawler(ProcoreSpider)
+    crawler.spider = ProcoreSpider.from_crawler(crawler)
+    return ListingCutoffMiddleware.from_crawler(crawler), crawler.spider
+
+
+def test_cutoff_drops_listing_pages_past_the_end():
+    middleware, spider = cutoff_middleware()
+    spider.end.found(3, END_EMPTY_PAGE)
+    assert middleware.process_request(Request('https://example.com/us/ca?page=3', meta={'page': 3})) is None
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request('https://example.com/us/ca?page=4', meta={'page': 4}))
+    assert middleware.process_request(Request('https://example.com/p/acme')) is None
+    assert spider.crawler.stats.get_value('pagination/cancelled') == 1
+
+
+def test_cutoff_drops_every_queued_request_once_stopping():
+    middleware, spider = cutoff_middleware()
+    spider.stop_requested = True
+    with pytest.raises(IgnoreRequest):
+        middleware.process_request(Request('https://example.com/p/acme'))
+    assert spider.crawler.stats.get_value('termination/dropped') == 1